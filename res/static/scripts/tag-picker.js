@@ -1,7 +1,7 @@
 class TagPicker extends HTMLInputElement {
 
-    tags = [];
-    tag_names = [];
+    suggestion_count = 20;
+    request_id = 0;
     selection_index = -1;
     max_selection_index = -1;
     previous_picker_value = null;
@@ -19,21 +19,17 @@ class TagPicker extends HTMLInputElement {
         this.addEventListener("keydown", this.handle_arrow_keys.bind(this));
         this.addEventListener("keydown", this.handle_enter.bind(this));
         this.addEventListener("focusout", this.hide_list.bind(this));
-
-        this.update_tag_list();
     }
 
-    async update_tag_list() {
-        const list = await fetch("/api/tags/list");
-        const result = await list.json();
+    async fetch_suggestions(partial_tag) {
+        const params = new URLSearchParams({prefix: partial_tag, count: this.suggestion_count});
+        const response = await fetch(`/api/tags/autocomplete?${params}`);
+        const result = await response.json();
         if(result['result'] == "success") {
-            this.tags = result['detail'];
-            this.tag_names = this.tags.map((tag_object) => tag_object.name);
-            console.log(this.tag_names);
-            console.log(this.tags);
-        } else {
-            console.error("Failed to update tag list", result);
+            return result['detail'];
         }
+        console.error("Failed to fetch tag suggestions", result);
+        return [];
     }
 
     connectedCallback() {
@@ -43,21 +39,29 @@ class TagPicker extends HTMLInputElement {
     hide_list() { this.list_elem.style.display = "none"; }
     show_list() { this.list_elem.style.display = "block"; }
 
-    update() {
+    async update() {
         if(this.previous_picker_value == this.value) {
             return;
         }
 
         this.previous_picker_value = this.value;
-        this.selection_index = -1;
-        this.max_selection_index = -1;
 
         const tokenized = new TokenizedString(this.value, this.selectionStart);
-        const partial_tag = tokenized.active_token();
+        // Excluded tags are written with a leading `-`
+        const partial_tag = (tokenized.active_token() ?? "").replace(/^-/, "");
 
+        // Responses can arrive out of order, only the newest one is displayed
+        const request_id = ++this.request_id;
+        const tags = await this.fetch_suggestions(partial_tag);
+        if(request_id != this.request_id) {
+            return;
+        }
+
+        this.selection_index = -1;
+        this.max_selection_index = -1;
         this.list_elem.innerHTML = "";
-        this.tags.forEach((tag) => {
-            if(tag.name.includes(partial_tag) && !tokenized.tokens.includes(tag.name)) {
+        tags.forEach((tag) => {
+            if(!tokenized.tokens.includes(tag.name)) {
                 const elem = document.createElement("div");
                 elem.className = "tag";
                 elem.setAttribute("tagName", tag.name);
@@ -79,13 +83,13 @@ class TagPicker extends HTMLInputElement {
 
             }
         })
-        console.log(this.max_selection_index);
         this.max_selection_index >= 0 ? this.show_list() : this.hide_list();
     }
 
     apply_suggestion(tag) {
         const tokenized = new TokenizedString(this.value, this.selectionStart);
-        tokenized.replace_active_token(tag);
+        const prefix = (tokenized.active_token() ?? "").startsWith("-") ? "-" : "";
+        tokenized.replace_active_token(prefix + tag);
         this.value = tokenized.toString();
     }
 
@@ -0,0 +1,17 @@
+"""
+ASGI entry point, for serving many concurrent media downloads from one process. Run from the `src`
+directory, for example with uvicorn:
+
+    uvicorn asgi:app --workers 2
+
+Media downloads, previews and mime icons are streamed without holding a thread for each client,
+see `server.asgi.AsgiApp`, and every other request is handled by the Flask application on a
+bounded thread pool. Each worker process runs this module itself, but only one worker at a time
+makes scheduled backups, see `server.handle.DatabaseHandle`.
+"""
+from server import DATABASE_KEY, create_app
+from server.asgi import AsgiApp
+
+flask_app = create_app()
+flask_app.extensions[DATABASE_KEY].prepare()
+app = AsgiApp(flask_app)
@@ -0,0 +1,230 @@
+"""
+Benchmark command line interface. Run from the `src` directory:
+
+    python -m bench generate catalog.zip --entries 100000
+    python -m bench run --entries 10000 --output results.json
+    python -m bench run --catalog catalog.zip --compare results.json
+    python -m bench replay trace.jsonl --catalog catalog.zip --concurrency 16
+    python -m bench replay trace.jsonl --url http://localhost:5000 --pacing open --speed 2
+"""
+from .generator import DEFAULT_OPTIONS, CatalogOptions, generate_catalog
+from .replay import ClientTarget, HttpTarget, format_report, load_trace, replay, summarize
+from .suite import GROUPS, Result, Suite, compare, eager_imports
+from contextlib import redirect_stdout
+from pathlib import Path
+from server import create_app, get_db_internal
+from typing import Any
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+FORMAT_VERSION = 1
+
+
+def catalog_options(args: argparse.Namespace) -> CatalogOptions:
+    return {
+        'entries': args.entries,
+        'tags': args.tags,
+        'seed': args.seed,
+        'zipf': args.zipf,
+        'tags_per_entry': args.tags_per_entry,
+        'child_fraction': args.child_fraction,
+        'described_fraction': DEFAULT_OPTIONS['described_fraction']
+    }
+
+
+def commit_id() -> str | None:
+    try:
+        result = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=Path(__file__).parent)
+    except OSError:
+        return None
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def start_server(directory: str, catalog: str | None = None, database: str | None = None):
+    """
+    Create the application with a throwaway database in `directory`, loaded from a catalog archive
+    or copied from an existing database so that the original is never modified.
+    """
+    path = os.path.join(directory, "local.db")
+    if database:
+        shutil.copyfile(database, path)
+    # Backups are pointless for a throwaway database
+    app = create_app({'databaseFile': path, 'backup': {'interval': 0}, 'trace': {'file': ""}})
+    if catalog:
+        db = get_db_internal(app)
+        counts, import_time = db.import_catalog(catalog)
+        db.release()
+        print(f"Imported {counts['entries']:,} entries and {counts['tags']:,} tags in "
+              f"{import_time:0.3f}s", file=sys.stderr)
+    return app
+
+
+def write_report(report: dict[str, Any], output: str | None):
+    if output:
+        with open(output, 'w') as file:
+            json.dump(report, file, indent=4)
+    else:
+        json.dump(report, sys.stdout, indent=4)
+        print()
+
+
+def generate(args: argparse.Namespace):
+    started = time.perf_counter()
+    counts = generate_catalog(args.path, catalog_options(args))
+    print(f"Generated {counts['entries']:,} entries and {counts['tags']:,} tags in "
+          f"{time.perf_counter() - started:0.3f}s")
+
+
+def run(args: argparse.Namespace):
+    groups = tuple(args.groups.split(',')) if args.groups else GROUPS
+    for group in groups:
+        if group not in GROUPS:
+            sys.exit(f"Unknown benchmark group {group}, expected one of {', '.join(GROUPS)}")
+    catalog: dict[str, Any] = {'path': args.catalog} if args.catalog else \
+        dict(catalog_options(args))
+    baseline: dict[str, Result] | None = None
+    if args.compare:
+        with open(args.compare) as file:
+            previous = json.load(file)
+        if previous['catalog'] != catalog:
+            print("Warning: The baseline was run against a different catalog", file=sys.stderr)
+        baseline = previous['results']
+
+    with tempfile.TemporaryDirectory(prefix="library-bench-") as directory:
+        output = os.path.abspath(args.output) if args.output else None
+        if args.catalog:
+            catalog_path = os.path.abspath(args.catalog)
+        else:
+            catalog_path = os.path.join(directory, "catalog.zip")
+            print("Generating catalog", file=sys.stderr)
+            generate_catalog(catalog_path, catalog_options(args))
+        app = start_server(directory, catalog_path)
+        db = get_db_internal(app)
+
+        def progress(name: str, result: Result):
+            print(f"{name:<40} median {result['median'] * 1000:>10.3f}ms  "
+                  f"p95 {result['p95'] * 1000:>10.3f}ms", file=sys.stderr)
+
+        suite = Suite(db, app.test_client(), args.repeat)
+        # Keep debugging output from the application out of the report
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            results = suite.run(groups, progress)
+    eager = eager_imports() if 'startup' in groups else None
+    if eager:
+        print(f"Warning: Importing the server also imports {', '.join(eager)}", file=sys.stderr)
+
+    report = {
+        'version': FORMAT_VERSION,
+        'date': int(time.time()),
+        'commit': commit_id(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'catalog': catalog,
+        'repeat': args.repeat,
+        'results': results,
+        'eager_imports': eager
+    }
+    write_report(report, output)
+    if baseline is not None:
+        print(f"{'benchmark':<40} {'baseline':>12} {'current':>12} {'change':>8}", file=sys.stderr)
+        for line in compare(baseline, results, args.threshold):
+            print(line, file=sys.stderr)
+
+
+def replay_trace(args: argparse.Namespace):
+    trace = load_trace(args.trace, args.limit)
+    trace_path = os.path.abspath(args.trace)
+    output = os.path.abspath(args.output) if args.output else None
+    with tempfile.TemporaryDirectory(prefix="library-replay-") as directory:
+        if args.url:
+            target = HttpTarget(args.url)
+        elif args.catalog or args.database:
+            catalog = os.path.abspath(args.catalog) if args.catalog else None
+            database = os.path.abspath(args.database) if args.database else None
+            target = ClientTarget(start_server(directory, catalog, database))
+        else:
+            sys.exit("One of --url, --catalog or --database is required")
+        print(f"Replaying {len(trace):,} requests", file=sys.stderr)
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            samples, elapsed = replay(trace, target, args.concurrency, args.pacing, args.speed,
+                                      args.rate)
+    report = summarize(samples, elapsed)
+    for line in format_report(report):
+        print(line, file=sys.stderr)
+    write_report({
+        'version': FORMAT_VERSION,
+        'date': int(time.time()),
+        'commit': commit_id(),
+        'trace': trace_path,
+        'target': args.url or 'wsgi',
+        'concurrency': args.concurrency,
+        'pacing': args.pacing,
+        'speed': args.speed,
+        'rate': args.rate,
+        'elapsed': elapsed,
+        'routes': report
+    }, output)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m bench",
+                                     description="Generate catalogs and run benchmarks.")
+    commands = parser.add_subparsers(required=True)
+
+    def add_catalog_options(command: argparse.ArgumentParser):
+        command.add_argument("--entries", type=int, default=DEFAULT_OPTIONS['entries'])
+        command.add_argument("--tags", type=int, default=DEFAULT_OPTIONS['tags'])
+        command.add_argument("--seed", type=int, default=DEFAULT_OPTIONS['seed'])
+        command.add_argument("--zipf", type=float, default=DEFAULT_OPTIONS['zipf'],
+                             help="Zipf exponent of tag usage.")
+        command.add_argument("--tags-per-entry", type=float,
+                             default=DEFAULT_OPTIONS['tags_per_entry'])
+        command.add_argument("--child-fraction", type=float,
+                             default=DEFAULT_OPTIONS['child_fraction'])
+
+    command = commands.add_parser("generate", help="Generate a catalog archive.")
+    command.add_argument("path", help="Archive to create.")
+    add_catalog_options(command)
+    command.set_defaults(function=generate)
+
+    command = commands.add_parser("run", help="Run the benchmark suite in a temporary database.")
+    command.add_argument("--catalog", help="Archive to load instead of generating a catalog.")
+    add_catalog_options(command)
+    command.add_argument("--repeat", type=int, default=5, help="Timed runs of each benchmark.")
+    command.add_argument("--groups", help=f"Comma separated groups to run ({', '.join(GROUPS)}).")
+    command.add_argument("--output", help="Write results to a file instead of standard output.")
+    command.add_argument("--compare", help="Compare against the results of an earlier run.")
+    command.add_argument("--threshold", type=float, default=0.1,
+                         help="Relative change in median time reported as a regression.")
+    command.set_defaults(function=run)
+
+    command = commands.add_parser("replay", help="Replay a recorded request trace.")
+    command.add_argument("trace", help="Trace file recorded with the `trace.file` option.")
+    command.add_argument("--url", help="Send requests to a running server at this address.")
+    command.add_argument("--catalog", help="Replay in-process against this catalog archive.")
+    command.add_argument("--database", help="Replay in-process against a copy of this database.")
+    command.add_argument("--concurrency", type=int, default=8, help="Requests in flight at once.")
+    command.add_argument("--pacing", choices=['closed', 'open'], default='closed',
+                         help="Send requests as workers become free (closed) or on schedule "
+                         "(open).")
+    command.add_argument("--speed", type=float, default=1.0,
+                         help="Open loop: replay the recorded timing this many times faster.")
+    command.add_argument("--rate", type=float,
+                         help="Open loop: send this many requests per second instead.")
+    command.add_argument("--limit", type=int, help="Replay at most this many requests.")
+    command.add_argument("--output", help="Write the report to a file instead of standard output.")
+    command.set_defaults(function=replay_trace)
+
+    args = parser.parse_args()
+    args.function(args)
+
+
+main()
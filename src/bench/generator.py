@@ -0,0 +1,186 @@
+from database.archive import Columns, write_catalog
+from typing import Any, Iterator
+from typing_extensions import TypedDict
+from util import mime
+import numpy as np
+
+# Fixed reference time (2024-01-01 UTC) so generated catalogs don't depend on when they're made
+REFERENCE_TIME = 1704067200
+EARLIEST_TIME = -2208988800  # 1900-01-01 UTC
+
+YEAR = 365 * 24 * 60 * 60
+
+# Time zone offsets in seconds, and how often each is used
+TIMEZONES = np.array([0, -8, -7, -6, -5, 1, 2, 9, 10]) * 3600
+TIMEZONE_WEIGHTS = np.array([30, 25, 5, 10, 15, 8, 3, 2, 2], np.float64)
+
+# Media types (with file extension and typical size in bytes), and how often each is used
+MEDIA_TYPES = [("image/jpeg", "jpg", 3e6), ("image/png", "png", 1e6),
+               ("application/pdf", "pdf", 5e5), ("video/mp4", "mp4", 1e8),
+               ("audio/mpeg", "mp3", 5e6), ("text/plain", "txt", 5e3)]
+MEDIA_WEIGHTS = np.array([60, 10, 15, 5, 5, 5], np.float64)
+
+# Tag ids are stored as uint16 and start at 1
+MAX_TAGS = 65535
+
+WORDS = [
+    "family", "holiday", "portrait", "landscape", "letter", "receipt", "school", "wedding",
+    "garden", "city", "beach", "mountain", "river", "snow", "birthday", "concert", "museum",
+    "train", "car", "boat", "dog", "cat", "house", "kitchen", "church", "market", "harbor",
+    "forest", "bridge", "festival", "newspaper", "postcard", "map", "diary", "recipe", "invoice",
+    "sketch", "painting", "sunset", "winter"
+]
+PREFIXES = ["", "person_", "place_", "event_", "source_"]
+
+
+class CatalogOptions(TypedDict):
+    """
+    Parameters for a generated catalog. The same options always generate the same catalog.
+
+    :param entries: Number of entries.
+    :param tags: Number of distinct tags. At most 65535.
+    :param seed: Random number generator seed.
+    :param zipf: Exponent of the Zipf distribution tag usage follows. Larger values concentrate
+        usage on fewer tags.
+    :param tags_per_entry: Mean number of tags on each entry.
+    :param child_fraction: Fraction of entries which are children of an earlier entry.
+    :param described_fraction: Fraction of entries with a description.
+    """
+    entries: int
+    tags: int
+    seed: int
+    zipf: float
+    tags_per_entry: float
+    child_fraction: float
+    described_fraction: float
+
+
+DEFAULT_OPTIONS: CatalogOptions = {
+    'entries': 10000,
+    'tags': 2000,
+    'seed': 0,
+    'zipf': 1.1,
+    'tags_per_entry': 6.0,
+    'child_fraction': 0.2,
+    'described_fraction': 0.3
+}
+
+
+def generate_catalog(path: str, options: CatalogOptions, chunk_size: int = 10000):
+    """
+    Generate a realistic catalog and write it to an archive which can be loaded with
+    `Database.import_catalog`.
+
+    Tag usage follows a Zipf distribution, so a handful of tags appear on a large share of entries
+    while most are rare. Creation dates lean towards recent years and are spread across several time
+    zones, entries are digitized some time after they were created, and a fraction of entries are
+    children of a nearby earlier entry, forming shallow trees similar to albums and scanned
+    documents. Entries refer to media files which don't exist, but their size and type are filled
+    in so that they are never looked up.
+
+    :param path: Path of the archive to create.
+    :param options: Catalog parameters.
+    :param chunk_size: Number of entries generated and written at a time.
+    :returns: A map of table name to number of rows written.
+    """
+    if not 0 < options['tags'] <= MAX_TAGS:
+        raise ValueError(f"Number of tags must be between 1 and {MAX_TAGS}")
+    rng = np.random.default_rng(options['seed'])
+    offsets, tag_ids = __assign_tags(rng, options)
+    tag_counts = np.bincount(tag_ids, minlength=options['tags'] + 1)
+    return write_catalog(path, {
+        'tags': __tags(options['tags'], tag_counts, chunk_size),
+        'entries': __entries(rng, options, offsets, tag_ids, chunk_size)
+    })
+
+
+def __assign_tags(rng: np.random.Generator, options: CatalogOptions):
+    """
+    Pick the tags on every entry.
+
+    :returns: Offsets into the tag array for each entry, and the sorted tag ids of every entry.
+    """
+    entries, tags = options['entries'], options['tags']
+    # Popularity rank is independent of tag id, so popular tags aren't clustered by name
+    weights = 1.0 / np.arange(1, tags + 1, dtype=np.float64) ** options['zipf']
+    weights = weights[rng.permutation(tags)]
+    weights /= weights.sum()
+    sizes = np.minimum(rng.poisson(options['tags_per_entry'], entries), 40)
+    owners = np.repeat(np.arange(entries, dtype=np.int64), sizes)
+    drawn = rng.choice(tags, len(owners), p=weights) + 1
+    # Remove tags drawn twice for the same entry, which also sorts each entry's tags
+    keys = np.unique(owners * (tags + 1) + drawn)
+    owners, tag_ids = keys // (tags + 1), keys % (tags + 1)
+    offsets = np.zeros(entries + 1, np.int64)
+    np.cumsum(np.bincount(owners, minlength=entries), out=offsets[1:])
+    return offsets, tag_ids.astype(np.uint16)
+
+
+def __tag_name(index: int):
+    word = WORDS[index % len(WORDS)]
+    prefix = PREFIXES[(index // len(WORDS)) % len(PREFIXES)]
+    series = index // (len(WORDS) * len(PREFIXES))
+    return f"{prefix}{word}" if series == 0 else f"{prefix}{word}_{series}"
+
+
+def __tags(count: int, tag_counts: np.ndarray[Any, Any], chunk_size: int) -> Iterator[Columns]:
+    for start in range(1, count + 1, chunk_size):
+        ids = list(range(start, min(start + chunk_size, count + 1)))
+        yield {
+            'id': ids,
+            'name': [__tag_name(id - 1) for id in ids],
+            'count': tag_counts[ids].tolist()
+        }
+
+
+def __entries(rng: np.random.Generator, options: CatalogOptions, offsets: np.ndarray[Any, Any],
+              tag_ids: np.ndarray[Any, Any], chunk_size: int) -> Iterator[Columns]:
+    packed = tag_ids.tobytes()
+    width = tag_ids.itemsize
+    timezone_weights = TIMEZONE_WEIGHTS / TIMEZONE_WEIGHTS.sum()
+    media_weights = MEDIA_WEIGHTS / MEDIA_WEIGHTS.sum()
+    icons = [mime.find_icon_name(x) for x, _, _ in MEDIA_TYPES]
+    for start in range(0, options['entries'], chunk_size):
+        count = min(chunk_size, options['entries'] - start)
+        ids = np.arange(start + 1, start + count + 1, dtype=np.int64)
+        # Most material is recent, with a long tail back to 1900
+        created = EARLIEST_TIME + (REFERENCE_TIME - EARLIEST_TIME) * rng.beta(5, 1.5, count)
+        created = created.astype(np.int64)
+        digitized = np.minimum(created + (rng.exponential(5, count) * YEAR).astype(np.int64),
+                               REFERENCE_TIME)
+        indexed = REFERENCE_TIME - rng.integers(0, 5 * YEAR, count)
+        modified = np.minimum(indexed + rng.integers(0, YEAR, count), REFERENCE_TIME)
+        created_tz = rng.choice(TIMEZONES, count, p=timezone_weights)
+        digitized_tz = rng.choice(TIMEZONES, count, p=timezone_weights)
+        # Children are attached to a nearby earlier entry, like the pages of an album
+        is_child = (rng.random(count) < options['child_fraction']) & (ids > 1)
+        parents = np.maximum(ids - rng.geometric(0.05, count), 1)
+        described = rng.random(count) < options['described_fraction']
+        words = rng.integers(0, len(WORDS), (count, 3))
+        located = rng.random(count) < 0.5
+        media = rng.choice(len(MEDIA_TYPES), count, p=media_weights).tolist()
+        sizes = rng.lognormal(0, 1, count).tolist()
+        yield {
+            'id': ids.tolist(),
+            'item_name': [f"{WORDS[w[0]].capitalize()} {id}" for w, id in
+                          zip(words.tolist(), ids.tolist())],
+            'storage_id': [f"bench/{id // 1000:04d}/{id:07d}.{MEDIA_TYPES[m][1]}"
+                           for id, m in zip(ids.tolist(), media)],
+            'tags': [packed[offsets[i] * width:offsets[i + 1] * width]
+                     for i in range(start, start + count)],
+            'description': [f"A {WORDS[w[1]]} from the {WORDS[w[2]]} collection." if d else None
+                            for w, d in zip(words.tolist(), described.tolist())],
+            'transcription': [None] * count,
+            'date_created': created.tolist(),
+            'date_created_tz': created_tz.tolist(),
+            'date_digitized': digitized.tolist(),
+            'date_digitized_tz': digitized_tz.tolist(),
+            'date_indexed': indexed.tolist(),
+            'date_modified': modified.tolist(),
+            'location': [WORDS[w[2]].capitalize() if x else None
+                         for w, x in zip(words.tolist(), located.tolist())],
+            'mime_type': [MEDIA_TYPES[m][0] for m in media],
+            'mime_icon': [icons[m] for m in media],
+            'size': [max(1, int(MEDIA_TYPES[m][2] * x)) for m, x in zip(media, sizes)],
+            'parent': [p if c else None for p, c in zip(parents.tolist(), is_child.tolist())]
+        }
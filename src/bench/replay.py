@@ -0,0 +1,228 @@
+from flask import Flask
+from http.client import HTTPConnection
+from queue import Queue
+from threading import Thread, local
+from typing import Iterator, Literal
+from typing_extensions import NotRequired, TypedDict
+from urllib.parse import urlencode, urlsplit
+import json
+import math
+import time
+
+Pacing = Literal['closed', 'open']
+
+
+class TraceRequest(TypedDict):
+    """
+    One request in a trace, as written by `server.trace.TraceRecorder`.
+
+    :param time: Unix time at which the request was made.
+    :param args: Query arguments.
+    :param body: JSON request body.
+    """
+    time: float
+    method: str
+    path: str
+    args: dict[str, str]
+    body: NotRequired[str]
+
+
+class RouteReport(TypedDict):
+    """
+    Replay results for one path. Latencies are in seconds.
+
+    :param throughput: Completed requests per second over the whole replay.
+    :param errors: Number of requests which failed or returned a status of 500 or above.
+    """
+    requests: int
+    errors: int
+    throughput: float
+    p50: float
+    p95: float
+    p99: float
+    max: float
+
+
+def load_trace(path: str, limit: int | None = None) -> list[TraceRequest]:
+    """
+    Read a trace file, ordered by the time each request was made.
+
+    :param path: Trace file.
+    :param limit: Maximum number of requests to read.
+    """
+    requests: list[TraceRequest] = []
+    with open(path) as file:
+        for line in file:
+            if line.strip():
+                requests.append(json.loads(line))
+            if limit is not None and len(requests) >= limit:
+                break
+    requests.sort(key=lambda x: x['time'])
+    return requests
+
+
+class ClientTarget:
+    """Sends requests to an application in this process through the WSGI test client."""
+
+    def __init__(self, app: Flask):
+        self.__app = app
+        self.__local = local()
+
+    def send(self, request: TraceRequest) -> int:
+        # Test clients keep cookies and are not shared between threads
+        if not hasattr(self.__local, 'client'):
+            self.__local.client = self.__app.test_client()
+        response = self.__local.client.open(
+            request['path'], method=request['method'], query_string=request['args'],
+            data=request.get('body'),
+            content_type='application/json' if 'body' in request else None)
+        response.close()
+        return response.status_code
+
+
+class HttpTarget:
+    """Sends requests to a running server, keeping one connection open per thread."""
+
+    def __init__(self, url: str):
+        parts = urlsplit(url)
+        self.__host = parts.hostname or 'localhost'
+        self.__port = parts.port or 80
+        self.__prefix = parts.path.rstrip('/')
+        self.__local = local()
+
+    def send(self, request: TraceRequest) -> int:
+        url = self.__prefix + request['path']
+        if request['args']:
+            url += '?' + urlencode(request['args'])
+        body = request.get('body')
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        try:
+            return self.__request(request['method'], url, body, headers)
+        except (ConnectionError, OSError):
+            # The server may have closed an idle connection, retry once on a new one
+            self.__local.connection.close()
+            del self.__local.connection
+            return self.__request(request['method'], url, body, headers)
+
+    def __request(self, method: str, url: str, body: str | None, headers: dict[str, str]):
+        if not hasattr(self.__local, 'connection'):
+            self.__local.connection = HTTPConnection(self.__host, self.__port, timeout=60)
+        self.__local.connection.request(method, url, body, headers)
+        response = self.__local.connection.getresponse()
+        response.read()
+        return response.status
+
+
+Target = ClientTarget | HttpTarget
+
+# (path, latency in seconds, status or 0 if the request failed)
+Sample = tuple[str, float, int]
+
+
+def replay(trace: list[TraceRequest], target: Target, concurrency: int = 8,
+           pacing: Pacing = 'closed', speed: float = 1.0,
+           rate: float | None = None) -> tuple[list[Sample], float]:
+    """
+    Replay a trace against a target.
+
+    With closed loop pacing each of the `concurrency` workers sends its next request as soon as the
+    previous one completes, which measures the maximum throughput. With open loop pacing requests
+    are sent at the times they were recorded (divided by `speed`) or at a fixed `rate` per second,
+    no matter how long earlier requests take. Latency is then measured from when each request was
+    due rather than when a worker became free, so time spent queueing behind slow requests is
+    included, as it would be for real users.
+
+    :param trace: Requests to send.
+    :param target: Where to send the requests.
+    :param concurrency: Number of requests in flight at once.
+    :param pacing: `closed` or `open`.
+    :param speed: Open loop only, replay the recorded timing this many times faster.
+    :param rate: Open loop only, send this many requests per second instead of using the recorded
+        timing.
+    :returns: A sample for each request and the total time taken.
+    """
+    queue: Queue[tuple[TraceRequest, float | None] | None] = Queue()
+    samples: list[Sample] = []
+
+    def worker():
+        while (item := queue.get()) is not None:
+            request, due = item
+            start = time.perf_counter()
+            try:
+                status = target.send(request)
+            except Exception:
+                status = 0
+            end = time.perf_counter()
+            # list.append is atomic, no lock required
+            samples.append((request['path'], end - (due if due is not None else start), status))
+
+    workers = [Thread(target=worker, daemon=True) for _ in range(max(1, concurrency))]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for request, due in __schedule(trace, started, pacing, speed, rate):
+        if due is not None:
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        queue.put((request, due))
+    for _ in workers:
+        queue.put(None)
+    for thread in workers:
+        thread.join()
+    return samples, time.perf_counter() - started
+
+
+def summarize(samples: list[Sample], elapsed: float) -> dict[str, RouteReport]:
+    """
+    Compute throughput and latency percentiles for each path, and for all requests under `*`.
+    """
+    routes: dict[str, list[Sample]] = {'*': samples}
+    for sample in samples:
+        routes.setdefault(sample[0], []).append(sample)
+    report: dict[str, RouteReport] = {}
+    for route, group in sorted(routes.items(), key=lambda x: -len(x[1])):
+        latencies = sorted(x[1] for x in group)
+        report[route] = {
+            'requests': len(group),
+            'errors': sum(1 for x in group if x[2] == 0 or x[2] >= 500),
+            'throughput': len(group) / elapsed if elapsed > 0 else 0.0,
+            'p50': __percentile(latencies, 0.50),
+            'p95': __percentile(latencies, 0.95),
+            'p99': __percentile(latencies, 0.99),
+            'max': latencies[-1] if latencies else 0.0
+        }
+    return report
+
+
+def format_report(report: dict[str, RouteReport]) -> Iterator[str]:
+    """Format a report as a table, one line per path."""
+    yield f"{'path':<40} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50':>10} {'p95':>10} " \
+          f"{'p99':>10}"
+    for route, x in report.items():
+        yield f"{route[:40]:<40} {x['requests']:>9} {x['errors']:>7} {x['throughput']:>9.1f} " \
+              f"{x['p50'] * 1000:>8.2f}ms {x['p95'] * 1000:>8.2f}ms {x['p99'] * 1000:>8.2f}ms"
+
+
+# ================ #
+# Internal Helpers #
+# ================ #
+
+def __schedule(trace: list[TraceRequest], started: float, pacing: Pacing, speed: float,
+               rate: float | None) -> Iterator[tuple[TraceRequest, float | None]]:
+    """Yield each request with the time (on the `perf_counter` clock) it is due to be sent."""
+    if pacing == 'closed' or len(trace) == 0:
+        for request in trace:
+            yield request, None
+        return
+    first = trace[0]['time']
+    for index, request in enumerate(trace):
+        offset = index / rate if rate else (request['time'] - first) / speed
+        yield request, started + offset
+
+
+def __percentile(values: list[float], fraction: float) -> float:
+    """Nearest rank percentile of sorted values."""
+    if len(values) == 0:
+        return 0.0
+    return values[min(len(values), max(1, math.ceil(fraction * len(values)))) - 1]
@@ -0,0 +1,274 @@
+from database import Database
+from database.tag import Tag
+from database.types import SearchParameters
+from flask.testing import FlaskClient
+from pathlib import Path
+from typing import Any, Callable, Iterator
+from typing_extensions import TypedDict
+import statistics
+import subprocess
+import sys
+import time
+
+# Search result pages benchmarked for each tag mix
+SEARCH_PAGES = (0, 10, 100)
+
+GROUPS = ('search', 'tags', 'entries', 'pages', 'startup')
+
+# Modules which are slow to import and should only be imported once they are used, not when the
+# server starts
+LAZY_MODULES = ('numpy', 'magic', 'markdown2', 'pyarrow', 'dateutil.parser', 'xdg.IconTheme',
+                'xdg.BaseDirectory')
+
+# Directory the server is imported from
+SOURCE_DIRECTORY = Path(__file__).parent.parent
+
+
+class Result(TypedDict):
+    """
+    Timings for one benchmark, in seconds.
+
+    :param group: Group the benchmark belongs to.
+    :param runs: Number of timed runs.
+    """
+    group: str
+    runs: int
+    min: float
+    median: float
+    mean: float
+    p95: float
+    max: float
+
+
+def measure(group: str, function: Callable[[], Any], repeat: int, warmup: int = 1) -> Result:
+    """
+    Time a function.
+
+    :param group: Group the benchmark belongs to.
+    :param function: Function to time.
+    :param repeat: Number of timed runs.
+    :param warmup: Number of untimed runs made first, to fill caches.
+    """
+    for _ in range(warmup):
+        function()
+    times: list[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return {
+        'group': group,
+        'runs': len(times),
+        'min': times[0],
+        'median': statistics.median(times),
+        'mean': statistics.fmean(times),
+        'p95': times[min(len(times) - 1, int(len(times) * 0.95))],
+        'max': times[-1]
+    }
+
+
+def eager_imports() -> list[str]:
+    """
+    Create the application in a new interpreter and return which of `LAZY_MODULES` were imported
+    by doing so. Anything returned is slowing down startup.
+    """
+    script = "import server, sys; server.create_app(); " \
+        f"print(*(x for x in {LAZY_MODULES!r} if x in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True,
+                            cwd=SOURCE_DIRECTORY, check=True)
+    return result.stdout.split()
+
+
+def compare(baseline: dict[str, Result], current: dict[str, Result],
+            threshold: float = 0.1) -> Iterator[str]:
+    """
+    Compare median times against an earlier run.
+
+    :param baseline: Results of the earlier run.
+    :param current: Results of this run.
+    :param threshold: Relative change above which a benchmark is flagged as a regression or an
+        improvement.
+    :returns: One line of text per benchmark present in both runs.
+    """
+    for name, result in current.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]['median'], result['median']
+        change = (after - before) / before if before > 0 else 0.0
+        flag = 'REGRESSION' if change > threshold else 'improved' if change < -threshold else ''
+        yield f"{name:<40} {before * 1000:>10.3f}ms {after * 1000:>10.3f}ms {change:>+8.1%} {flag}"
+
+
+class Suite:
+    """
+    Benchmarks covering the main database operations and page rendering.
+
+    Benchmarks run against whatever catalog the database contains, normally one created by
+    `generator.generate_catalog`. The tags used in searches are chosen by how many entries they are
+    on, so results are comparable between catalogs generated with the same options. Write
+    benchmarks add entries and tags to the database but don't modify the generated ones.
+    """
+
+    __db: Database
+    __client: FlaskClient
+    __repeat: int
+    # Tags used in benchmarks: the two most used, one used moderately and one used rarely
+    __common: str
+    __second: str
+    __medium: str
+    __rare: str
+    __results: dict[str, Result]
+    __progress: Callable[[str, Result], None] | None
+
+    def __init__(self, db: Database, client: FlaskClient, repeat: int = 5):
+        """
+        :param db: Database to benchmark.
+        :param client: Test client of the application using `db`.
+        :param repeat: Number of timed runs of each benchmark.
+        """
+        self.__db = db
+        self.__client = client
+        self.__repeat = repeat
+        self.__results = {}
+        self.__progress = None
+
+    def run(self, groups: tuple[str, ...] = GROUPS,
+            progress: Callable[[str, Result], None] | None = None) -> dict[str, Result]:
+        """
+        Run benchmarks.
+
+        :param groups: Groups of benchmarks to run, from `GROUPS`.
+        :param progress: Called with the name and result of each benchmark as it completes.
+        :returns: A map of benchmark name to result.
+        """
+        self.__progress = progress
+        # Sort by usage, most used first. Unused tags can't be searched for meaningfully.
+        tags: list[Tag] = sorted((x for x in self.__db.get_all_tags() if x.count > 0),
+                                 key=lambda x: (-x.count, x.id))
+        names = [x.name for x in tags]
+        self.__db.release()
+        if len(names) < 4:
+            raise ValueError("The catalog must contain at least 4 tags in use")
+        self.__common, self.__second = names[0], names[1]
+        self.__medium = names[len(names) // 10]
+        self.__rare = names[-1]
+        benchmarks = {
+            'search': self.__search,
+            'tags': self.__tags,
+            'entries': self.__entries,
+            'pages': self.__pages,
+            'startup': self.__startup
+        }
+        for group in groups:
+            benchmarks[group]()
+        return self.__results
+
+    # ============ #
+    #  Benchmarks  #
+    # ============ #
+
+    def __search(self):
+        mixes: dict[str, SearchParameters] = {
+            'all': {},
+            'common': {'tags': [self.__common]},
+            'rare': {'tags': [self.__rare]},
+            'pair': {'tags': [self.__common, self.__second]},
+            'excluded': {'tags': [self.__common], 'f_tags': [self.__second]},
+            'four': {'tags': [self.__common, self.__second, self.__medium, self.__rare]},
+            'sorted': {'sort': 'date_created', 'sort_descending': True},
+            'common_sorted': {'tags': [self.__common], 'sort': 'size', 'sort_descending': True}
+        }
+        for mix, params in mixes.items():
+            for page in SEARCH_PAGES:
+                query: SearchParameters = {**params, 'page': page}
+                self.__measure('search', f"search.{mix}.page{page}",
+                               lambda: self.__db.search(query))
+        self.__measure('search', "search.subtree", lambda: self.__db.get_subtree(1))
+
+    def __tags(self):
+        counters = {'create': 0, 'rename': 0, 'delete': 0}
+
+        def next_name(action: str):
+            counters[action] += 1
+            return f"bench_{counters[action]}"
+
+        self.__measure('tags', "tags.create", lambda: self.__get(
+            f"/api/tags/create?tag={next_name('create')}"))
+        self.__measure('tags', "tags.rename", lambda: self.__get(
+            "/api/tags/rename?tag={0}&new_tag={0}_r".format(next_name('rename'))))
+        self.__measure('tags', "tags.delete", lambda: self.__get(
+            f"/api/tags/delete?tag={next_name('delete')}_r"))
+        self.__measure('tags', "tags.update_counts", lambda: self.__db.update_tag_counts(),
+                       repeat=max(1, self.__repeat // 2))
+        self.__measure('tags', "tags.autocomplete", lambda: self.__get(
+            f"/api/tags/autocomplete?prefix={self.__common[:2]}"))
+        self.__measure('tags', "tags.list", lambda: self.__get("/api/tags/list"))
+
+    def __entries(self):
+        created: list[int] = []
+
+        def create():
+            entry = self.__db.create_entry()
+            entry.update_safe({
+                'item_name': "Benchmark entry",
+                'tags': [self.__common, self.__medium],
+                'description': "Created by the benchmark suite"
+            })
+            created.append(entry.id)
+
+        def update():
+            entry = self.__db.get_entry_by_id(created[0])
+            assert entry is not None
+            entry.update_safe({
+                'tags': [self.__second] if self.__common in entry.tags else [self.__common],
+                'description': f"Updated at {time.time()}"
+            })
+
+        self.__measure('entries', "entries.create", create)
+        self.__measure('entries', "entries.update", update)
+        self.__measure('entries', "entries.get", lambda: self.__get(
+            f"/api/entries/get?id={created[0]}"))
+
+    def __pages(self):
+        self.__measure('pages', "pages.index", lambda: self.__get("/"))
+        self.__measure('pages', "pages.search", lambda: self.__get(
+            f"/search?q={self.__common}"))
+        self.__measure('pages', "pages.search_deep", lambda: self.__get(
+            f"/search?q={self.__common}&page=10"))
+        self.__measure('pages', "pages.entry", lambda: self.__get("/entry?id=1"))
+        self.__measure('pages', "pages.tags", lambda: self.__get("/tags"))
+        self.__measure('pages', "api.search", lambda: self.__get(
+            f"/api/search?query={self.__common}%20{self.__second}"))
+
+    def __startup(self):
+        # Each run starts a new interpreter, so nothing is cached between runs. Starting an empty
+        # interpreter is measured too, as that part of the time can't be reduced.
+        def start(script: str):
+            subprocess.run([sys.executable, "-c", script], cwd=SOURCE_DIRECTORY, check=True,
+                           stdout=subprocess.DEVNULL)
+        self.__measure('startup', "startup.interpreter", lambda: start("pass"))
+        self.__measure('startup', "startup.create_app", lambda: start(
+            "import server; server.create_app()"))
+
+    # ================ #
+    # Internal Helpers #
+    # ================ #
+
+    def __measure(self, group: str, name: str, function: Callable[[], Any],
+                  repeat: int | None = None):
+        def run():
+            try:
+                function()
+            finally:
+                self.__db.release()
+        result = measure(group, run, repeat or self.__repeat)
+        self.__results[name] = result
+        if self.__progress:
+            self.__progress(name, result)
+
+    def __get(self, url: str):
+        response = self.__client.get(url)
+        if response.status_code >= 400:
+            raise RuntimeError(f"GET {url} failed with status {response.status_code}")
+        return response
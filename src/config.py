@@ -1,6 +1,22 @@
 from pathlib import Path
+from typing import Any
 import json
 
 __directory = Path(__file__).parent.parent.absolute()
 with Path(__directory, "config.json").open() as conf:
     configuration = json.load(conf)
+
+
+def override(settings: dict[str, Any], target: dict[str, Any] | None = None):
+    """
+    Replace configuration values. Nested objects are merged rather than replaced, so only the values
+    given in `settings` are changed.
+
+    :param settings: Values to change, in the same layout as `config.json`.
+    """
+    target = configuration if target is None else target
+    for key, value in settings.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            override(value, target[key])  # type: ignore
+        else:
+            target[key] = value
@@ -1,16 +1,40 @@
+from . import archive
+from .autocomplete import TagIndex
+from .backup import BackupManager
 from .base import Base
-from .entry import Entry
+from .cachesync import CacheSync
+from .checksum import Checksum
+from .contentversion import ContentVersion
+from .cooccurrence import CooccurrenceMatrix
+from .entry import Entry, file_size, subtree
 from .functions import register
-from .tag import Tag, get_tag_ids_multiple, tag_exists, get_tag
-from .types import SearchParameters
+from .instrumentation import instrument
+from .reconcile import Reconciler
+from .scrub import Scrubber, ScrubResult
+from .serializer import EntrySerializer
+from .slowlog import SlowQueryLog
+from .tag import Tag, get_tag_ids_multiple, get_tags, tag_exists, get_tag
+from .tagchange import seed_tag_changes, tag_changes, tag_version
+from .taxonomy import TAXONOMY_KEY, TagAlias, TagImplication, Taxonomy
+from .types import EntryUpdateParams, HistogramField, HistogramInterval, SearchParameters
+from .types import SortField
+from .upload import Upload, resolve_storage_path
 from database.dbstat import DBStat
-from database.exceptions import TagDoesNotExistException, TagExistsException
-from sqlalchemy import Engine, create_engine, func, event
+from database.exceptions import BackupException, InvalidTagException, TagDoesNotExistException
+from database.exceptions import TagExistsException
+from database.exceptions import TagImplicationCycleException, UploadException
+from sqlalchemy import ColumnElement, Engine, create_engine, delete, func, event, or_, update
 from sqlalchemy.exc import NoResultFound
-from sqlalchemy.orm import scoped_session, sessionmaker, Session
+from sqlalchemy.orm import aliased, scoped_session, sessionmaker, Session
 from sqlalchemy.sql import select
-from typing import ParamSpec, TypeVar
+from sqlalchemy.sql.elements import UnaryExpression
+from sqlalchemy.sql.operators import custom_op
+from typing import Any, BinaryIO, Iterator, ParamSpec, Sequence, TypeVar
 from util.timer import Timer
+import config
+import math
+import os
+import time
 
 # Register the custom function manager
 event.listen(Engine, "connect", register)
@@ -18,6 +42,41 @@ event.listen(Engine, "connect", register)
 DEFAULT_POST_LIMIT = 50
 PAGE_SIZE_LIMIT = 500
 
+# `strftime` format naming the histogram bucket a date falls in
+HISTOGRAM_FORMATS: dict[HistogramInterval, str] = {
+    'year': '%Y',
+    'month': '%Y-%m',
+    'day': '%Y-%m-%d'
+}
+
+# Column for each search sort field. Each column is indexed, and SQLite includes the row id in every
+# index, so sorting by the column and then by id can read rows straight from the index in order.
+# Missing values are NULL, which SQLite sorts before every other value. Sizes are recorded when
+# media is attached, so only entries whose file is missing (or which predate this and haven't been
+# through `backfill_sizes`) have no size.
+SORT_COLUMNS: dict[SortField, Any] = {
+    'date_created': Entry.date_created_raw,
+    'date_digitized': Entry.date_digitized_raw,
+    'date_modified': Entry.date_modified_raw,
+    'date_indexed': Entry.date_indexed_raw,
+    'size': Entry.size_raw,
+    'name': Entry.item_name,
+    'id': Entry.id
+}
+
+# Search parameters filtering by a range of dates: the column, and whether the value is a lower
+# bound
+RANGE_FILTERS: dict[str, tuple[Any, bool]] = {
+    'since': (Entry.date_created_raw, True),
+    'until': (Entry.date_created_raw, False),
+    'since_modified': (Entry.date_modified_raw, True),
+    'until_modified': (Entry.date_modified_raw, False),
+    'since_digitized': (Entry.date_digitized_raw, True),
+    'until_digitized': (Entry.date_digitized_raw, False),
+    'since_indexed': (Entry.date_indexed_raw, True),
+    'until_indexed': (Entry.date_indexed_raw, False)
+}
+
 P = ParamSpec('P')
 R = TypeVar('R')
 
@@ -26,6 +85,13 @@ class Database:
 
     __engine: Engine
     __scoped_session: scoped_session[Session]
+    __scrubber: Scrubber
+    __backups: BackupManager | None
+    __tag_index: TagIndex
+    __cooccurrence: CooccurrenceMatrix
+    __taxonomy: Taxonomy
+    __slow_queries: SlowQueryLog
+    __content_version: ContentVersion
 
     def __init__(self, path: str = ""):
         """
@@ -45,9 +111,32 @@ class Database:
         :param session: Existing session object to wrap.
         """
         self.__engine = create_engine(f"sqlite://{path}", echo=False)
-        self.__scoped_session = scoped_session(sessionmaker(bind=self.__engine))
+        self.__taxonomy = Taxonomy()
+        factory = sessionmaker(bind=self.__engine, info={TAXONOMY_KEY: self.__taxonomy})
+        self.__scoped_session = scoped_session(factory)
+        instrument(self.__engine, factory)
+        self.__slow_queries = SlowQueryLog()
+        self.__slow_queries.attach(self.__engine)
+        self.__tag_index = TagIndex()
+        self.__tag_index.track(factory)
+        self.__cooccurrence = CooccurrenceMatrix(config.configuration['related']['maxPairs'])
+        self.__cooccurrence.track(factory)
+        self.__content_version = ContentVersion()
+        self.__content_version.track(factory)
+        self.__cache_sync = CacheSync([self.__tag_index.invalidate, self.__cooccurrence.invalidate,
+                                       self.__taxonomy.invalidate])
+        self.__cache_sync.track(factory)
+        self.__scrubber = Scrubber(sessionmaker(bind=self.__engine))
+        self.__backups = BackupManager(self.__engine.url.database) \
+            if self.__engine.url.database else None
 
         Base.metadata.create_all(self.__engine)
+        # `create_all` only creates indexes along with new tables, so indexes which have been added
+        # to existing tables need to be created separately.
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(self.__engine, checkfirst=True)
+        seed_tag_changes(self.__session)
         self.__session.commit()
 
     # =================== #
@@ -72,9 +161,39 @@ class Database:
         """
         self.__scoped_session.remove()
 
+    def dispose(self):
+        """
+        Close every pooled connection. Connections are opened again as they are needed, so the
+        database can still be used afterwards. Call this before forking, as connections must not be
+        shared between processes.
+        """
+        self.release()
+        self.__engine.dispose()
+
     @property
     def __session(self):
-        return self.__scoped_session()
+        session = self.__scoped_session()
+        self.__cache_sync.check(session)
+        return session
+
+    def slow_queries(self, count: int | None = None):
+        """
+        Return the most recent statements which exceeded `slowQueries.threshold`, newest first.
+
+        :param count: Maximum number of records to return.
+        """
+        return self.__slow_queries.records(count)
+
+    def clear_slow_queries(self):
+        """Discard the in-memory slow query records."""
+        self.__slow_queries.clear()
+
+    def content_version(self):
+        """
+        Return a number which increases whenever entries or tags are changed by this process. Used
+        to invalidate values derived from them.
+        """
+        return self.__content_version.value
 
     def total_size(self):
         """
@@ -107,39 +226,204 @@ class Database:
     def search(self, params: SearchParameters):
         """
         Perform a search of the database.
+
+        Sorted searches read entries in order from the sort column's index and stop as soon as the
+        page is filled, so the first pages of a sorted search cost about the same as an unsorted
+        one. When another filter is more selective, such as a narrow date range, SQLite may use
+        that filter's index instead and sort the matches, but with a `LIMIT` it only keeps the
+        best `offset + count` rows while doing so rather than sorting every match.
+        """
+        query = self.__session.query(Entry).filter(*self.__search_criteria(params)) \
+            .order_by(*self.__search_order(params))
+        page_size, offset = self.__search_page(params)
+        query = query.limit(page_size)
+        query = query.offset(offset)
+
+        return query.all()
+
+    def search_serialized(self, params: SearchParameters, fields: Sequence[str]):
+        """
+        Perform a search of the database, returning one page of entries as transmissible
+        dictionaries containing only the requested fields.
+        """
+        serializer = EntrySerializer(fields)
+        page_size, offset = self.__search_page(params)
+        query = serializer.select().where(*self.__search_criteria(params)) \
+            .order_by(*self.__search_order(params)).limit(page_size).offset(offset)
+        return serializer.serialize(self.__session, (x.tuple() for x in
+                                                     self.__session.execute(query).all()))
+
+    def search_stream(self, params: SearchParameters, fields: Sequence[str],
+                      chunk_size: int = 1000) -> Iterator[dict[str, Any]]:
+        """
+        Perform a search of the database, yielding serialized entries as they are read from the
+        cursor. Unlike `search` the number of results is not limited unless `count` is specified,
+        and memory use is bounded by `chunk_size` no matter how many entries match.
+
+        The search parameters are validated immediately, so exceptions such as
+        `InvalidTagException` are raised by this function rather than when the results are first
+        iterated over. The iterator uses its own session, which is released once it is exhausted
+        or closed.
+
+        :param params: Search parameters.
+        :param fields: Field names to include in each result.
+        :param chunk_size: Number of rows to fetch from the cursor at a time.
         """
-        query = self.__session.query(Entry)
-        # Parse the tag components
+        serializer = EntrySerializer(fields)
+        query = serializer.select().where(*self.__search_criteria(params)) \
+            .order_by(*self.__search_order(params))
+        if 'count' in params:
+            page_size, offset = self.__search_page(params)
+            query = query.limit(page_size).offset(offset)
+        query = query.execution_options(yield_per=chunk_size)
+
+        def generator():
+            with Session(self.__engine) as session:
+                for partition in session.execute(query).partitions():
+                    yield from serializer.serialize(session, (x.tuple() for x in partition))
+        return generator()
+
+    def date_histogram(self, params: SearchParameters, field: HistogramField = 'created',
+                       interval: HistogramInterval = 'month') -> list[tuple[str, int]]:
+        """
+        Count the entries matching a search in each year, month or day, in a single grouped query.
+
+        Dates are bucketed in the timezone they were recorded in rather than UTC, so a photo taken
+        on the evening of December 31st is counted in that year no matter where it was taken.
+
+        :param params: Search parameters. Paging parameters are ignored.
+        :param field: Date to group entries by.
+        :param interval: Size of each bucket.
+        :returns: A list of (bucket, count) tuples in date order. Buckets are named `YYYY`,
+            `YYYY-MM` or `YYYY-MM-DD` depending on the interval, and empty buckets are left out.
+        """
+        columns = Entry.__table__.c  # type: ignore
+        local_time = columns[f'date_{field}'] + columns[f'date_{field}_tz']
+        bucket = func.strftime(HISTOGRAM_FORMATS[interval], local_time, 'unixepoch')
+        query = select(bucket, func.count()).where(*self.__search_criteria(params)) \
+            .group_by(bucket).order_by(bucket)
+        return [(x[0], x[1]) for x in self.__session.execute(query).all()]
+
+    def __search_criteria(self, params: SearchParameters) -> list[ColumnElement[bool]]:
+        """
+        Convert search parameters into a list of filter conditions.
+        """
+        criteria: list[ColumnElement[bool]] = []
+
+        # Parse the tag components. Without any tags every entry matches, so the tag check (which
+        # is called for every row) is skipped entirely.
         tag_str = params.get('tags', [])
         f_tag_str = params.get('f_tags', [])
-        tag_ids, forbidden_ids = get_tag_ids_multiple(self.__session, [tag_str, f_tag_str])
-        query = query.filter(func.check_tags(Entry.tag_ids, tag_ids, forbidden_ids))
+        if tag_str or f_tag_str:
+            tag_ids, forbidden_ids = get_tag_ids_multiple(self.__session, [tag_str, f_tag_str])
+            groups = None
+            if config.configuration['taxonomy']['implications'] == 'expand':
+                # Tags also match entries carrying any tag which implies them
+                groups, forbidden_ids = self.__taxonomy.expand(self.__session, tag_ids,
+                                                               forbidden_ids)
+            if groups is not None:
+                criteria.append(func.check_tag_groups(Entry.tag_ids, groups, forbidden_ids))
+            else:
+                criteria.append(func.check_tags(Entry.tag_ids, tag_ids, forbidden_ids))
+
+        # Scope
+        if 'under' in params:
+            criteria.append(Entry.id.in_(select(subtree(params['under']).c.id)))
 
         # Time ranges
-        if 'since' in params:
-            query.filter(Entry.date_created_raw >= params['since'])
-        if 'until' in params:
-            query.filter(Entry.date_created_raw <= params['until'])
-        if 'since_modified' in params:
-            query.filter(Entry.date_modified_raw >= params['since_modified'])
-        if 'until_modified' in params:
-            query.filter(Entry.date_modified_raw <= params['until_modified'])
-        if 'since_digitized' in params:
-            query.filter(Entry.date_digitized_raw >= params['since_digitized'])
-        if 'until_digitized' in params:
-            query.filter(Entry.date_digitized_raw <= params['until_digitized'])
-        if 'since_indexed' in params:
-            query.filter(Entry.date_indexed_raw >= params['since_indexed'])
-        if 'until_indexed' in params:
-            query.filter(Entry.date_indexed_raw <= params['until_indexed'])
-
-        # Quantity and Page
+        criteria.extend(x for _, x in self.__range_criteria(params))
+        return criteria
+
+    def __range_criteria(self, params: SearchParameters) -> list[tuple[Any, ColumnElement[bool]]]:
+        """
+        Convert the date range parameters into filter conditions, along with the filtered column.
+        """
+        criteria: list[tuple[Any, ColumnElement[bool]]] = []
+        for key, (column, lower) in RANGE_FILTERS.items():
+            value = params.get(key)  # type: ignore
+            if value is not None:
+                criteria.append((column, column >= value if lower else column <= value))
+        return criteria
+
+    def __search_order(self, params: SearchParameters) -> list[ColumnElement[Any]]:
+        """
+        Convert the sort parameters into `ORDER BY` terms. Ties are broken by id so that pages
+        don't overlap.
+
+        SQLite prefers to read entries in order from the sort column's index, stopping once the
+        page is full. When the search is limited to a small part of the library by a date range on
+        another column, or to a subtree, most of that index would have to be read to find the few
+        entries which match. In that case the sort columns are hidden from the query planner with a
+        unary `+`, so it reads the matching entries through the filter's index instead and keeps the
+        best `offset + count` of them in a bounded sorter.
+        """
+        if 'sort' not in params:
+            return []
+        column = SORT_COLUMNS[params['sort']]
+        columns = [column] if params['sort'] == 'id' else [column, Entry.id]
+        ranges = [x for filtered, x in self.__range_criteria(params) if filtered is not column]
+        if 'under' in params or (ranges and self.__is_selective(params, ranges)):
+            columns = [UnaryExpression(x, operator=custom_op('+'), type_=x.type) for x in columns]
+        if params.get('sort_descending', False):
+            return [x.desc() for x in columns]
+        return [x.asc() for x in columns]
+
+    def __is_selective(self, params: SearchParameters, criteria: list[ColumnElement[bool]]):
+        """
+        Determine whether it is cheaper to sort every entry matching `criteria` than to read entries
+        in sorted order until a page of matches has been found.
+
+        If `m` of `n` entries match and `k` rows are needed for the page, reading in sorted order
+        visits about `k * n / m` entries, whereas sorting visits all `m`. Sorting is cheaper when
+        `m` is below `sqrt(k * n)`, which is checked by counting at most that many matches.
+        """
+        page_size, offset = self.__search_page(params)
+        total = self.__session.execute(select(func.max(Entry.id))).scalar() or 0
+        limit = math.isqrt((page_size + offset) * total) + 1
+        matches = self.__session.execute(select(func.count()).select_from(
+            select(Entry.id).where(*criteria).limit(limit).subquery())).scalar_one()
+        return matches < limit
+
+    def __search_page(self, params: SearchParameters):
+        """
+        Return the page size and row offset for a search.
+        """
         page_size = min(max(0, params.get('count', DEFAULT_POST_LIMIT)), PAGE_SIZE_LIMIT)
-        offset = page_size * params.get('page', 0)
-        query = query.limit(page_size)
-        query = query.offset(offset)
+        offset = page_size * max(0, params.get('page', 0))
+        return page_size, offset
 
-        return query.all()
+    def get_entries_serialized(self, fields: Sequence[str], *criteria: ColumnElement[bool]):
+        """
+        Retrieve entries as transmissible dictionaries containing only the requested fields. This
+        selects only the required columns and skips loading `Entry` objects entirely.
+
+        :param fields: Field names to include, see `serializer.parse_fields`.
+        :param criteria: Filters to apply, such as `Entry.id == 5`.
+        :returns: A list of dictionaries, one per matching entry.
+        """
+        serializer = EntrySerializer(fields)
+        query = serializer.select().where(*criteria)
+        return serializer.serialize(self.__session, (x.tuple() for x in
+                                                     self.__session.execute(query).all()))
+
+    def get_entries_batch(self, fields: Sequence[str], ids: Sequence[int],
+                          ranges: Sequence[tuple[int, int]] = ()) -> dict[int, dict[str, Any]]:
+        """
+        Retrieve a set of entries by id in a single query.
+
+        :param fields: Field names to include. `id` is always included.
+        :param ids: Individual entry ids to retrieve.
+        :param ranges: Inclusive (first, last) ranges of entry ids to retrieve.
+        :returns: A map of entry id to serialized entry. Entries which do not exist are omitted.
+        """
+        if 'id' not in fields:
+            fields = ['id', *fields]
+        criteria = [Entry.id.between(first, last) for first, last in ranges]
+        if len(ids) > 0:
+            criteria.append(Entry.id.in_(ids))
+        if len(criteria) == 0:
+            return {}
+        return {x['id']: x for x in self.get_entries_serialized(fields, or_(*criteria))}
 
     # ================ #
     #  Tag Management  #
@@ -149,13 +433,65 @@ class Database:
         """Retrieve a list of all tags known to the database."""
         return (x.tuple()[0] for x in self.__session.execute(select(Tag)).all())
 
+    def tag_version(self) -> int:
+        """
+        Return the version of the tag table. The version increases whenever a tag is created,
+        renamed, deleted, has its count changed or has its aliases or implications changed.
+        """
+        return tag_version(self.__session)
+
+    def get_tag_changes(self, since: int):
+        """
+        Find the tags which have changed since a version returned by `tag_version`.
+
+        :param since: Version to compare against.
+        :returns: A list of tags which have been created or modified, and a list of deleted tag ids.
+        """
+        return tag_changes(self.__session, since)
+
+    def autocomplete_tags(self, prefix: str, count: int = 10):
+        """
+        Find the most used tags starting with a prefix, using an in-memory index of tag names.
+
+        :param prefix: Case insensitive prefix to search for.
+        :param count: Maximum number of tags to return.
+        :returns: A list of tag objects, most used first.
+        """
+        return self.__tag_index.complete(self.__session, prefix, count)
+
+    def related_tags(self, tags: list[str], count: int = 10) -> list[tuple[Tag, float]]:
+        """
+        Suggest tags which are commonly used together with a set of tags, using a precomputed tag
+        co-occurrence matrix. Candidates are scored using the metric set by `related.metric`.
+
+        :param tags: Names of the tags to find related tags for.
+        :param count: Maximum number of suggestions.
+        :raises InvalidTagException: If any of the tags do not exist.
+        :returns: A list of (tag, score) tuples, best first.
+        """
+        options = config.configuration['related']
+        ids = [x.id for x in get_tags(self.__session, tags)]
+        ranked = self.__cooccurrence.related(self.__session, ids, count, options['metric'],
+                                             options['minSupport'])
+        found = {x.id: x for x in self.__session.execute(
+            select(Tag).where(Tag.id.in_([id for id, _ in ranked]))).scalars()}
+        return [(found[id], score) for id, score in ranked if id in found]
+
+    def rebuild_related_tags(self):
+        """
+        Rebuild the tag co-occurrence matrix from scratch.
+
+        :returns: The number of tag pairs counted and the time taken.
+        """
+        return self.__cooccurrence.build(self.__session)
+
     def create_tag(self, tag: str):
         """
         Register a new tag in the database. If the tag already exists, an exception will be raised.
 
         :param tag: The tag name to create.
         """
-        if tag_exists(self.__session, tag):
+        if tag_exists(self.__session, tag) or self.__alias_exists(tag):
             raise TagExistsException(tag)
         newTag = Tag(name=tag)
         with self.__session.begin_nested():
@@ -167,18 +503,20 @@ class Database:
         with the new tag.
 
         :param tag: The tag to delete
-        :param new_tag: The optional tag to replace all instance of `tag` with
+        :param new_tag: The optional tag to replace all instance of `tag` with, may be an alias
+        :raises TagDoesNotExistException: If either tag does not exist. Aliases are not resolved for
+            the tag being deleted, use `delete_alias` to remove an alias.
+        :raises ValueError: If the replacement is the tag being deleted, or one of its aliases.
         """
-        try:
-            old_tag = get_tag(self.__session, tag)
-        except NoResultFound:
+        # Looked up by its exact name, deleting an alias must never delete the tag it refers to
+        old_tag = self.__session.execute(select(Tag).where(Tag.name == tag)).scalar_one_or_none()
+        if old_tag is None:
             raise TagDoesNotExistException(tag)
         new_tag = None
         if new_tag_name:
-            try:
-                new_tag = get_tag(self.__session, new_tag_name)
-            except NoResultFound:
-                raise TagDoesNotExistException(new_tag_name)
+            new_tag = self.__get_tag_strict(new_tag_name)
+            if new_tag.id == old_tag.id:
+                raise ValueError(f"Can not replace {tag} with {new_tag_name}, it is the same tag")
         with self.__session.begin_nested():
             if new_tag:
                 new_tag.count += old_tag.count
@@ -189,7 +527,11 @@ class Database:
                     entry.tags.replace(old_tag, new_tag)
                 else:
                     entry.tags.remove(old_tag)
+            self.__session.execute(delete(TagAlias).where(TagAlias.tag_id == old_tag.id))
+            self.__session.execute(delete(TagImplication).where(
+                (TagImplication.tag_id == old_tag.id) | (TagImplication.implied_id == old_tag.id)))
             self.__session.delete(old_tag)
+        self.__taxonomy.invalidate()
 
     def rename_tag(self, tag: str, new_tag: str):
         """
@@ -202,11 +544,136 @@ class Database:
             tag_object = self.__session.query(Tag).where(Tag.name == tag).one()
         except NoResultFound:
             raise TagDoesNotExistException(tag)
-        if tag_exists(self.__session, new_tag):
+        if tag_exists(self.__session, new_tag) or self.__alias_exists(new_tag):
             raise TagExistsException(new_tag)
         with self.__session.begin_nested():
             tag_object.name = new_tag
 
+    # ========================== #
+    #  Aliases and Implications  #
+    # ========================== #
+
+    def get_aliases(self):
+        """Return a list of (alias, tag name) tuples."""
+        query = select(TagAlias.name, Tag.name).join(Tag, Tag.id == TagAlias.tag_id)
+        return [x.tuple() for x in self.__session.execute(query).all()]
+
+    def create_alias(self, alias: str, tag: str):
+        """
+        Add an alternative name for a tag. The alias is accepted anywhere a tag name is.
+
+        :param alias: The new name.
+        :param tag: Name of the tag the alias refers to.
+        :raises TagExistsException: If a tag or alias named `alias` already exists.
+        :raises TagDoesNotExistException: If `tag` does not exist.
+        """
+        if tag_exists(self.__session, alias) or self.__alias_exists(alias):
+            raise TagExistsException(alias)
+        tag_object = self.__get_tag_strict(tag)
+        self.__session.add(TagAlias(name=alias, tag_id=tag_object.id))
+        self.__session.commit()
+        self.__taxonomy.invalidate()
+
+    def delete_alias(self, alias: str):
+        """
+        Remove a tag alias.
+
+        :raises TagDoesNotExistException: If the alias does not exist.
+        """
+        alias_object = self.__session.execute(
+            select(TagAlias).where(TagAlias.name == alias)).scalar_one_or_none()
+        if alias_object is None:
+            raise TagDoesNotExistException(alias)
+        self.__session.delete(alias_object)
+        self.__session.commit()
+        self.__taxonomy.invalidate()
+
+    def get_implications(self):
+        """Return a list of (tag name, implied tag name) tuples."""
+        implied = aliased(Tag)
+        query = select(Tag.name, implied.name) \
+            .join(TagImplication, TagImplication.tag_id == Tag.id) \
+            .join(implied, implied.id == TagImplication.implied_id)
+        return [x.tuple() for x in self.__session.execute(query).all()]
+
+    def create_implication(self, tag: str, implied: str):
+        """
+        State that every entry tagged with `tag` is also tagged with `implied`. Implications are
+        transitive. Depending on `taxonomy.implications` implied tags are either added to entries
+        (existing entries are updated immediately) or matched when searching.
+
+        :param tag: Name of the implying tag.
+        :param implied: Name of the implied tag.
+        :raises TagDoesNotExistException: If either tag does not exist.
+        :raises TagImplicationCycleException: If `implied` already implies `tag`.
+        """
+        tag_object = self.__get_tag_strict(tag)
+        implied_object = self.__get_tag_strict(implied)
+        if self.__taxonomy.creates_cycle(self.__session, tag_object.id, implied_object.id):
+            raise TagImplicationCycleException(tag_object.name, implied_object.name)
+        exists = select(func.count(TagImplication.id)).where(
+            TagImplication.tag_id == tag_object.id, TagImplication.implied_id == implied_object.id)
+        if self.__session.execute(exists).scalar():
+            return
+        self.__session.add(TagImplication(tag_id=tag_object.id, implied_id=implied_object.id))
+        self.__session.flush()
+        self.__taxonomy.invalidate()
+        if config.configuration['taxonomy']['implications'] == 'materialize':
+            # Adding `tag` again adds everything it now implies to entries which already have it
+            for id in [tag_object.id, *self.__taxonomy.implying(self.__session, tag_object.id)]:
+                entries = select(Entry).where(func.has_tag(Entry.tag_ids, id))
+                for entry in self.__session.execute(entries).scalars().all():
+                    tag_list = entry.tags
+                    for implied_id in self.__taxonomy.implied(self.__session, id):
+                        tag_list.add(self.__session.get_one(Tag, implied_id))
+        self.__session.commit()
+
+    def delete_implication(self, tag: str, implied: str):
+        """
+        Remove an implication. Tags already added to entries because of the implication are kept.
+
+        :raises TagDoesNotExistException: If either tag does not exist.
+        """
+        tag_object = self.__get_tag_strict(tag)
+        implied_object = self.__get_tag_strict(implied)
+        implications = select(TagImplication).where(
+            TagImplication.tag_id == tag_object.id, TagImplication.implied_id == implied_object.id)
+        for implication in self.__session.execute(implications).scalars().all():
+            self.__session.delete(implication)
+        self.__session.commit()
+        self.__taxonomy.invalidate()
+
+    def __alias_exists(self, name: str):
+        return self.__taxonomy.resolve_alias(self.__session, name) is not None
+
+    def __get_tag_strict(self, name: str):
+        """Resolve a tag name or alias, raising `TagDoesNotExistException` if it doesn't exist."""
+        try:
+            return get_tag(self.__session, name)
+        except InvalidTagException:
+            raise TagDoesNotExistException(name)
+
+    def backfill_sizes(self):
+        """
+        Record the size of every entry with media whose size isn't known yet. Sizes used to only be
+        recorded the first time they were displayed, and entries without one sort before every
+        other entry by size.
+
+        :returns: A tuple containing the number of entries updated and the amount of time it took.
+        """
+        timer = Timer()
+        query = select(Entry.id, Entry.storage_id) \
+            .where(Entry.storage_id.is_not(None), Entry.size_raw.is_(None))
+        sizes = [{"id": id, "size_raw": size} for id, size in
+                 ((id, file_size(storage_id)) for id, storage_id in
+                  (x.tuple() for x in self.__session.execute(query).all()))
+                 if size is not None]
+        if len(sizes) > 0:
+            self.__session.execute(update(Entry), sizes)
+            self.__session.commit()
+            self.__content_version.bump()
+        return len(sizes), timer.get_time()
+
     def update_tag_counts(self):
         """
         Iterate over the database and collect updated tag counts. This is a pretty expensive query
@@ -268,3 +735,256 @@ class Database:
         """
         entries = self.__session.query(Entry).where(Entry.id == id).all()
         return entries[0] if len(entries) > 0 else None
+
+    def get_subtree(self, id: int, max_depth: int | None = None) -> list[tuple[Entry, int]]:
+        """
+        Get all descendants of an entry using a single recursive query.
+
+        :param id: Entry id number of the root of the tree. The root itself is not included.
+        :param max_depth: Maximum number of levels to descend. `1` returns only direct children.
+        :returns: A list of (entry, depth) tuples ordered by depth and then by id.
+        """
+        tree = subtree(id, max_depth)
+        query = select(Entry, tree.c.depth).join(tree, Entry.id == tree.c.id) \
+            .order_by(tree.c.depth, Entry.id)
+        return [x.tuple() for x in self.__session.execute(query).all()]  # type: ignore
+
+    def get_entry_by_storage_id(self, storage_id: str) -> Entry | None:
+        """
+        Get the entry associated with a file.
+
+        :param storage_id: Path of the file relative to the data root.
+        :returns: The identified entry or None if no entry refers to the file.
+        """
+        query = select(Entry).where(Entry.storage_id == storage_id).limit(1)
+        return self.__session.execute(query).scalar_one_or_none()
+
+    def reconcile(self):
+        """
+        Synchronize entries with the contents of the data root. New files are given stub entries,
+        moved files are re-linked to their entries and entries whose files are missing are flagged.
+        Files which have not changed since the last run are skipped.
+
+        :returns: A report describing the changes that were made.
+        """
+        report = Reconciler(self.__session).run()
+        # Storage ids may have been updated without the ORM
+        self.__content_version.bump()
+        return report
+
+    # =================== #
+    #  Upload Management  #
+    # =================== #
+
+    def create_upload(self, storage_id: str, size: int | None = None,
+                      entry_id: int | None = None):
+        """
+        Begin a new chunked upload.
+
+        :param storage_id: Storage id the file will be saved as once the upload is finalized.
+        :param size: Total size of the file in bytes, if known.
+        :param entry_id: Existing entry to attach the file to. If not set, a new entry will be
+            created when the upload is finalized.
+        :raises UploadException: If the storage id is invalid or already in use, or the entry does
+            not exist.
+        :returns: The new upload.
+        """
+        if resolve_storage_path(storage_id).exists():
+            raise UploadException(f"Storage id {storage_id} already exists")
+        if entry_id is not None and not self.get_entry_by_id(entry_id):
+            raise UploadException(f"No such entry {entry_id}")
+        if size is not None and size < 0:
+            raise UploadException(f"Invalid upload size {size}")
+        upload = Upload(storage_id=storage_id, size=size, entry_id=entry_id)
+        self.__session.add(upload)
+        self.__session.commit()
+        return upload
+
+    def get_upload(self, id: int) -> Upload | None:
+        """
+        Get an in-progress upload by ID value.
+
+        :param id: Upload id number.
+        :returns: The identified upload or None if it does not exist.
+        """
+        return self.__session.get(Upload, id)
+
+    def write_upload(self, upload: Upload, stream: BinaryIO, offset: int):
+        """
+        Append a chunk of data to an upload. The new offset is committed even if the stream fails
+        part way through so that the client can resume from the last byte received.
+
+        :param upload: Upload to write to.
+        :param stream: Stream containing the chunk data.
+        :param offset: Offset of the first byte of the chunk within the file.
+        """
+        try:
+            upload.write(stream, offset)
+        finally:
+            self.__session.commit()
+
+    def finalize_upload(self, upload: Upload, params: EntryUpdateParams,
+                        sha256: str | None = None) -> Entry:
+        """
+        Complete an upload. The staging file is moved to its final location and bound to an entry
+        in a single step: if the entry can not be updated the file is moved back and the upload is
+        left intact so the client can retry.
+
+        :param upload: Upload to finalize.
+        :param params: Additional entry parameters to apply. The storage id is always taken from
+            the upload.
+        :param sha256: Expected hex encoded SHA-256 digest of the file, if known.
+        :raises UploadException: If the upload is incomplete or fails verification.
+        :returns: The entry the file was attached to.
+        """
+        if upload.size is not None and upload.offset != upload.size:
+            raise UploadException(f"Upload {upload.id} is incomplete ({upload.offset} of "
+                                  f"{upload.size} bytes received)")
+        digest = upload.digest()
+        if sha256 is not None and sha256.lower() != digest:
+            raise UploadException(f"Checksum mismatch for upload {upload.id}: Expected {sha256} "
+                                  f"got {digest}")
+        destination = upload.storage_path()
+        if destination.exists():
+            raise UploadException(f"Storage id {upload.storage_id} already exists")
+
+        staging = upload.staging_path()
+        if upload.entry_id is not None:
+            entry = self.get_entry_by_id(upload.entry_id)
+            if not entry:
+                raise UploadException(f"No such entry {upload.entry_id}")
+        else:
+            entry = self.create_entry()
+        mime_type = upload.identify()
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(staging, destination)
+        try:
+            entry.attach_media(upload.storage_id, upload.offset, mime_type)
+            self.__session.flush()
+            self.__session.execute(delete(Checksum).where(Checksum.entry_id == entry.id))
+            self.__session.add(Checksum(entry_id=entry.id, sha256=digest, size=upload.offset,
+                                        date_computed=int(time.time())))
+            self.__session.delete(upload)
+            entry.update_safe({key: value for key, value in params.items()
+                               if key != 'storage_id'})  # type: ignore
+        except Exception as e:
+            self.__session.rollback()
+            os.replace(destination, staging)
+            raise e
+        upload.discard()
+        return entry
+
+    def abort_upload(self, upload: Upload):
+        """
+        Cancel an upload and delete any data received so far.
+        """
+        upload.discard()
+        self.__session.delete(upload)
+        self.__session.commit()
+
+    # =================== #
+    #  Storage Scrubbing  #
+    # =================== #
+
+    def start_scrub(self, continuous: bool = False):
+        """
+        Start verifying the media of every entry in the background. The scrub resumes from where
+        the previous one stopped.
+
+        :param continuous: Keep starting new passes instead of stopping after one.
+        :returns: False if a scrub is already running.
+        """
+        return self.__scrubber.start(continuous)
+
+    def stop_scrub(self):
+        """Stop a running scrub. Progress is preserved and will be resumed by `start_scrub`."""
+        self.__scrubber.stop()
+
+    def scrub_status(self):
+        """Return the progress of the current or most recent scrub."""
+        return self.__scrubber.status()
+
+    def scrub_results(self, status: str | None = None, count: int = DEFAULT_POST_LIMIT,
+                      page: int = 0):
+        """
+        Retrieve the results of previous scrubs.
+
+        :param status: Only return results with this status. Defaults to all results.
+        :param count: Number of results to return.
+        :param page: Page number to return.
+        """
+        query = select(ScrubResult).order_by(ScrubResult.entry_id)
+        if status is not None:
+            query = query.where(ScrubResult.status == status)
+        page_size = min(max(0, count), PAGE_SIZE_LIMIT)
+        query = query.limit(page_size).offset(page_size * page)
+        return [x.tuple()[0] for x in self.__session.execute(query).all()]
+
+    # =================== #
+    #  Catalog Archiving  #
+    # =================== #
+
+    def export_catalog(self, path: str, chunk_size: int = 10000):
+        """
+        Stream the tags and entries tables into a compressed columnar archive. See
+        `archive.export_catalog` for details of the format.
+
+        :param path: Path of the archive to create.
+        :param chunk_size: Number of rows to read and write at a time.
+        :returns: A map of table name to number of rows exported, and the time taken.
+        """
+        return archive.export_catalog(self.__session, path, chunk_size)
+
+    def import_catalog(self, path: str):
+        """
+        Bulk load an archive created by `export_catalog`. The database must not contain any tags or
+        entries.
+
+        :param path: Path of the archive to load.
+        :raises ArchiveException: If the database is not empty or the archive is invalid.
+        :returns: A map of table name to number of rows imported, and the time taken.
+        """
+        result = archive.import_catalog(self.__session, path)
+        # Rows are inserted without the ORM, so tag changes aren't tracked automatically
+        seed_tag_changes(self.__session)
+        self.__session.commit()
+        self.__tag_index.invalidate()
+        self.__cooccurrence.invalidate()
+        self.__content_version.bump()
+        return result
+
+    # =================== #
+    #  Backup Management  #
+    # =================== #
+
+    def start_backup(self):
+        """
+        Start copying the database to the backup directory in the background. Writers are only
+        blocked while each group of pages is copied, not for the whole backup.
+
+        :raises BackupException: If the database is in memory.
+        :returns: False if a backup is already running.
+        """
+        return self.__backup_manager.start()
+
+    def schedule_backups(self):
+        """
+        Start making backups periodically, as configured by `backup.interval`. Has no effect for
+        in-memory databases.
+        """
+        if self.__backups:
+            self.__backups.schedule()
+
+    def backup_status(self):
+        """Return the progress of the current backup and the outcome of the previous one."""
+        return self.__backup_manager.status()
+
+    def list_backups(self):
+        """Return the backups which are currently retained, newest first."""
+        return self.__backup_manager.list()
+
+    @property
+    def __backup_manager(self):
+        if not self.__backups:
+            raise BackupException("In-memory databases can not be backed up")
+        return self.__backups
@@ -0,0 +1,275 @@
+from .entry import Entry
+from .tag import Tag
+from database.exceptions import ArchiveException
+from sqlalchemy import Table, LargeBinary, bindparam, func, insert, select, type_coerce
+from sqlalchemy.orm import Session
+from typing import TYPE_CHECKING, Any, Iterable, Iterator, Literal
+from util.lazy import lazy_import, lazy_import_optional
+from util.timer import Timer
+import json
+import zipfile
+
+if TYPE_CHECKING:
+    import numpy as np
+    import pyarrow  # type: ignore
+    import pyarrow.ipc  # type: ignore
+else:
+    np = lazy_import('numpy')
+    # `pyarrow` imports `pyarrow.ipc` itself
+    pyarrow = lazy_import_optional('pyarrow')
+
+FORMAT_VERSION = 1
+
+ColumnType = Literal['int', 'int?', 'str', 'str?', 'tags']
+
+# Columns included in the archive for each table. Tag lists are kept in their packed `uint16` form
+# rather than being decoded into python lists.
+TABLES: dict[str, tuple[Table, list[tuple[str, ColumnType]]]] = {
+    'tags': (Tag.__table__, [  # type: ignore
+        ('id', 'int'), ('name', 'str'), ('count', 'int')
+    ]),
+    'entries': (Entry.__table__, [  # type: ignore
+        ('id', 'int'), ('item_name', 'str?'), ('storage_id', 'str?'), ('tags', 'tags'),
+        ('description', 'str?'), ('transcription', 'str?'), ('date_created', 'int'),
+        ('date_created_tz', 'int'), ('date_digitized', 'int'), ('date_digitized_tz', 'int'),
+        ('date_indexed', 'int'), ('date_modified', 'int'), ('location', 'str?'),
+        ('mime_type', 'str?'), ('mime_icon', 'str?'), ('size', 'int?'), ('parent', 'int?')
+    ]),
+}
+
+Columns = dict[str, list[Any]]
+
+
+def export_catalog(session: Session, path: str, chunk_size: int = 10000):
+    """
+    Write the tags and entries tables to a compressed columnar archive.
+
+    The archive is a zip file. Each table is written in chunks of `chunk_size` rows as it is read
+    from the database, so the catalog is never held in memory all at once. If pyarrow is installed
+    each chunk is stored as a compressed Arrow IPC stream, otherwise each column of each chunk is
+    stored as a NumPy `.npy` member (variable length values use an Arrow style data + offsets
+    layout), which makes the archive readable with `numpy.load`.
+
+    :param session: Session to read from.
+    :param path: Path of the archive to create.
+    :param chunk_size: Number of rows per chunk.
+    :returns: A map of table name to number of rows exported, and the time taken.
+    """
+    timer = Timer()
+    counts = write_catalog(path, {
+        name: __read_chunks(session, table, columns, chunk_size)
+        for name, (table, columns) in TABLES.items()
+    })
+    return counts, timer.get_time()
+
+
+def write_catalog(path: str, tables: dict[str, Iterable[Columns]]):
+    """
+    Write chunks of rows to an archive in the format used by `export_catalog`. This allows catalogs
+    which don't come from a database, such as generated benchmark data, to be loaded with
+    `import_catalog`.
+
+    :param path: Path of the archive to create.
+    :param tables: Map of table name to an iterable of column chunks, with a key for every column
+        listed for the table in `TABLES`. Chunks are written as they are produced.
+    :returns: A map of table name to number of rows written.
+    """
+    backend = 'arrow' if pyarrow is not None else 'npy'
+    manifest: dict[str, Any] = {"version": FORMAT_VERSION, "backend": backend, "tables": {}}
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, (_, columns) in TABLES.items():
+            rows = 0
+            chunks = 0
+            for chunk in tables.get(name, ()):
+                member = f"{name}/{chunks:06d}"
+                if backend == 'arrow':
+                    __write_arrow(archive, member, columns, chunk)
+                else:
+                    __write_npy(archive, member, columns, chunk)
+                rows += len(chunk['id'])
+                chunks += 1
+            manifest['tables'][name] = {"rows": rows, "chunks": chunks}
+        archive.writestr("manifest.json", json.dumps(manifest))
+    return {name: x['rows'] for name, x in manifest['tables'].items()}
+
+
+def import_catalog(session: Session, path: str):
+    """
+    Load an archive created by `export_catalog` into an empty database. Rows are inserted in bulk a
+    chunk at a time, bypassing the ORM entirely.
+
+    :param session: Session to write to. Committed once the import is complete.
+    :param path: Path of the archive to read.
+    :raises ArchiveException: If the database is not empty or the archive can not be read. Nothing
+        is imported if the archive is only partially readable.
+    :returns: A map of table name to number of rows imported, and the time taken.
+    """
+    timer = Timer()
+    for name, (table, _) in TABLES.items():
+        if session.execute(select(func.count()).select_from(table)).scalar():
+            raise ArchiveException(f"Unable to import into a database with existing {name}")
+    try:
+        with __open_archive(path) as archive:
+            counts = __import_tables(session, archive, __read_manifest(archive, path))
+    except BaseException:
+        session.rollback()
+        raise
+    session.commit()
+    return counts, timer.get_time()
+
+
+# Raised by `zipfile`, `json`, `numpy` and `pyarrow` when an archive member is missing or corrupt
+_READ_ERRORS = (KeyError, ValueError, TypeError, EOFError, OSError, zipfile.BadZipFile)
+
+
+def __open_archive(path: str) -> zipfile.ZipFile:
+    try:
+        return zipfile.ZipFile(path, 'r')
+    except (OSError, zipfile.BadZipFile) as e:
+        raise ArchiveException(f"Unable to open {path}: {e}")
+
+
+def __read_manifest(archive: zipfile.ZipFile, path: str) -> dict[str, Any]:
+    """Read the manifest and check it describes every table."""
+    try:
+        manifest = json.loads(archive.read("manifest.json"))
+    except _READ_ERRORS:
+        raise ArchiveException(f"{path} is not a catalog archive")
+    if not isinstance(manifest, dict):
+        raise ArchiveException(f"{path} is not a catalog archive")
+    if manifest.get('version') != FORMAT_VERSION:
+        raise ArchiveException(f"Unsupported archive version {manifest.get('version')}")
+    if manifest.get('backend') not in ('arrow', 'npy'):
+        raise ArchiveException(f"Unsupported archive backend {manifest.get('backend')}")
+    if manifest['backend'] == 'arrow' and pyarrow is None:
+        raise ArchiveException("pyarrow is required to import this archive")
+    tables = manifest.get('tables')
+    for name in TABLES:
+        chunks = tables.get(name, {}).get('chunks') if isinstance(tables, dict) else None
+        if not isinstance(chunks, int) or isinstance(chunks, bool) or chunks < 0:
+            raise ArchiveException(f"Manifest of {path} has no valid chunk count for {name}")
+    return manifest
+
+
+def __import_tables(session: Session, archive: zipfile.ZipFile,
+                    manifest: dict[str, Any]) -> dict[str, int]:
+    """Insert every chunk listed in the manifest, without committing."""
+    counts: dict[str, int] = {}
+    for name, (table, columns) in TABLES.items():
+        # Tag lists are inserted in their packed form. Bind names can't match column names.
+        statement = insert(table).values({
+            column: bindparam(f"v_{column}", type_=LargeBinary if kind == 'tags' else None)
+            for column, kind in columns
+        })
+        counts[name] = 0
+        for index in range(manifest['tables'][name]['chunks']):
+            member = f"{name}/{index:06d}"
+            try:
+                if manifest['backend'] == 'arrow':
+                    rows = __read_arrow(archive, member)
+                else:
+                    rows = __read_npy(archive, member, columns)
+            except _READ_ERRORS as e:
+                raise ArchiveException(f"Unable to read {member} from the archive: {e!r}")
+            if len(rows) > 0:
+                session.execute(statement, [{f"v_{k}": v for k, v in row.items()}
+                                            for row in rows])
+            counts[name] += len(rows)
+    return counts
+
+
+def __read_chunks(session: Session, table: Table, columns: list[tuple[str, ColumnType]],
+                  chunk_size: int) -> Iterator[Columns]:
+    """Read a table in chunks, converting each chunk from rows to columns."""
+    selected = [type_coerce(table.c[name], LargeBinary) if kind == 'tags' else table.c[name]
+                for name, kind in columns]
+    query = select(*selected).order_by(table.c.id).execution_options(yield_per=chunk_size)
+    for partition in session.execute(query).partitions():
+        values = list(zip(*partition))
+        yield {name: list(values[i]) for i, (name, _) in enumerate(columns)}
+
+
+# ============= #
+# Arrow Backend #
+# ============= #
+
+def __arrow_type(kind: ColumnType):
+    if kind in ('int', 'int?'):
+        return pyarrow.int64()
+    if kind == 'tags':
+        return pyarrow.binary()
+    return pyarrow.string()
+
+
+def __write_arrow(archive: zipfile.ZipFile, member: str, columns: list[tuple[str, ColumnType]],
+                  chunk: Columns):
+    batch = pyarrow.record_batch(
+        [pyarrow.array(chunk[name], __arrow_type(kind)) for name, kind in columns],
+        names=[name for name, _ in columns])
+    options = pyarrow.ipc.IpcWriteOptions(compression='zstd')
+    # The stream is already compressed, so store it in the archive as-is
+    info = zipfile.ZipInfo(f"{member}.arrow")
+    info.compress_type = zipfile.ZIP_STORED
+    with archive.open(info, 'w', force_zip64=True) as file:
+        with pyarrow.ipc.new_stream(file, batch.schema, options=options) as writer:
+            writer.write_batch(batch)
+
+
+def __read_arrow(archive: zipfile.ZipFile, member: str) -> list[dict[str, Any]]:
+    with archive.open(f"{member}.arrow", 'r') as file:
+        return pyarrow.ipc.open_stream(file).read_all().to_pylist()
+
+
+# ============= #
+# NumPy Backend #
+# ============= #
+
+def __write_npy(archive: zipfile.ZipFile, member: str, columns: list[tuple[str, ColumnType]],
+                chunk: Columns):
+    def write(name: str, array: np.ndarray[Any, Any]):
+        with archive.open(f"{member}/{name}.npy", 'w', force_zip64=True) as file:
+            np.lib.format.write_array(file, array, allow_pickle=False)
+
+    for name, kind in columns:
+        values = chunk[name]
+        if kind.endswith('?'):
+            write(f"{name}.null", np.array([x is None for x in values], np.bool_))
+        if kind in ('int', 'int?'):
+            write(name, np.array([x or 0 for x in values], np.int64))
+            continue
+        encoded: list[bytes] = [(x.encode() if isinstance(x, str) else x) or b'' for x in values]
+        offsets = np.zeros(len(encoded) + 1, np.int64)
+        np.cumsum([len(x) for x in encoded], out=offsets[1:])
+        if kind == 'tags':
+            # Offsets are counted in tags rather than bytes
+            write(name, np.frombuffer(b''.join(encoded), np.uint16))
+            write(f"{name}.offsets", offsets // np.dtype(np.uint16).itemsize)
+        else:
+            write(name, np.frombuffer(b''.join(encoded), np.uint8))
+            write(f"{name}.offsets", offsets)
+
+
+def __read_npy(archive: zipfile.ZipFile, member: str,
+               columns: list[tuple[str, ColumnType]]) -> list[dict[str, Any]]:
+    def read(name: str) -> np.ndarray[Any, Any]:
+        with archive.open(f"{member}/{name}.npy", 'r') as file:
+            return np.lib.format.read_array(file, allow_pickle=False)
+
+    decoded: Columns = {}
+    for name, kind in columns:
+        data = read(name)
+        if kind in ('int', 'int?'):
+            values: list[Any] = data.tolist()
+        else:
+            offsets = read(f"{name}.offsets").tolist()
+            raw = data.tobytes()
+            if kind == 'tags':
+                offsets = [x * data.itemsize for x in offsets]
+                values = [raw[a:b] for a, b in zip(offsets, offsets[1:])]
+            else:
+                values = [raw[a:b].decode() for a, b in zip(offsets, offsets[1:])]
+        if kind.endswith('?'):
+            values = [None if null else x for x, null in zip(values, read(f"{name}.null"))]
+        decoded[name] = values
+    names = list(decoded.keys())
+    return [dict(zip(names, row)) for row in zip(*decoded.values())]
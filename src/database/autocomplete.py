@@ -0,0 +1,147 @@
+from __future__ import annotations
+from .tag import Tag
+from bisect import bisect_left, insort
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, SessionTransaction, UOWTransaction, sessionmaker
+from threading import RLock
+from typing import TYPE_CHECKING, Any
+from util import metrics
+from util.lazy import lazy_import
+
+if TYPE_CHECKING:
+    import numpy as np
+else:
+    np = lazy_import('numpy')
+
+# Sorts after every other character, used to find the end of a prefix range
+_MAX_CHAR = chr(0x10FFFF)
+
+
+class TagIndex:
+    """
+    In-memory index of tag names for prefix autocompletion.
+
+    Tag names are kept in a sorted list so that all tags beginning with a prefix can be found with
+    two binary searches. Tag counts are stored in a NumPy array in the same order, and the most used
+    tags in the range are selected with a partial sort, so looking up a prefix matching most of the
+    tag list is still fast.
+
+    The index is loaded from the database on first use and kept current by listening for flushed
+    changes to `Tag` objects, see `track`. If a session which changed tags ends without committing
+    the index is discarded and loaded again on next use.
+    """
+
+    __lock: RLock
+    __loaded: bool
+    __keys: list[tuple[str, int]]
+    __names: list[str]
+    __counts: np.ndarray[Any, np.dtype[np.int64]]
+    __by_id: dict[int, str]
+
+    def __init__(self):
+        self.__lock = RLock()
+        self.invalidate()
+
+    def track(self, factory: sessionmaker[Session]):
+        """
+        Keep the index up to date with changes made by sessions from `factory`.
+
+        :param factory: Session factory to listen to.
+        """
+        event.listen(factory, "after_flush", self.__after_flush)
+        event.listen(factory, "after_commit", self.__after_commit)
+        event.listen(factory, "after_transaction_end", self.__after_transaction_end)
+
+    def invalidate(self):
+        """Discard the index. It will be loaded from the database the next time it is used."""
+        with self.__lock:
+            self.__loaded = False
+            self.__keys = []
+            self.__names = []
+            self.__counts = np.zeros(0, np.int64)
+            self.__by_id = {}
+
+    def complete(self, session: Session, prefix: str, count: int = 10) -> list[dict[str, Any]]:
+        """
+        Find the most used tags beginning with a prefix. Matching is case insensitive.
+
+        :param session: Session used to load the index if required.
+        :param prefix: Prefix to search for. An empty prefix matches every tag.
+        :param count: Maximum number of tags to return.
+        :returns: Up to `count` tag objects, ordered by count and then by name.
+        """
+        with self.__lock:
+            metrics.cache_lookup('tag_index', self.__loaded)
+            if not self.__loaded:
+                self.__load(session)
+            key = prefix.lower()
+            start = bisect_left(self.__keys, (key,))
+            end = bisect_left(self.__keys, (key + _MAX_CHAR,))
+            counts = self.__counts[start:end]
+            if count <= 0 or len(counts) == 0:
+                return []
+            if len(counts) > count:
+                selected = np.argpartition(-counts, count - 1)[:count] + start
+            else:
+                selected = np.arange(start, end)
+            results = [(int(self.__counts[i]), self.__names[i]) for i in selected.tolist()]
+        results.sort(key=lambda x: (-x[0], x[1]))
+        return [{"name": name, "count": count} for count, name in results]
+
+    # ================ #
+    # Internal Helpers #
+    # ================ #
+
+    def __load(self, session: Session):
+        rows = sorted((name.lower(), id, name, count) for id, name, count in
+                      (x.tuple() for x in session.execute(select(Tag.id, Tag.name, Tag.count))))
+        self.__keys = [(key, id) for key, id, _, _ in rows]
+        self.__names = [name for _, _, name, _ in rows]
+        self.__counts = np.array([count for _, _, _, count in rows], np.int64)
+        self.__by_id = {id: name for _, id, name, _ in rows}
+        self.__loaded = True
+
+    def __remove(self, id: int):
+        name = self.__by_id.pop(id, None)
+        if name is None:
+            return
+        index = bisect_left(self.__keys, (name.lower(), id))
+        del self.__keys[index]
+        del self.__names[index]
+        self.__counts = np.delete(self.__counts, index)
+
+    def __update(self, id: int, name: str, count: int):
+        if self.__by_id.get(id) == name:
+            index = bisect_left(self.__keys, (name.lower(), id))
+            self.__counts[index] = count
+            return
+        self.__remove(id)
+        key = (name.lower(), id)
+        insort(self.__keys, key)
+        index = bisect_left(self.__keys, key)
+        self.__names.insert(index, name)
+        self.__counts = np.insert(self.__counts, index, count)
+        self.__by_id[id] = name
+
+    def __after_flush(self, session: Session, context: UOWTransaction):
+        changed = [x for x in (*session.new, *session.dirty) if isinstance(x, Tag)]
+        deleted = [x for x in session.deleted if isinstance(x, Tag)]
+        if len(changed) == 0 and len(deleted) == 0:
+            return
+        session.info['tags_changed'] = True
+        with self.__lock:
+            if not self.__loaded:
+                return
+            for tag in deleted:
+                self.__remove(tag.id)
+            for tag in changed:
+                self.__update(tag.id, tag.name, tag.count)
+
+    def __after_commit(self, session: Session):
+        # Releasing a savepoint also counts as a commit, only the outermost transaction matters
+        if not session.in_nested_transaction():
+            session.info.pop('tags_changed', None)
+
+    def __after_transaction_end(self, session: Session, transaction: SessionTransaction):
+        if transaction.parent is None and session.info.pop('tags_changed', False):
+            self.invalidate()
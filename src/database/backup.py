@@ -0,0 +1,176 @@
+from datetime import datetime
+from database.exceptions import BackupException
+from pathlib import Path
+from threading import Event, Lock, Thread
+from typing import IO, Any
+import config
+import fcntl
+import os
+import sqlite3
+import time
+import traceback
+
+BACKUP_PREFIX = "library-"
+BACKUP_SUFFIX = ".db"
+
+
+class BackupManager:
+    """
+    Creates copies of the live database using the SQLite online backup API.
+
+    The database is copied a few pages at a time with a short sleep between steps, so other
+    connections are only locked out for the duration of a single step rather than the whole copy.
+    Each copy is checked with `PRAGMA integrity_check` before it is kept, and old copies are removed
+    once more than the configured number have been made.
+
+    Several processes may schedule backups of the same database, such as the workers of a pre-fork
+    server. Scheduled backups are only made by the process holding a lock on a file next to the
+    database, the others try to take the lock at each interval so one of them takes over if that
+    process exits.
+    """
+
+    __path: str
+    __lock: Lock
+    __thread: Thread | None
+    __scheduler: Thread | None
+    __schedule_lock: IO[bytes] | None
+    __stop: Event
+    __status: dict[str, Any]
+
+    def __init__(self, path: str):
+        """
+        :param path: Path of the database file to back up.
+        """
+        self.__path = path
+        self.__lock = Lock()
+        self.__thread = None
+        self.__scheduler = None
+        self.__schedule_lock = None
+        self.__stop = Event()
+        self.__status = {"running": False}
+
+    def start(self):
+        """
+        Start a backup in the background.
+
+        :returns: False if a backup is already running.
+        """
+        with self.__lock:
+            if self.__thread and self.__thread.is_alive():
+                return False
+            self.__status = {
+                "running": True,
+                "pages_total": None,
+                "pages_remaining": None,
+                "date_started": int(time.time()),
+                "last": self.__status.get("last")
+            }
+            self.__thread = Thread(target=self.__run, daemon=True, name="backup")
+            self.__thread.start()
+            return True
+
+    def schedule(self):
+        """
+        Start making backups every `backup.interval` seconds. Has no effect if the interval is zero
+        or backups have already been scheduled.
+        """
+        interval = config.configuration['backup']['interval']
+        if interval <= 0 or self.__scheduler is not None:
+            return
+
+        def loop():
+            while not self.__stop.wait(interval):
+                if self.__hold_schedule_lock():
+                    self.start()
+        self.__scheduler = Thread(target=loop, daemon=True, name="backup-scheduler")
+        self.__scheduler.start()
+
+    def status(self) -> dict[str, Any]:
+        """Return the progress of the current backup and the result of the previous one."""
+        with self.__lock:
+            return dict(self.__status)
+
+    def list(self) -> list[dict[str, Any]]:
+        """Return the backups which are currently retained, newest first."""
+        return [{
+            "name": path.name,
+            "size": path.stat().st_size,
+            "date": int(path.stat().st_mtime)
+        } for path in self.__backups()]
+
+    # ================ #
+    # Internal Helpers #
+    # ================ #
+
+    def __hold_schedule_lock(self):
+        """Take the lock which allows this process to make scheduled backups, if it is free."""
+        if self.__schedule_lock is not None:
+            return True
+        file = open(f"{self.__path}.backup-lock", 'ab')
+        try:
+            # `lockf` locks belong to the process, and aren't inherited by forked children
+            fcntl.lockf(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            file.close()
+            return False
+        self.__schedule_lock = file
+        return True
+
+    def __run(self):
+        options = config.configuration['backup']
+        directory = Path(options['directory'])
+        name = f"{BACKUP_PREFIX}{datetime.now().strftime('%Y%m%d-%H%M%S')}{BACKUP_SUFFIX}"
+        destination = Path(directory, name)
+        # Backups started by hand in two processes at once must not write to the same file
+        partial = destination.with_suffix(f".{os.getpid()}.partial")
+        result: dict[str, Any] = {"name": name, "date": int(time.time())}
+        try:
+            directory.mkdir(parents=True, exist_ok=True)
+            source = sqlite3.connect(self.__path)
+            target = sqlite3.connect(partial)
+            try:
+                source.backup(target, pages=options['pagesPerStep'], progress=self.__progress,
+                              sleep=options['sleep'])
+            finally:
+                target.close()
+                source.close()
+            self.__verify(partial)
+            partial.rename(destination)
+            result['ok'] = True
+            self.__rotate(options['retain'])
+        except Exception as e:
+            traceback.print_exception(e)
+            partial.unlink(missing_ok=True)
+            result['ok'] = False
+            result['error'] = f"{type(e).__name__}: {e}"
+        finally:
+            with self.__lock:
+                self.__status['running'] = False
+                self.__status['last'] = result
+
+    def __progress(self, status: int, remaining: int, total: int):
+        with self.__lock:
+            self.__status['pages_total'] = total
+            self.__status['pages_remaining'] = remaining
+
+    def __verify(self, path: Path):
+        """Make sure a copy is readable and not corrupt."""
+        connection = sqlite3.connect(path)
+        try:
+            result = [x[0] for x in connection.execute("PRAGMA integrity_check").fetchall()]
+        finally:
+            connection.close()
+        if result != ["ok"]:
+            raise BackupException(f"Integrity check failed: {'; '.join(result)}")
+
+    def __backups(self):
+        directory = Path(config.configuration['backup']['directory'])
+        if not directory.exists():
+            return []
+        # Timestamped names sort chronologically
+        return sorted(directory.glob(f"{BACKUP_PREFIX}*{BACKUP_SUFFIX}"), reverse=True)
+
+    def __rotate(self, retain: int):
+        """Delete all but the newest `retain` backups."""
+        for path in self.__backups()[max(retain, 1):]:
+            path.unlink()
@@ -0,0 +1,92 @@
+from .tagchange import TAG_VERSIONS_KEY, tag_version
+from sqlalchemy import event
+from sqlalchemy.orm import Session, SessionTransaction, sessionmaker
+from threading import Lock
+from typing import Callable
+
+# Set in `session.info` once the version has been checked during the current transaction
+_CHECKED_KEY = "tag_version_checked"
+# Set in `session.info` when a savepoint has been rolled back, discarding some recorded versions
+_VERSIONS_LOST_KEY = "tag_versions_lost"
+
+
+class CacheSync:
+    """
+    Invalidates in-memory caches when tags are changed by another process.
+
+    Caches such as the tag index are kept current by listening to the sessions of this process, so
+    they don't see changes committed by other processes using the same database file, such as the
+    other workers of a pre-fork server. Every change to a tag, alias or implication increases the
+    tag version (see `tagchange`), so the first time a session is used in each transaction the
+    version is compared to the last one this process knows of (see `check`), and if it has changed
+    every cache is invalidated.
+
+    The versions created by this process's own commits are recorded as they are flushed, so that
+    its own changes, which the caches have already applied, don't invalidate them.
+    """
+
+    __lock: Lock
+    __version: int | None
+    __invalidators: list[Callable[[], None]]
+
+    def __init__(self, invalidators: list[Callable[[], None]]):
+        """
+        :param invalidators: Functions which discard each cache.
+        """
+        self.__lock = Lock()
+        self.__version = None
+        self.__invalidators = invalidators
+
+    def track(self, factory: sessionmaker[Session]):
+        """
+        Record the versions created by sessions from `factory` when they commit.
+
+        :param factory: Session factory to listen to.
+        """
+        event.listen(factory, "after_rollback", self.__after_rollback)
+        event.listen(factory, "after_commit", self.__after_commit)
+        event.listen(factory, "after_transaction_end", self.__after_transaction_end)
+
+    def check(self, session: Session):
+        """
+        Invalidate the caches if tags have been changed by another process. Only the first call
+        during each transaction of a session queries the database, later calls return immediately.
+
+        :param session: Session which is about to be used.
+        """
+        if session.info.get(_CHECKED_KEY):
+            return
+        session.info[_CHECKED_KEY] = True
+        version = tag_version(session)
+        with self.__lock:
+            if version == self.__version:
+                return
+            self.__version = version
+            for invalidate in self.__invalidators:
+                invalidate()
+
+    def __after_rollback(self, session: Session):
+        session.info[_VERSIONS_LOST_KEY] = True
+
+    def __after_commit(self, session: Session):
+        # Releasing a savepoint also counts as a commit, only the outermost transaction matters
+        if session.in_nested_transaction():
+            return
+        versions: list[tuple[int, int]] = session.info.pop(TAG_VERSIONS_KEY, [])
+        if session.info.pop(_VERSIONS_LOST_KEY, False) or len(versions) == 0:
+            return
+        with self.__lock:
+            # Only skip ahead if nothing else changed tags since the version this process knows of,
+            # otherwise the caches are invalidated when the next transaction begins
+            version = self.__version
+            for old_version, new_version in versions:
+                if old_version != version:
+                    return
+                version = new_version
+            self.__version = version
+
+    def __after_transaction_end(self, session: Session, transaction: SessionTransaction):
+        if transaction.parent is None:
+            session.info.pop(TAG_VERSIONS_KEY, None)
+            session.info.pop(_VERSIONS_LOST_KEY, None)
+            session.info.pop(_CHECKED_KEY, None)
@@ -0,0 +1,21 @@
+from .base import Base
+from sqlalchemy import ForeignKey
+from sqlalchemy.orm import Mapped, mapped_column
+from util.repr import repr_helper
+
+
+class Checksum(Base):
+    """
+    Content digest of the media associated with an entry. Digests are recorded when the file first
+    enters the library (for example at the end of a chunked upload) and are used later to detect
+    silent corruption of the stored data.
+    """
+    __tablename__ = "checksums"
+
+    entry_id: Mapped[int] = mapped_column(ForeignKey("entries.id"), unique=True)
+    sha256: Mapped[str] = mapped_column()
+    size: Mapped[int] = mapped_column()
+    date_computed: Mapped[int] = mapped_column()
+
+    def __repr__(self):
+        return repr_helper(self, ['id', 'entry_id', 'sha256', 'size', 'date_computed'])
@@ -0,0 +1,61 @@
+from .entry import Entry
+from .tag import Tag
+from sqlalchemy import event
+from sqlalchemy.orm import Session, SessionTransaction, UOWTransaction, sessionmaker
+from threading import Lock
+
+# Set in `session.info` when a flush has changed entries or tags
+_CHANGED_KEY = "content_changed"
+
+
+class ContentVersion:
+    """
+    Counter which increases whenever entries or tags are changed, used to invalidate anything
+    derived from them such as cached page fragments.
+
+    Changes are detected when sessions flush, and the version is increased once the changes are
+    committed. Releasing a savepoint counts as a commit, as savepoints are used to make some changes
+    durable without committing the outer transaction. The version only covers this process, so
+    changes made by other processes are not seen.
+    """
+
+    __lock: Lock
+    __value: int
+
+    def __init__(self):
+        self.__lock = Lock()
+        self.__value = 0
+
+    @property
+    def value(self):
+        return self.__value
+
+    def track(self, factory: sessionmaker[Session]):
+        """
+        Increase the version when sessions from `factory` commit changes to entries or tags.
+
+        :param factory: Session factory to listen to.
+        """
+        event.listen(factory, "after_flush", self.__after_flush)
+        event.listen(factory, "after_commit", self.__after_commit)
+        event.listen(factory, "after_transaction_end", self.__after_transaction_end)
+
+    def bump(self):
+        """Increase the version, for changes made without the ORM."""
+        with self.__lock:
+            self.__value += 1
+
+    def __after_flush(self, session: Session, context: UOWTransaction):
+        for objects in (session.new, session.dirty, session.deleted):
+            if any(isinstance(x, (Entry, Tag)) for x in objects):
+                session.info[_CHANGED_KEY] = True
+                return
+
+    def __after_commit(self, session: Session):
+        if session.info.pop(_CHANGED_KEY, False):
+            self.bump()
+
+    def __after_transaction_end(self, session: Session, transaction: SessionTransaction):
+        # Changes from a transaction which ended without committing were discarded
+        if transaction.parent is None:
+            session.info.pop(_CHANGED_KEY, None)
@@ -0,0 +1,274 @@
+from __future__ import annotations
+from .entry import Entry
+from .tag import TAG_EDITS_KEY
+from sqlalchemy import LargeBinary, event, select, type_coerce
+from sqlalchemy.orm import Session, SessionTransaction, sessionmaker
+from threading import RLock
+from typing import TYPE_CHECKING, Any, Iterable, Literal
+from util import metrics
+from util.lazy import lazy_import
+from util.timer import Timer
+
+if TYPE_CHECKING:
+    import numpy as np
+else:
+    np = lazy_import('numpy')
+
+Metric = Literal['pmi', 'lift']
+
+# Tag ids are stored as uint16, so a pair of ids packs into a single integer key
+_ID_BITS = 16
+_ID_LIMIT = 1 << _ID_BITS
+_ID_MASK = _ID_LIMIT - 1
+
+# Pending incremental updates are merged into the matrix once there are this many of them
+_MERGE_THRESHOLD = 100000
+
+# While building, up to this many times `max_pairs` distinct pairs are counted before the least
+# frequent are discarded, so that a pair seen early on isn't dropped before it has been seen again
+_HIGH_WATER = 2
+
+
+class CooccurrenceMatrix:
+    """
+    Counts how often each pair of tags appears on the same entry.
+
+    The counts are held as a symmetric sparse matrix in CSR form (`indptr`, `indices` and `data`
+    arrays, as used by `scipy.sparse.csr_matrix`), so the tags which co-occur with a given tag are a
+    contiguous slice of `indices`. The matrix is built by streaming the packed tag column through
+    NumPy in chunks, and is then kept current by applying the tag list edits recorded by `TagList`
+    whenever a session commits. Edits are held in a small overlay until enough have accumulated to
+    be worth merging into the CSR arrays.
+
+    To stay within a fixed memory budget at most `max_pairs` distinct pairs are kept. When there are
+    more than that only the `max_pairs` most frequent pairs are kept, which only affects pairs too
+    rare to be useful suggestions. While building, pairs are only discarded once there are more
+    than twice that many, so the counts of the pairs which are kept are exact unless the catalog
+    has far more distinct pairs than the budget.
+    """
+
+    __lock: RLock
+    __built: bool
+    __max_pairs: int
+    __chunk_size: int
+    # Canonical storage: sorted packed (low id, high id) keys and their counts
+    __keys: np.ndarray[Any, np.dtype[np.int64]]
+    __counts: np.ndarray[Any, np.dtype[np.int64]]
+    # Symmetric CSR view of the same data
+    __indptr: np.ndarray[Any, np.dtype[np.int64]]
+    __indices: np.ndarray[Any, np.dtype[np.uint16]]
+    __data: np.ndarray[Any, np.dtype[np.int64]]
+    # Number of entries carrying each tag, and the number of entries with any tags
+    __tag_counts: np.ndarray[Any, np.dtype[np.int64]]
+    __entries: int
+    # Edits which have not been merged into the arrays yet, stored in both directions
+    __pending: dict[int, dict[int, int]]
+    __pending_size: int
+
+    def __init__(self, max_pairs: int, chunk_size: int = 10000):
+        """
+        :param max_pairs: Maximum number of distinct tag pairs to keep.
+        :param chunk_size: Number of entries to read from the database at a time while building.
+        """
+        self.__lock = RLock()
+        self.__max_pairs = max_pairs
+        self.__chunk_size = chunk_size
+        self.invalidate()
+
+    def track(self, factory: sessionmaker[Session]):
+        """
+        Apply tag list edits made by sessions from `factory` when they are committed.
+
+        :param factory: Session factory to listen to.
+        """
+        event.listen(factory, "after_commit", self.__after_commit)
+        event.listen(factory, "after_transaction_end", self.__after_transaction_end)
+
+    def invalidate(self):
+        """Discard the matrix. It will be rebuilt the next time it is used."""
+        with self.__lock:
+            self.__built = False
+            self.__keys = np.zeros(0, np.int64)
+            self.__counts = np.zeros(0, np.int64)
+            self.__tag_counts = np.zeros(_ID_LIMIT, np.int64)
+            self.__entries = 0
+            self.__pending = {}
+            self.__pending_size = 0
+            self.__rebuild_csr()
+
+    def build(self, session: Session):
+        """
+        Count every tag pair in the database.
+
+        :param session: Session to read entries from.
+        :returns: The number of distinct pairs and the time taken.
+        """
+        timer = Timer()
+        with self.__lock:
+            self.invalidate()
+            query = select(type_coerce(Entry.__table__.c.tags, LargeBinary)) \
+                .execution_options(yield_per=self.__chunk_size)
+            # Raw pairs are buffered until there are about as many as the budget before merging
+            buffered: list[np.ndarray[Any, np.dtype[np.int64]]] = []
+            buffered_size = 0
+            for partition in session.execute(query).partitions():
+                for (blob,) in partition:
+                    if not blob:
+                        continue
+                    ids = np.unique(np.frombuffer(blob, np.uint16)).astype(np.int64)
+                    self.__tag_counts[ids] += 1
+                    self.__entries += 1
+                    if len(ids) < 2:
+                        continue
+                    low, high = np.triu_indices(len(ids), 1)
+                    buffered.append((ids[low] << _ID_BITS) | ids[high])
+                    buffered_size += len(low)
+                if buffered_size >= self.__max_pairs:
+                    self.__merge(np.concatenate(buffered))
+                    buffered, buffered_size = [], 0
+                    if len(self.__keys) > self.__max_pairs * _HIGH_WATER:
+                        self.__prune()
+            if len(buffered) > 0:
+                self.__merge(np.concatenate(buffered))
+            self.__prune()
+            self.__rebuild_csr()
+            self.__built = True
+            return len(self.__keys), timer.get_time()
+
+    def related(self, session: Session, tag_ids: Iterable[int], count: int = 10,
+                metric: Metric = 'pmi', min_support: int = 2) -> list[tuple[int, float]]:
+        """
+        Find the tags which most often appear alongside a set of tags.
+
+        Each candidate is scored against each of the given tags, either by pointwise mutual
+        information (`log(P(a, b) / (P(a) P(b)))`) or by lift (`P(a, b) / (P(a) P(b))`), and the
+        scores are summed so that tags related to several of the given tags rank highest.
+
+        :param session: Session used to build the matrix if required.
+        :param tag_ids: Tags to find related tags for.
+        :param count: Maximum number of tags to return.
+        :param metric: Scoring function, either `pmi` or `lift`.
+        :param min_support: Ignore pairs which occur together fewer than this many times.
+        :returns: A list of (tag id, score) tuples, best first.
+        """
+        with self.__lock:
+            metrics.cache_lookup('cooccurrence', self.__built)
+            if not self.__built:
+                self.build(session)
+            query = [x for x in dict.fromkeys(tag_ids) if 0 <= x < _ID_LIMIT]
+            if count <= 0 or len(query) == 0 or self.__entries == 0:
+                return []
+            scores = np.zeros(_ID_LIMIT, np.float64)
+            for tag in query:
+                candidates, together = self.__row(tag)
+                keep = together >= max(min_support, 1)
+                candidates, together = candidates[keep], together[keep]
+                if len(candidates) == 0:
+                    continue
+                expected = self.__tag_counts[tag] * self.__tag_counts[candidates] / self.__entries
+                ratio = together / np.maximum(expected, 1e-12)
+                scores[candidates] += np.log(ratio) if metric == 'pmi' else ratio
+            scores[query] = 0
+            candidates = np.flatnonzero(scores > 0)
+            if len(candidates) > count:
+                candidates = candidates[np.argpartition(-scores[candidates], count - 1)[:count]]
+            ranked = sorted(((int(x), float(scores[x])) for x in candidates),
+                            key=lambda x: (-x[1], x[0]))
+        return ranked
+
+    # ================ #
+    # Internal Helpers #
+    # ================ #
+
+    def __row(self, tag: int):
+        """Return the co-occurring tags and counts for one tag, including pending edits."""
+        start, end = self.__indptr[tag], self.__indptr[tag + 1]
+        indices = self.__indices[start:end].astype(np.int64)
+        data = self.__data[start:end]
+        pending = self.__pending.get(tag)
+        if not pending:
+            return indices, data
+        merged = dict(zip(indices.tolist(), data.tolist()))
+        for other, delta in pending.items():
+            merged[other] = merged.get(other, 0) + delta
+        return np.fromiter(merged.keys(), np.int64), np.fromiter(merged.values(), np.int64)
+
+    def __merge(self, keys: np.ndarray[Any, Any], counts: np.ndarray[Any, Any] | None = None):
+        """Add packed pair keys (with optional counts, default 1) into the canonical arrays."""
+        if counts is None:
+            counts = np.ones(len(keys), np.int64)
+        unique, inverse = np.unique(np.concatenate([self.__keys, keys]), return_inverse=True)
+        totals = np.bincount(inverse, np.concatenate([self.__counts, counts]),
+                             len(unique)).astype(np.int64)
+        keep = totals > 0
+        self.__keys, self.__counts = unique[keep], totals[keep]
+
+    def __prune(self):
+        """Discard all but the `max_pairs` most frequent pairs. Ties are broken arbitrarily."""
+        if len(self.__keys) <= self.__max_pairs:
+            return
+        if self.__max_pairs <= 0:
+            self.__keys, self.__counts = self.__keys[:0], self.__counts[:0]
+            return
+        # Indices are sorted again so that the keys stay in order
+        keep = np.sort(np.argpartition(-self.__counts, self.__max_pairs - 1)[:self.__max_pairs])
+        self.__keys, self.__counts = self.__keys[keep], self.__counts[keep]
+
+    def __rebuild_csr(self):
+        low = self.__keys >> _ID_BITS
+        high = self.__keys & _ID_MASK
+        rows = np.concatenate([low, high])
+        columns = np.concatenate([high, low])
+        data = np.concatenate([self.__counts, self.__counts])
+        order = np.lexsort((columns, rows))
+        self.__indptr = np.zeros(_ID_LIMIT + 1, np.int64)
+        np.cumsum(np.bincount(rows, minlength=_ID_LIMIT), out=self.__indptr[1:])
+        self.__indices = columns[order].astype(np.uint16)
+        self.__data = data[order]
+
+    def __apply(self, edits: list[tuple[int, list[int], int]]):
+        for tag, others, delta in edits:
+            if not 0 <= tag < _ID_LIMIT:
+                continue
+            self.__tag_counts[tag] += delta
+            if len(others) == 0:
+                # The tag list went from empty to one tag or back again
+                self.__entries += delta
+            for other in others:
+                for a, b in ((tag, other), (other, tag)):
+                    row = self.__pending.setdefault(a, {})
+                    row[b] = row.get(b, 0) + delta
+                self.__pending_size += 1
+        if self.__pending_size >= _MERGE_THRESHOLD:
+            self.__flush_pending()
+
+    def __flush_pending(self):
+        keys: list[int] = []
+        counts: list[int] = []
+        for a, row in self.__pending.items():
+            for b, delta in row.items():
+                if a < b and delta != 0:
+                    keys.append((a << _ID_BITS) | b)
+                    counts.append(delta)
+        self.__merge(np.array(keys, np.int64), np.array(counts, np.int64))
+        self.__prune()
+        self.__rebuild_csr()
+        self.__pending = {}
+        self.__pending_size = 0
+
+    def __after_commit(self, session: Session):
+        # Releasing a savepoint also counts as a commit, only the outermost transaction matters
+        if session.in_nested_transaction():
+            return
+        edits = session.info.pop(TAG_EDITS_KEY, None)
+        if not edits:
+            return
+        with self.__lock:
+            # Nothing to update until the matrix has been built from the database
+            if self.__built:
+                self.__apply(edits)
+
+    def __after_transaction_end(self, session: Session, transaction: SessionTransaction):
+        # Edits from a transaction which ended without committing were discarded
+        if transaction.parent is None:
+            session.info.pop(TAG_EDITS_KEY, None)
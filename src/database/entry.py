@@ -3,42 +3,70 @@ from .tag import TagIDListDecorator, TagList, Tag
 from calendar import timegm
 from database.types import EntryUpdateParams
 from datetime import datetime, timezone, timedelta
-from dateutil import parser
-from magic import Magic
+from functools import cache
 from pathlib import Path
-from sqlalchemy import ForeignKey, select
+from sqlalchemy import CTE, ForeignKey, literal, select
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import Mapped, mapped_column
 from sqlalchemy.orm.session import object_session
 from sqlalchemy.orm.attributes import flag_modified
-from typing import Any, Optional
+from typing import TYPE_CHECKING, Any, Optional
 from util import mime
+from util.lazy import lazy_import
 import config
 import traceback
 from util.repr import repr_helper
 
+if TYPE_CHECKING:
+    from dateutil import parser
+    import magic
+else:
+    parser = lazy_import('dateutil.parser')
+    magic = lazy_import('magic')
 
-__shared_parser = parser.parser()
+# Upper limit on the depth of subtree queries. Prevents a cycle in the parent/child relationship
+# from causing a recursive query to run forever.
+MAX_SUBTREE_DEPTH = 64
+
+
+@cache
+def _date_parser() -> 'parser.parser':
+    """Parser shared by every entry, created on first use."""
+    return parser.parser()
+
+
+def file_size(storage_id: str | None) -> int | None:
+    """Return the size in bytes of a stored file, or None if there is no such file."""
+    if not storage_id:
+        return None
+    try:
+        return Path(config.configuration['dataRoot'], storage_id).stat().st_size
+    except OSError:
+        return None
 
 
 class Entry(Base):
     __tablename__ = "entries"
 
-    item_name: Mapped[str | None] = mapped_column(nullable=True)
-    __storage_id: Mapped[str | None] = mapped_column(nullable=True, name='storage_id')
+    # Columns which search results can be sorted by are indexed, see `Database.search`
+    item_name: Mapped[str | None] = mapped_column(nullable=True, index=True)
+    __storage_id: Mapped[str | None] = mapped_column(nullable=True, name='storage_id',
+                                                    index=True)
     tag_ids: Mapped[list[int]] = mapped_column(TagIDListDecorator, default=b'', name='tags')
     description:  Mapped[str | None] = mapped_column(nullable=True)
     transcription: Mapped[str | None] = mapped_column(nullable=True)
-    date_created_raw: Mapped[int] = mapped_column(name='date_created')
+    date_created_raw: Mapped[int] = mapped_column(name='date_created', index=True)
     __date_created_tz: Mapped[int] = mapped_column(name='date_created_tz', default=0)
-    date_digitized_raw: Mapped[int] = mapped_column(name='date_digitized')
+    date_digitized_raw: Mapped[int] = mapped_column(name='date_digitized', index=True)
     __date_digitized_tz: Mapped[int] = mapped_column(name='date_digitized_tz', default=0)
-    date_indexed_raw: Mapped[int] = mapped_column(name='date_indexed')
-    date_modified_raw: Mapped[int] = mapped_column(name='date_modified')
+    date_indexed_raw: Mapped[int] = mapped_column(name='date_indexed', index=True)
+    date_modified_raw: Mapped[int] = mapped_column(name='date_modified', index=True)
     location: Mapped[str | None] = mapped_column(nullable=True)
     __mime_type: Mapped[str | None] = mapped_column(nullable=True, name='mime_type')
     __mime_icon: Mapped[str | None] = mapped_column(nullable=True, name='mime_icon')
-    size_raw: Mapped[int | None] = mapped_column(nullable=True, name='size')
-    parent_id: Mapped[int | None] = mapped_column(ForeignKey("entries.id"), name='parent')
+    size_raw: Mapped[int | None] = mapped_column(nullable=True, name='size', index=True)
+    parent_id: Mapped[int | None] = mapped_column(ForeignKey("entries.id"), name='parent',
+                                                  index=True)
 
     def __init__(self, **kw: dict[str, Any]):
         """
@@ -61,18 +89,24 @@ class Entry(Base):
     # Getters and Setters #
     # =================== #
 
-    @property
-    def storage_id(self):
-        """Gets the storage ID. Nothing special to do here, but getter is required for setter"""
+    @hybrid_property
+    def storage_id(self):  # type: ignore
+        """
+        Gets the storage ID. Nothing special to do here, but getter is required for setter. This is
+        a hybrid property so that `Entry.storage_id` can also be used in queries.
+        """
         return self.__storage_id
 
     @storage_id.setter
     def storage_id(self, value: str):
-        """Update the storage ID. Clears out mime type and icon values."""
+        """
+        Update the storage ID. Clears out mime type and icon values, and records the size of the new
+        file straight away so that the entry sorts correctly by size.
+        """
         self.__storage_id = value
         self.__mime_type = None
         self.__mime_icon = None
-        self.size_raw = None
+        self.size_raw = file_size(value)
 
     @property
     def mime_type(self):
@@ -88,9 +122,9 @@ class Entry(Base):
             return None
         # Identify MIME
         try:
-            magic = Magic(mime=True)
+            detector = magic.Magic(mime=True)
             nested = self.__session.begin_nested()
-            self.__mime_type = magic.from_file(path)
+            self.__mime_type = detector.from_file(path)
             nested.commit()
             return self.__mime_type
         except FileNotFoundError as e:
@@ -205,7 +239,7 @@ class Entry(Base):
     def __dt_to_unix(self, dt: datetime | str) -> tuple[int, int]:
         """Convert a datetime object into a utc timestamp and timezone offset value."""
         if isinstance(dt, str):
-            dt = __shared_parser.parse(dt)
+            dt = _date_parser().parse(dt)
         offset: int = 0
         if dt.tzinfo:
             tz = dt.tzinfo.utcoffset(None)
@@ -226,7 +260,7 @@ class Entry(Base):
         """Return an object representation of the entry object suitable for transmission"""
         keys = [
             "id", "item_name", "storage_id", "description", "transcription", "date_created",
-            "date_digitized", "last_modified", "location", "tags", "mime_type", "mime_icon"
+            "date_digitized", "date_modified", "location", "tags", "mime_type", "mime_icon"
         ]
         data = {key: getattr(self, key) for key in keys}
         return data
@@ -253,6 +287,16 @@ class Entry(Base):
         self.date_modified = datetime.now().astimezone()
         self.__session.commit()
 
+    def attach_media(self, storage_id: str, size: int, mime_type: str | None):
+        """
+        Associate a file with this entry when its size and mime type are already known, for example
+        because they were computed while the file was being uploaded. This avoids re-reading the
+        file the next time `size` or `mime_type` is requested.
+        """
+        self.storage_id = storage_id
+        self.size_raw = size
+        self.__mime_type = mime_type
+
     def storage_path(self):
         """
         Return the computed path to the entry on disk. This function does not guarantee that the
@@ -268,3 +312,22 @@ class Entry(Base):
                                   '__date_created_tz', 'date_digitized_raw',
                                   '__date_digitized_tz', 'date_indexed_raw', 'date_modified_raw',
                                   'location', '__mime_type', '__mime_icon', 'size_raw'])
+
+
+def subtree(root: int, max_depth: int | None = None) -> CTE:
+    """
+    Build a recursive query which selects all descendants of an entry.
+
+    The resulting CTE has two columns, `id` and `depth`, where the direct children of `root` have a
+    depth of 1. The root entry itself is not included.
+
+    :param root: ID of the entry at the top of the tree.
+    :param max_depth: Maximum depth to descend to. Limited to `MAX_SUBTREE_DEPTH`.
+    :returns: A recursive CTE which can be selected from or used in an `IN` clause.
+    """
+    depth_limit = min(max_depth or MAX_SUBTREE_DEPTH, MAX_SUBTREE_DEPTH)
+    tree = select(Entry.id.label('id'), literal(1).label('depth')) \
+        .where(Entry.parent_id == root).cte('subtree', recursive=True)
+    children = select(Entry.id, tree.c.depth + 1) \
+        .join(tree, Entry.parent_id == tree.c.id).where(tree.c.depth < depth_limit)
+    return tree.union_all(children)
@@ -21,6 +21,18 @@ class TagDoesNotExistException(DatabaseException):
         self.args = (self.message, tag)
 
 
+class TagImplicationCycleException(DatabaseException):
+    """
+    Represents an implication which can not be added because the implied tag already implies the
+    implying tag.
+    """
+    def __init__(self, tag: str, implied: str):
+        self.message = f"{tag} can not imply {implied}, {implied} already implies {tag}"
+        self.tag = tag
+        self.implied = implied
+        self.args = (self.message, tag, implied)
+
+
 class InvalidTagException(DatabaseException):
     """
     Represents one or more tags which have been requested but do not exist in the database.
@@ -34,3 +46,52 @@ class InvalidTagException(DatabaseException):
             raise ValueError("Invalid tag exception raised with no invalid tags specified")
         self.tags = tags
         self.args = (self.message, tags)
+
+
+class InvalidFieldException(DatabaseException):
+    """
+    Represents one or more requested entry fields which do not exist.
+    """
+    def __init__(self, fields: list[str]):
+        self.message = f"Invalid field{'s' if len(fields) != 1 else ''}: {', '.join(fields)}"
+        self.fields = fields
+        self.args = (self.message, fields)
+
+
+class ArchiveException(DatabaseException):
+    """
+    Represents a failure while exporting or importing a catalog archive.
+    """
+    def __init__(self, message: str):
+        self.message = message
+        self.args = (message,)
+
+
+class BackupException(DatabaseException):
+    """
+    Represents a failure while creating a database backup.
+    """
+    def __init__(self, message: str):
+        self.message = message
+        self.args = (message,)
+
+
+class UploadException(DatabaseException):
+    """
+    Represents a failure while processing a chunked upload.
+    """
+    def __init__(self, message: str):
+        self.message = message
+        self.args = (message,)
+
+
+class UploadOffsetException(UploadException):
+    """
+    Raised when a chunk is submitted at an offset other than the current end of the upload. The
+    client should resume from `expected`.
+    """
+    def __init__(self, expected: int, offset: int):
+        self.message = f"Chunk offset {offset} does not match upload offset {expected}"
+        self.expected = expected
+        self.offset = offset
+        self.args = (self.message, expected, offset)
@@ -1,15 +1,58 @@
-import numpy as np
-from typing import Any
+from typing import TYPE_CHECKING, Any, Callable
 from sqlite3 import Connection
+from util import metrics
+from util.lazy import lazy_import
 
+if TYPE_CHECKING:
+    import numpy as np
+else:
+    np = lazy_import('numpy')
 
-def register(dbapi: Connection, _: Any):
+function_time = metrics.Histogram('library_udf_seconds', "Time spent executing statements which "
+                                  "call custom database functions", ('route',))
+function_calls = metrics.Counter('library_udf_calls_total', "Calls to custom database functions",
+                                 ('function',))
+
+# Functions can be called for every row in a table, so rather than being timed individually their
+# calls are counted per connection and recorded once per statement, see `flush_function_metrics`.
+_CALLS_KEY = 'function_calls'
+
+
+def register(dbapi: Connection, record: Any):
     """
     Register custom functions with the internal sqlite3 connection object. This is required every
     time the connection is re-established.
     """
-    dbapi.create_function('check_tags', 3, __check_tags)
-    dbapi.create_function('has_tag', 2, __has_tag)
+    calls: dict[str, list[int]] = {}
+    record.info[_CALLS_KEY] = calls
+    for name, arguments, function in (('check_tags', 3, __check_tags), ('has_tag', 2, __has_tag),
+                                      ('check_tag_groups', 3, __check_tag_groups)):
+        calls[name] = [0]
+        dbapi.create_function(name, arguments, __counted(calls[name], function))
+
+
+def flush_function_metrics(info: dict[str, Any], duration: float | None = None):
+    """
+    Record the calls to custom functions made by a connection since the last flush.
+
+    :param info: The connection's `info` dictionary.
+    :param duration: Time taken by the statement which made the calls, if known.
+    """
+    total = 0
+    for name, count in info.get(_CALLS_KEY, {}).items():
+        if count[0] > 0:
+            function_calls.inc(count[0], function=name)
+            total += count[0]
+            count[0] = 0
+    if total > 0 and duration is not None:
+        function_time.observe(duration, route=metrics.route.get())
+
+
+def __counted(count: list[int], function: Callable[..., Any]) -> Callable[..., Any]:
+    def wrapper(*args: Any):
+        count[0] += 1
+        return function(*args)
+    return wrapper
 
 
 def __check_tags(_tags: bytes, _required: bytes, _forbidden: bytes):
@@ -45,3 +88,29 @@ def __has_tag(_tags: bytes, tag: int):
     """
     tags = np.frombuffer(_tags, dtype=np.uint16)
     return tag in tags
+
+
+def __check_tag_groups(_tags: bytes, _groups: bytes, _forbidden: bytes):
+    """
+    Database function for checking if the requested set of tags contains at least one tag from each
+    group and none of the forbidden tags. Used when tag implications are expanded at query time.
+
+    :param _tags: Tags assigned to the entry being tested
+    :param _groups: Packed groups, each written as its length followed by its tags
+    :param _forbidden: Array of tags which must not be present in `_tags`
+    :returns: True if all conditions are met
+    """
+    if _tags is None:
+        _tags = b''
+    tags = np.frombuffer(_tags, dtype=np.uint16)
+    forbidden = np.frombuffer(_forbidden, dtype=np.uint16)
+    if len(_forbidden) > 0 and np.any(np.isin(tags, forbidden)):
+        return False
+    groups = np.frombuffer(_groups, dtype=np.uint16).tolist()
+    index = 0
+    while index < len(groups):
+        end = index + 1 + groups[index]
+        if not np.any(np.isin(groups[index + 1:end], tags)):
+            return False
+        index = end
+    return True
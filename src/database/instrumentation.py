@@ -0,0 +1,50 @@
+from .functions import flush_function_metrics
+from sqlalchemy import Engine, event
+from sqlalchemy.orm import Session, SessionTransaction, sessionmaker
+from typing import Any
+from util import metrics
+import time
+
+sql_time = metrics.Histogram('library_sql_seconds', "Time spent executing SQL statements",
+                             ('route',))
+sql_errors = metrics.Counter('library_sql_errors_total', "SQL statements which raised an error",
+                             ('route',))
+sessions = metrics.Counter('library_sessions_total', "Database sessions which began a transaction")
+
+
+def instrument(engine: Engine, factory: sessionmaker[Session]):
+    """
+    Record the time taken by every statement executed by an engine, and count the sessions created
+    by a session factory.
+    """
+    event.listen(engine, "before_cursor_execute", _before_execute)
+    event.listen(engine, "after_cursor_execute", _after_execute)
+    event.listen(engine, "handle_error", _handle_error)
+    event.listen(factory, "after_begin", _after_begin)
+
+
+def _before_execute(connection: Any, cursor: Any, statement: str, parameters: Any, context: Any,
+                    executemany: bool):
+    # Custom functions run while rows are fetched, which may be after the previous statement
+    # finished executing, so those calls are counted when the next statement starts
+    flush_function_metrics(connection.info)
+    connection.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_execute(connection: Any, cursor: Any, statement: str, parameters: Any, context: Any,
+                   executemany: bool):
+    duration = time.perf_counter() - connection.info['query_start'].pop()
+    sql_time.observe(duration, route=metrics.route.get())
+    flush_function_metrics(connection.info, duration)
+
+
+def _handle_error(context: Any):
+    starts = context.connection.info.get('query_start') if context.connection else None
+    if starts:
+        starts.pop()
+    sql_errors.inc(route=metrics.route.get())
+
+
+def _after_begin(session: Session, transaction: SessionTransaction, connection: Any):
+    if not transaction.nested:
+        sessions.inc()
@@ -0,0 +1,233 @@
+from .base import Base
+from .checksum import Checksum
+from .entry import Entry
+from .scrub import ScrubResult, STATUS_MISSING
+from .upload import STAGING_DIRECTORY
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime
+from hashlib import sha256
+from pathlib import Path
+from sqlalchemy import ForeignKey, delete, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Mapped, mapped_column, Session
+from typing import Any
+from util import metrics
+from util.repr import repr_helper
+from util.timer import Timer
+import config
+import os
+
+# (inode, modification time in nanoseconds, size)
+FileStat = tuple[int, int, int]
+
+
+class ManifestFile(Base):
+    """
+    Record of a file which was found under `dataRoot` the last time the data directory was
+    reconciled. Comparing a fresh scan against the manifest allows unchanged files to be skipped
+    without touching the entries table.
+    """
+    __tablename__ = "manifest"
+
+    path: Mapped[str] = mapped_column(unique=True)
+    inode: Mapped[int] = mapped_column()
+    mtime: Mapped[int] = mapped_column()
+    size: Mapped[int] = mapped_column()
+    entry_id: Mapped[int | None] = mapped_column(ForeignKey("entries.id"), nullable=True)
+
+    def __repr__(self):
+        return repr_helper(self, ['id', 'path', 'inode', 'mtime', 'size', 'entry_id'])
+
+
+class Reconciler:
+    """
+    Synchronizes the entries table with the contents of `dataRoot`.
+
+    New files get a stub entry, files which have been moved have their entry's storage id updated
+    (matched by inode, or by checksum if the inode changed), and entries whose file has disappeared
+    are flagged as missing in the scrub results table. The flag is cleared again if the file comes
+    back. Files which have been modified lose their stored checksum, so the next scrub records a
+    new one rather than reporting a mismatch.
+    """
+
+    __session: Session
+
+    def __init__(self, session: Session):
+        self.__session = session
+
+    def run(self) -> dict[str, Any]:
+        """
+        Scan the data directory and apply any changes to the database.
+
+        :returns: A report describing the changes which were made.
+        """
+        timer = Timer()
+        options = config.configuration['reconcile']
+        scanned = scan(config.configuration['dataRoot'], options['workers'])
+        manifest = {row.path: row for row in
+                    (x.tuple()[0] for x in self.__session.execute(select(ManifestFile)).all())}
+        storage = {storage_id: id for id, storage_id in (x.tuple() for x in self.__session.execute(
+            select(Entry.id, Entry.storage_id).where(Entry.storage_id.is_not(None))).all())}
+
+        report: dict[str, Any] = {
+            "scanned": len(scanned),
+            "unchanged": 0,
+            "modified": [],
+            "created": [],
+            "renamed": [],
+            "orphaned": [],
+        }
+        new_paths: list[str] = []
+        for path, stat in scanned.items():
+            row = manifest.get(path)
+            if row is None:
+                new_paths.append(path)
+            elif (row.inode, row.mtime, row.size) == stat:
+                report['unchanged'] += 1
+            else:
+                self.__modified(row, stat, storage.get(path))
+                report['modified'].append(path)
+
+        # Anything in the manifest which wasn't found has either been deleted or moved
+        vanished = {path: row for path, row in manifest.items() if path not in scanned}
+        by_inode = {row.inode: row for row in vanished.values()}
+        orphans = {storage_id: id for storage_id, id in storage.items()
+                   if storage_id not in scanned}
+        checksums = self.__orphan_checksums(list(orphans.values()))
+
+        with self.__session.begin_nested():
+            for path in new_paths:
+                stat = scanned[path]
+                entry_id = storage.get(path)
+                if entry_id is None:
+                    entry_id = self.__find_moved(path, stat, by_inode, orphans, checksums)
+                    if entry_id is not None:
+                        old_path = next(k for k, v in orphans.items() if v == entry_id)
+                        del orphans[old_path]
+                        self.__session.execute(update(Entry).where(Entry.id == entry_id)
+                                               .values({Entry.storage_id: path}))
+                        report['renamed'].append({"entry_id": entry_id, "from": old_path,
+                                                  "to": path})
+                if entry_id is None:
+                    entry_id = self.__create_stub(path, stat)
+                    report['created'].append(entry_id)
+                else:
+                    self.__clear_missing(entry_id)
+                self.__session.execute(insert(ManifestFile).values(
+                    path=path, inode=stat[0], mtime=stat[1], size=stat[2], entry_id=entry_id
+                ).on_conflict_do_update(index_elements=[ManifestFile.path], set_={
+                    'inode': stat[0], 'mtime': stat[1], 'size': stat[2], 'entry_id': entry_id}))
+            if len(vanished) > 0:
+                self.__session.execute(delete(ManifestFile)
+                                       .where(ManifestFile.path.in_(vanished.keys())))
+            for storage_id, entry_id in orphans.items():
+                self.__flag_orphan(entry_id, storage_id)
+                report['orphaned'].append(entry_id)
+        self.__session.commit()
+        report['time'] = timer.get_time()
+        return report
+
+    # ================ #
+    # Internal Helpers #
+    # ================ #
+
+    def __modified(self, row: ManifestFile, stat: FileStat, entry_id: int | None):
+        """Update the manifest and drop cached file information for a file which has changed."""
+        row.inode, row.mtime, row.size = stat
+        if entry_id is not None:
+            row.entry_id = entry_id
+            entry = self.__session.get(Entry, entry_id)
+            if entry and entry.storage_id:
+                # Re-assigning the storage id clears the cached mime type
+                entry.storage_id = entry.storage_id
+                entry.size_raw = stat[2]
+                # The file was changed on purpose, the old checksum and scrub result no longer apply
+                self.__session.execute(delete(Checksum).where(Checksum.entry_id == entry_id))
+                self.__session.execute(delete(ScrubResult).where(ScrubResult.entry_id == entry_id))
+
+    def __orphan_checksums(self, entry_ids: list[int]) -> dict[tuple[int, str], int]:
+        """Return a map of (size, checksum) to entry id for entries whose file is missing."""
+        if len(entry_ids) == 0:
+            return {}
+        query = select(Checksum.size, Checksum.sha256, Checksum.entry_id) \
+            .where(Checksum.entry_id.in_(entry_ids))
+        return {(size, digest): id for size, digest, id in
+                (x.tuple() for x in self.__session.execute(query).all())}
+
+    def __find_moved(self, path: str, stat: FileStat, by_inode: dict[int, ManifestFile],
+                     orphans: dict[str, int], checksums: dict[tuple[int, str], int]):
+        """Attempt to identify the entry a new file belonged to before it was moved."""
+        previous = by_inode.get(stat[0])
+        if previous is not None and previous.size == stat[2] and previous.path in orphans:
+            return orphans[previous.path]
+        # Only hash the file if an orphan of the same size has a known checksum
+        if not any(size == stat[2] for size, _ in checksums):
+            return None
+        hasher = sha256()
+        with open(Path(config.configuration['dataRoot'], path), 'rb') as file, \
+                metrics.file_io.time(operation='reconcile_read'):
+            while chunk := file.read(1024 * 1024):
+                hasher.update(chunk)
+        entry_id = checksums.pop((stat[2], hasher.hexdigest()), None)
+        if entry_id is not None and entry_id in orphans.values():
+            return entry_id
+        return None
+
+    def __create_stub(self, path: str, stat: FileStat) -> int:
+        """Create a minimal entry for a newly discovered file."""
+        modified = datetime.fromtimestamp(stat[1] / 1e9).astimezone()
+        entry = Entry(item_name=Path(path).name, date_created=modified)
+        entry.storage_id = path
+        entry.size_raw = stat[2]
+        self.__session.add(entry)
+        self.__session.flush()
+        return entry.id
+
+    def __clear_missing(self, entry_id: int):
+        """Remove the missing flag from an entry whose file has been found again."""
+        self.__session.execute(delete(ScrubResult).where(
+            ScrubResult.entry_id == entry_id, ScrubResult.status == STATUS_MISSING))
+
+    def __flag_orphan(self, entry_id: int, storage_id: str):
+        """Record that an entry's file could not be found."""
+        now = int(datetime.now().timestamp())
+        detail = f"{storage_id} not found while reconciling"
+        self.__session.execute(insert(ScrubResult).values(
+            entry_id=entry_id, status=STATUS_MISSING, detail=detail, date_checked=now
+        ).on_conflict_do_update(index_elements=[ScrubResult.entry_id], set_={
+            'status': STATUS_MISSING, 'detail': detail, 'date_checked': now}))
+
+
+def scan(root: str, workers: int) -> dict[str, FileStat]:
+    """
+    Recursively list every regular file under `root`. Each directory is listed by a separate task
+    so that large trees (particularly on network storage) can be read in parallel.
+
+    :param root: Directory to scan.
+    :param workers: Number of directories to list simultaneously.
+    :returns: A map of paths relative to `root` to file information.
+    """
+    def scan_directory(relative: str):
+        files: list[tuple[str, FileStat]] = []
+        directories: list[str] = []
+        with os.scandir(os.path.join(root, relative)) as iterator:
+            for item in iterator:
+                path = f"{relative}/{item.name}" if relative else item.name
+                if item.is_dir(follow_symlinks=False):
+                    if path != STAGING_DIRECTORY:
+                        directories.append(path)
+                elif item.is_file():
+                    stat = item.stat()
+                    files.append((path, (stat.st_ino, stat.st_mtime_ns, stat.st_size)))
+        return files, directories
+
+    result: dict[str, FileStat] = {}
+    with ThreadPoolExecutor(workers, "reconcile-scan") as pool:
+        pending: set[Future[Any]] = {pool.submit(scan_directory, "")}
+        while len(pending) > 0:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, directories = future.result()
+                result.update(files)
+                pending.update(pool.submit(scan_directory, x) for x in directories)
+    return result
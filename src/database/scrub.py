@@ -0,0 +1,243 @@
+from .base import Base
+from .checksum import Checksum
+from .entry import Entry
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from pathlib import Path
+from sqlalchemy import ForeignKey, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Mapped, mapped_column, Session, sessionmaker
+from threading import Event, Lock, Thread
+from typing import Any
+from util import metrics
+from util.ratelimit import RateLimiter
+from util.repr import repr_helper
+import config
+import time
+import traceback
+
+# Number of bytes read from a file at a time while computing its checksum.
+READ_SIZE = 1024 * 1024
+
+STATUS_OK = "ok"
+STATUS_MISSING = "missing"
+STATUS_SIZE_MISMATCH = "size_mismatch"
+STATUS_CHECKSUM_MISMATCH = "checksum_mismatch"
+STATUS_ERROR = "error"
+
+
+class ScrubResult(Base):
+    """
+    Outcome of the most recent integrity check of an entry's media.
+    """
+    __tablename__ = "scrub_results"
+
+    entry_id: Mapped[int] = mapped_column(ForeignKey("entries.id"), unique=True)
+    status: Mapped[str] = mapped_column()
+    detail: Mapped[str | None] = mapped_column(nullable=True)
+    date_checked: Mapped[int] = mapped_column()
+
+    def as_object(self):
+        """Convert the result into a transmissible object."""
+        obj_fields = ['entry_id', 'status', 'detail', 'date_checked']
+        return {key: getattr(self, key) for key in obj_fields}
+
+    def __repr__(self):
+        return repr_helper(self, ['id', 'entry_id', 'status', 'detail', 'date_checked'])
+
+
+class ScrubCheckpoint(Base):
+    """
+    Progress of the current scrub pass. Entries are checked in order of increasing id, so storing
+    the last id which was verified is enough to resume an interrupted pass.
+    """
+    __tablename__ = "scrub_checkpoint"
+
+    last_entry_id: Mapped[int] = mapped_column(default=0)
+    passes: Mapped[int] = mapped_column(default=0)
+    date_started: Mapped[int] = mapped_column()
+    date_updated: Mapped[int] = mapped_column()
+
+    def __repr__(self):
+        return repr_helper(self, ['id', 'last_entry_id', 'passes', 'date_started',
+                                  'date_updated'])
+
+
+# (entry id, storage id, cached size, stored checksum, stored checksum size)
+ScrubTarget = tuple[int, str, int | None, str | None, int | None]
+# (entry id, status, detail, computed checksum, actual size)
+ScrubOutcome = tuple[int, str, str | None, str | None, int | None]
+
+
+class Scrubber:
+    """
+    Background job which walks every entry with associated media and verifies that the file
+    exists, has the expected size and matches its stored checksum. Files are verified in parallel
+    by a pool of worker threads, with disk reads throttled by a shared rate limiter so that the
+    scrub does not starve user traffic.
+
+    Entries without a stored checksum have one recorded the first time they are scrubbed.
+    """
+
+    __sessions: sessionmaker[Session]
+    __thread: Thread | None
+    __stop: Event
+    __lock: Lock
+    __status: dict[str, Any]
+
+    def __init__(self, sessions: sessionmaker[Session]):
+        self.__sessions = sessions
+        self.__thread = None
+        self.__stop = Event()
+        self.__lock = Lock()
+        self.__status = {"running": False}
+
+    def start(self, continuous: bool = False):
+        """
+        Start scrubbing in the background, resuming from the last checkpoint.
+
+        :param continuous: Start a new pass after `interval` seconds once a pass completes instead
+            of stopping.
+        :returns: False if a scrub is already running.
+        """
+        with self.__lock:
+            if self.__thread and self.__thread.is_alive():
+                return False
+            self.__stop.clear()
+            self.__status = {
+                "running": True,
+                "continuous": continuous,
+                "checked": 0,
+                "bytes_read": 0,
+                "failures": 0,
+                "date_started": int(time.time()),
+            }
+            self.__thread = Thread(target=self.__run, args=(continuous,), daemon=True,
+                                   name="scrubber")
+            self.__thread.start()
+            return True
+
+    def stop(self):
+        """Request that the scrub stop. Any partially verified batch will be re-checked."""
+        self.__stop.set()
+
+    def status(self) -> dict[str, Any]:
+        """Return a snapshot of the progress of the current (or last) scrub."""
+        with self.__lock:
+            status = dict(self.__status)
+        with self.__sessions() as session:
+            checkpoint = session.get(ScrubCheckpoint, 1)
+            if checkpoint:
+                status['last_entry_id'] = checkpoint.last_entry_id
+                status['passes'] = checkpoint.passes
+        return status
+
+    # ================ #
+    # Internal Helpers #
+    # ================ #
+
+    def __run(self, continuous: bool):
+        options = config.configuration['scrub']
+        limiter = RateLimiter(options['maxBytesPerSecond'])
+        try:
+            with ThreadPoolExecutor(options['workers'], "scrub-worker") as pool:
+                while not self.__stop.is_set():
+                    with self.__sessions() as session:
+                        checkpoint = self.__checkpoint(session)
+                        batch = self.__next_batch(session, checkpoint.last_entry_id,
+                                                  options['batchSize'])
+                        if len(batch) == 0:
+                            checkpoint.last_entry_id = 0
+                            checkpoint.passes += 1
+                            checkpoint.date_started = int(time.time())
+                            session.commit()
+                            if not continuous:
+                                break
+                            self.__stop.wait(options['interval'])
+                            continue
+                    outcomes = list(pool.map(lambda t: self.__verify(t, limiter), batch))
+                    if self.__stop.is_set():
+                        # The batch may have been cut short, don't record partial results
+                        break
+                    with self.__sessions() as session:
+                        self.__record(session, batch, outcomes)
+        except Exception as e:
+            traceback.print_exception(e)
+            with self.__lock:
+                self.__status['error'] = f"{type(e).__name__}: {e}"
+        finally:
+            with self.__lock:
+                self.__status['running'] = False
+
+    def __checkpoint(self, session: Session):
+        checkpoint = session.get(ScrubCheckpoint, 1)
+        if not checkpoint:
+            now = int(time.time())
+            checkpoint = ScrubCheckpoint(id=1, last_entry_id=0, passes=0, date_started=now,
+                                         date_updated=now)
+            session.add(checkpoint)
+            session.commit()
+        return checkpoint
+
+    def __next_batch(self, session: Session, after: int, count: int) -> list[ScrubTarget]:
+        query = select(Entry.id, Entry.storage_id, Entry.size_raw, Checksum.sha256, Checksum.size) \
+            .outerjoin(Checksum, Checksum.entry_id == Entry.id) \
+            .where(Entry.storage_id.is_not(None), Entry.id > after) \
+            .order_by(Entry.id).limit(count)
+        return [x.tuple() for x in session.execute(query).all()]  # type: ignore
+
+    def __verify(self, target: ScrubTarget, limiter: RateLimiter) -> ScrubOutcome:
+        """Verify a single file. Runs on a worker thread and must not touch the database."""
+        entry_id, storage_id, cached_size, stored_sha256, stored_size = target
+        path = Path(config.configuration['dataRoot'], storage_id)
+        try:
+            size = path.stat().st_size
+            expected_size = stored_size if stored_size is not None else cached_size
+            if expected_size is not None and size != expected_size:
+                return (entry_id, STATUS_SIZE_MISMATCH,
+                        f"Expected {expected_size} bytes got {size}", None, size)
+            hasher = sha256()
+            with path.open('rb') as file:
+                while not self.__stop.is_set():
+                    limiter.acquire(READ_SIZE)
+                    with metrics.file_io.time(operation='scrub_read'):
+                        chunk = file.read(READ_SIZE)
+                    if not chunk:
+                        break
+                    metrics.file_io_bytes.inc(len(chunk), operation='scrub_read')
+                    hasher.update(chunk)
+                    with self.__lock:
+                        self.__status['bytes_read'] += len(chunk)
+            digest = hasher.hexdigest()
+            if stored_sha256 is not None and digest != stored_sha256:
+                return (entry_id, STATUS_CHECKSUM_MISMATCH,
+                        f"Expected {stored_sha256} got {digest}", digest, size)
+            return (entry_id, STATUS_OK, None, digest, size)
+        except FileNotFoundError:
+            return (entry_id, STATUS_MISSING, f"{path} does not exist", None, None)
+        except OSError as e:
+            return (entry_id, STATUS_ERROR, f"{type(e).__name__}: {e}", None, None)
+
+    def __record(self, session: Session, batch: list[ScrubTarget], outcomes: list[ScrubOutcome]):
+        """Save the results of a batch and advance the checkpoint in a single transaction."""
+        now = int(time.time())
+        failures = 0
+        for target, (entry_id, status, detail, digest, size) in zip(batch, outcomes):
+            statement = insert(ScrubResult).values(entry_id=entry_id, status=status,
+                                                   detail=detail, date_checked=now)
+            session.execute(statement.on_conflict_do_update(
+                index_elements=[ScrubResult.entry_id],
+                set_={'status': status, 'detail': detail, 'date_checked': now}))
+            if status != STATUS_OK:
+                failures += 1
+            elif target[3] is None and digest is not None and size is not None:
+                # First time this file has been seen, record a baseline checksum
+                session.add(Checksum(entry_id=entry_id, sha256=digest, size=size,
+                                     date_computed=now))
+        checkpoint = self.__checkpoint(session)
+        checkpoint.last_entry_id = batch[-1][0]
+        checkpoint.date_updated = now
+        session.commit()
+        with self.__lock:
+            self.__status['checked'] += len(batch)
+            self.__status['failures'] += failures
@@ -1,8 +1,13 @@
-from .types import SearchParameters
-from dateutil import parser
-from typing import TypeAlias, Literal
+from .types import SearchParameters, SortField
+from typing import TYPE_CHECKING, TypeAlias, Literal, cast, get_args
+from util.lazy import lazy_import
 import time
 
+if TYPE_CHECKING:
+    from dateutil import parser
+else:
+    parser = lazy_import('dateutil.parser')
+
 
 def parse_search(query: str) -> tuple[SearchParameters, list[str]]:
     """
@@ -46,6 +51,22 @@ def __parse_special(token: str, params: SearchParameters, issues: list[str]):
     special_datetime('since_indexed')
     special_datetime('until_indexed')
 
+    if command == "under":
+        try:
+            params['under'] = int(value)
+        except ValueError:
+            issues.append(f"{value} is not a valid entry id")
+
+    if command == "sort":
+        # A leading hyphen sorts in descending order, for example `sort:-date_created`
+        field = value.removeprefix("-")
+        if field in get_args(SortField):
+            params['sort'] = cast(SortField, field)
+            params['sort_descending'] = value.startswith("-")
+        else:
+            issues.append(f"Can not sort by {field}, expected one of "
+                          f"{', '.join(get_args(SortField))}")
+
     if command == "page":
         try:
             params['page'] = int(value)
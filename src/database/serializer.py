@@ -0,0 +1,132 @@
+from .entry import Entry
+from .tag import Tag
+from database.exceptions import InvalidFieldException
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import ColumnElement, Select, select
+from sqlalchemy.orm import Session
+from typing import Any, Callable, Iterable, Sequence
+
+Converter = Callable[..., Any]
+
+
+def __date(raw: int | None, tz: int | None = 0) -> str | None:
+    """Convert a unix timestamp and timezone offset into an ISO 8601 string."""
+    if raw is None:
+        return None
+    return datetime.fromtimestamp(raw, timezone(timedelta(seconds=tz or 0))).isoformat()
+
+
+__table = Entry.__table__.c
+
+# Map of field names to the columns required to produce the field and an optional function to
+# convert the column values into the transmitted value. Fields without a converter must select
+# exactly one column, which is transmitted as-is.
+FIELDS: dict[str, tuple[tuple[ColumnElement[Any], ...], Converter | None]] = {
+    'id': ((__table.id,), None),
+    'item_name': ((__table.item_name,), None),
+    'storage_id': ((__table.storage_id,), None),
+    'description': ((__table.description,), None),
+    'transcription': ((__table.transcription,), None),
+    'date_created': ((__table.date_created, __table.date_created_tz), __date),
+    'date_digitized': ((__table.date_digitized, __table.date_digitized_tz), __date),
+    'date_indexed': ((__table.date_indexed,), __date),
+    'date_modified': ((__table.date_modified,), __date),
+    'location': ((__table.location,), None),
+    'mime_type': ((__table.mime_type,), None),
+    'mime_icon': ((__table.mime_icon,), None),
+    'size': ((__table.size,), None),
+    'parent_id': ((__table.parent,), None),
+    # Tag names are resolved for the whole result set at once, see `EntrySerializer.serialize`
+    'tags': ((__table.tags,), None),
+}
+
+DEFAULT_FIELDS = [
+    "id", "item_name", "storage_id", "description", "transcription", "date_created",
+    "date_digitized", "date_modified", "location", "tags", "mime_type", "mime_icon"
+]
+
+
+def parse_fields(fields: str | None) -> list[str]:
+    """
+    Parse a comma separated list of field names.
+
+    :param fields: Field list from a request, or `None` to use the default fields.
+    :raises InvalidFieldException: If any of the fields are not known.
+    :returns: A list of field names.
+    """
+    if fields is None or fields.strip() == '':
+        return DEFAULT_FIELDS
+    names = [x.strip() for x in fields.split(',') if x.strip() != '']
+    invalid = [x for x in names if x not in FIELDS]
+    if len(invalid) > 0:
+        raise InvalidFieldException(invalid)
+    return list(dict.fromkeys(names))
+
+
+class EntrySerializer:
+    """
+    Converts entries into transmissible dictionaries without loading them as ORM objects.
+
+    Only the columns needed for the requested fields are selected, and no lazy properties (such as
+    `Entry.mime_type`) are evaluated, so the cost of building a response depends only on which
+    fields were asked for. Values which have not been computed yet are transmitted as `None`.
+    """
+
+    __fields: list[str]
+    __columns: list[ColumnElement[Any]]
+    __slices: list[tuple[str, int, int, Converter | None]]
+    __tags_index: int | None
+
+    def __init__(self, fields: Sequence[str]):
+        """
+        :param fields: Names of the fields to include, as returned by `parse_fields`.
+        """
+        self.__fields = list(fields)
+        self.__columns = []
+        self.__slices = []
+        self.__tags_index = None
+        for field in self.__fields:
+            columns, converter = FIELDS[field]
+            start = len(self.__columns)
+            self.__columns.extend(columns)
+            self.__slices.append((field, start, len(self.__columns), converter))
+            if field == 'tags':
+                self.__tags_index = start
+
+    def select(self) -> Select[Any]:
+        """Return a select statement for the columns required by the requested fields."""
+        return select(*self.__columns)
+
+    def serialize(self, session: Session, rows: Iterable[Sequence[Any]]) -> list[dict[str, Any]]:
+        """
+        Convert rows returned by a statement built from `select` into dictionaries.
+
+        :param session: Session used to resolve tag names, if requested.
+        :param rows: Rows to convert.
+        """
+        rows = list(rows)
+        tag_names = self.__tag_names(session, rows)
+        result: list[dict[str, Any]] = []
+        for row in rows:
+            obj: dict[str, Any] = {}
+            for field, start, end, converter in self.__slices:
+                if converter is not None:
+                    obj[field] = converter(*row[start:end])
+                elif field == 'tags':
+                    obj[field] = [tag_names[x] for x in row[start] or [] if x in tag_names]
+                else:
+                    obj[field] = row[start]
+            result.append(obj)
+        return result
+
+    def __tag_names(self, session: Session, rows: list[Sequence[Any]]) -> dict[int, str]:
+        """Resolve the names of every tag referenced by a set of rows in a single query."""
+        if self.__tags_index is None:
+            return {}
+        ids: set[int] = set()
+        for row in rows:
+            ids.update(row[self.__tags_index] or [])
+        if len(ids) == 0:
+            return {}
+        query = select(Tag.id, Tag.name).where(Tag.id.in_(ids))
+        return {id: name for id, name in (x.tuple() for x in session.execute(query).all())}
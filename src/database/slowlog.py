@@ -0,0 +1,114 @@
+from collections import deque
+from sqlalchemy import Engine, event
+from threading import Lock
+from typing import Any
+from util import encoding, metrics
+import config
+import time
+import traceback
+
+# Longest binary parameter (in bytes) included in a record. Longer values are truncated.
+MAX_BLOB_PREVIEW = 64
+
+
+def _parameter(value: Any) -> Any:
+    """Convert a bound parameter into a JSON native value."""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        data = bytes(value)
+        suffix = "..." if len(data) > MAX_BLOB_PREVIEW else ""
+        return f"<{len(data)} bytes: {data[:MAX_BLOB_PREVIEW].hex()}{suffix}>"
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_parameter(x) for x in value]  # type: ignore
+    if isinstance(value, dict):
+        return {str(k): _parameter(v) for k, v in value.items()}  # type: ignore
+    return repr(value)
+
+
+class SlowQueryLog:
+    """
+    Records SQL statements which take longer than `slowQueries.threshold` seconds to execute.
+
+    Each record holds the statement, its bound parameters, how long it took, the route which issued
+    it and the output of `EXPLAIN QUERY PLAN`, which shows whether SQLite used an index or had to
+    scan a whole table. The most recent `slowQueries.capacity` records are kept in memory, and every
+    record is also appended to `slowQueries.logFile` as a line of JSON if a log file is configured.
+
+    Only the time spent executing the statement is measured. Rows streamed to the caller afterwards
+    (for example with `yield_per`) are not included.
+    """
+
+    __lock: Lock
+    __records: deque[dict[str, Any]]
+
+    def __init__(self):
+        self.__lock = Lock()
+        self.__records = deque(maxlen=max(config.configuration['slowQueries']['capacity'], 1))
+
+    def attach(self, engine: Engine):
+        """Start recording slow statements executed by an engine."""
+        event.listen(engine, "before_cursor_execute", self.__before_execute)
+        event.listen(engine, "after_cursor_execute", self.__after_execute)
+
+    def records(self, count: int | None = None) -> list[dict[str, Any]]:
+        """Return up to `count` of the most recent slow statements, newest first."""
+        with self.__lock:
+            records = list(reversed(self.__records))
+        return records if count is None else records[:count]
+
+    def clear(self):
+        """Discard every record held in memory. The log file is not modified."""
+        with self.__lock:
+            self.__records.clear()
+
+    # ================ #
+    # Internal Helpers #
+    # ================ #
+
+    def __before_execute(self, connection: Any, cursor: Any, statement: str, parameters: Any,
+                         context: Any, executemany: bool):
+        context.slow_query_start = time.perf_counter()
+
+    def __after_execute(self, connection: Any, cursor: Any, statement: str, parameters: Any,
+                        context: Any, executemany: bool):
+        duration = time.perf_counter() - context.slow_query_start
+        options = config.configuration['slowQueries']
+        if duration < options['threshold']:
+            return
+        record = {
+            "date": int(time.time()),
+            "duration": duration,
+            "route": metrics.route.get(),
+            "statement": statement,
+            "parameters": _parameter(parameters),
+            "plan": None if executemany else self.__explain(cursor, statement, parameters)
+        }
+        with self.__lock:
+            self.__records.append(record)
+        if options['logFile']:
+            try:
+                with open(options['logFile'], 'ab') as file:
+                    file.write(encoding.dumps(record) + b'\n')
+            except OSError as e:
+                traceback.print_exception(e)
+
+    def __explain(self, cursor: Any, statement: str, parameters: Any) -> list[str] | None:
+        """Return the query plan for a statement, indented to show its structure."""
+        if not statement.lstrip().upper().startswith(("SELECT", "WITH", "UPDATE", "DELETE")):
+            return None
+        try:
+            # A separate cursor is used as the original may still have rows waiting to be read
+            explain = cursor.connection.cursor()
+            try:
+                rows = explain.execute(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+            finally:
+                explain.close()
+        except Exception as e:
+            return [f"Unable to explain statement: {e}"]
+        depth: dict[int, int] = {0: -1}
+        plan: list[str] = []
+        for id, parent, _, detail in rows:
+            depth[id] = depth.get(parent, -1) + 1
+            plan.append("  " * depth[id] + detail)
+        return plan
@@ -6,12 +6,20 @@ from sqlalchemy.orm import Mapped, mapped_column, Session
 from sqlalchemy.sql import select, func
 from sqlalchemy.types import TypeDecorator, BLOB
 from sqlalchemy.exc import NoResultFound
-from typing import Optional, SupportsIndex, cast, Callable
-import numpy as np
+from typing import TYPE_CHECKING, Optional, SupportsIndex, cast, Callable
+from util.lazy import lazy_import
+import config
 
 from util.repr import repr_helper
 
-_TAG_TYPE = np.uint16
+if TYPE_CHECKING:
+    from .taxonomy import Taxonomy
+    import numpy as np
+else:
+    np = lazy_import('numpy')
+
+# Given by name so that numpy is not imported until tags are actually packed or unpacked
+_TAG_TYPE = 'uint16'
 
 
 class Tag(Base):
@@ -22,7 +30,7 @@ class Tag(Base):
 
     def as_object(self):
         """Convert the tag into a transmissible object."""
-        obj_fields = ['name', 'count']
+        obj_fields = ['id', 'name', 'count']
         return {key: getattr(self, key) for key in obj_fields}
 
     def __repr__(self):
@@ -88,6 +96,13 @@ class TagList():
             self.__id_list.append(tag.id)
             tag.count += 1
             self.__mark_dirty()
+        _record_edit(self.__session, tag.id, self.__id_list, 1)
+        # Implied tags are stored on the entry when the taxonomy is configured to materialize them
+        taxonomy = _materializing_taxonomy(self.__session)
+        if taxonomy:
+            for implied in taxonomy.implied(self.__session, tag.id):
+                if implied not in self.__id_list:
+                    self.add(self.__session.get_one(Tag, implied))
 
     def remove(self, tag: Tag | str):
         """
@@ -106,6 +121,7 @@ class TagList():
             self.__id_list.remove(tag.id)
             tag.count -= 1
             self.__mark_dirty()
+        _record_edit(self.__session, tag.id, self.__id_list, -1)
 
     def replace(self, old_tag: Tag | str, new_tag: Tag | str):
         """
@@ -186,6 +202,12 @@ class TagList():
         tags = cast(list[Tag], tags)
 
         incoming = set(tags)
+        # Tags implied by the new tags are part of the new list too, otherwise an implied tag which
+        # was already present would be removed again
+        taxonomy = _materializing_taxonomy(self.__session)
+        if taxonomy:
+            implied = {x for tag in incoming for x in taxonomy.implied(self.__session, tag.id)}
+            incoming.update(self.__session.get_one(Tag, x) for x in implied)
         existing = set(self.all())
         new_tags = incoming - existing
         deleted_tags = existing - incoming
@@ -199,9 +221,44 @@ class TagList():
         return f"TagList({self.all()})"
 
 
+TAG_EDITS_KEY = "tag_edits"
+TAXONOMY_KEY = "taxonomy"
+
+
+def _taxonomy(session: Session) -> 'Taxonomy | None':
+    """Return the taxonomy made available to a session by `Database`, if any."""
+    return session.info.get(TAXONOMY_KEY)
+
+
+def _materializing_taxonomy(session: Session) -> 'Taxonomy | None':
+    """Return the session's taxonomy if implied tags are to be stored on entries."""
+    if config.configuration['taxonomy']['implications'] != 'materialize':
+        return None
+    return _taxonomy(session)
+
+
+def _resolve_aliases(session: Session, names: set[str]) -> dict[str, int]:
+    """Map any of a set of names which are tag aliases to the id of the tag they refer to."""
+    taxonomy = _taxonomy(session)
+    if taxonomy is None:
+        return {}
+    resolved = {name: taxonomy.resolve_alias(session, name) for name in names}
+    return {name: id for name, id in resolved.items() if id is not None}
+
+
+def _record_edit(session: Session, tag_id: int, id_list: list[int], delta: int):
+    """
+    Remember that a tag was added to (`delta` = 1) or removed from (`delta` = -1) a tag list so that
+    derived data such as the co-occurrence matrix can be updated once the change is committed. The
+    edits are stored in `session.info[TAG_EDITS_KEY]`.
+    """
+    others = [x for x in id_list if x != tag_id]
+    session.info.setdefault(TAG_EDITS_KEY, []).append((tag_id, others, delta))
+
+
 def get_tag(session: Session, tag: str) -> Tag:
     """
-    Resolve a tag name to a tag object.
+    Resolve a tag name or alias to a tag object.
 
     :param tag: Tag name to resolve.
     :raises InvalidTagException: If the tag name can not be resolved.
@@ -210,12 +267,15 @@ def get_tag(session: Session, tag: str) -> Tag:
     try:
         return session.execute(select(Tag).where(Tag.name == tag)).one()[0]
     except NoResultFound:
+        aliases = _resolve_aliases(session, {tag})
+        if tag in aliases:
+            return session.get_one(Tag, aliases[tag])
         raise InvalidTagException([tag])
 
 
 def get_tags(session: Session, tags: list[str]) -> list[Tag]:
     """
-    Resolve a list of tag names to a list of tag objects.
+    Resolve a list of tag names or aliases to a list of tag objects.
 
     :param tag: List of tag names to resolve.
     :raises InvalidTagException: If any of the tag names can not be resolved.
@@ -225,8 +285,15 @@ def get_tags(session: Session, tags: list[str]) -> list[Tag]:
     result = session.execute(select(Tag).where(Tag.name.in_(tags_deduplicated))).all()
     result_tags = [x.tuple()[0] for x in result]
     if len(result_tags) != len(tags_deduplicated):
-        bad_tags = tags_deduplicated - set([x.name for x in result_tags])
-        raise InvalidTagException(list(bad_tags))
+        missing = tags_deduplicated - set([x.name for x in result_tags])
+        aliases = _resolve_aliases(session, missing)
+        bad_tags = missing - set(aliases.keys())
+        if len(bad_tags) > 0:
+            raise InvalidTagException(list(bad_tags))
+        # Several names may refer to the same tag
+        known = set(x.id for x in result_tags)
+        for id in set(aliases.values()) - known:
+            result_tags.append(session.get_one(Tag, id))
     return result_tags
 
 
@@ -253,9 +320,13 @@ def get_tag_ids_multiple(session: Session, tags: list[list[str]]) -> list[bytes]
     result: list[bytes] = []
     for t in tags:
         query_result = session.execute(select(Tag.id, Tag.name).where(Tag.name.in_(t))).all()
+        ids = [tag[0] for tag in query_result]
         if len(query_result) != len(t):
-            bad_tags.extend(set(t) - set([tag[1] for tag in query_result]))
-        result.append(np.array([tag[0] for tag in query_result], _TAG_TYPE).tobytes())
+            missing = set(t) - set([tag[1] for tag in query_result])
+            aliases = _resolve_aliases(session, missing)
+            bad_tags.extend(missing - set(aliases.keys()))
+            ids.extend(aliases.values())
+        result.append(np.array(sorted(set(ids)), _TAG_TYPE).tobytes())
     if len(bad_tags) > 0:
         raise InvalidTagException(bad_tags)
     return result
@@ -0,0 +1,97 @@
+from .base import Base
+from .tag import Tag
+from .taxonomy import TagAlias, TagImplication
+from sqlalchemy import Connection, delete, event, func, insert, select
+from sqlalchemy.orm import Mapped, Session, UOWTransaction, mapped_column
+from typing import Any
+
+from util.repr import repr_helper
+
+# Set in `session.info` to the (old version, new version) pairs of each flush which changed tags
+TAG_VERSIONS_KEY = "tag_versions"
+
+
+class TagChange(Base):
+    """
+    Records the most recent change to each tag. The id of a change is the tag table version at
+    which it was made, so the current version is the largest id and the tags which have changed
+    since a version are those with a larger id. Only the latest change to each tag is kept.
+    """
+    __tablename__ = "tag_changes"
+    # Ids must never be reused, otherwise versions could go backwards after a deletion
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    tag_id: Mapped[int] = mapped_column(index=True, unique=True)
+    deleted: Mapped[bool] = mapped_column(default=False)
+
+    def __repr__(self):
+        return repr_helper(self, ["id", "tag_id", "deleted"])
+
+
+def tag_version(session: Session | Connection) -> int:
+    """Return the current version of the tag table."""
+    return session.execute(select(func.max(TagChange.id))).scalar() or 0
+
+
+def tag_changes(session: Session, since: int):
+    """
+    Find the tags which have changed since a version.
+
+    :param session: Session to query.
+    :param since: Version previously returned by `tag_version`.
+    :returns: A list of tags which have been created or modified, and a list of deleted tag ids.
+    """
+    query = select(TagChange.tag_id, TagChange.deleted, Tag) \
+        .outerjoin(Tag, Tag.id == TagChange.tag_id) \
+        .where(TagChange.id > since)
+    changed: list[Tag] = []
+    deleted: list[int] = []
+    for tag_id, is_deleted, tag in (x.tuple() for x in session.execute(query).all()):
+        if is_deleted or tag is None:
+            deleted.append(tag_id)
+        else:
+            changed.append(tag)
+    return changed, deleted
+
+
+def seed_tag_changes(session: Session):
+    """
+    Record a change for every tag without one. Used when tags have been inserted without the ORM,
+    and to initialize databases created before changes were tracked.
+    """
+    recorded = select(TagChange.tag_id)
+    session.execute(insert(TagChange).from_select(
+        ["tag_id"], select(Tag.id).where(Tag.id.not_in(recorded)).order_by(Tag.id)))
+
+
+def _record_changes(session: Session, context: UOWTransaction):
+    """
+    Bump the version of every tag created, modified or deleted by a flush, and of every tag whose
+    aliases or implications were changed.
+    """
+    changes: dict[int, bool] = {}
+    for tag in session.new:
+        if isinstance(tag, Tag):
+            changes[tag.id] = False
+    for tag in session.dirty:
+        if isinstance(tag, Tag) and session.is_modified(tag, include_collections=False):
+            changes[tag.id] = False
+    for tag in session.deleted:
+        if isinstance(tag, Tag):
+            changes[tag.id] = True
+    for objects in (session.new, session.dirty, session.deleted):
+        for item in objects:
+            if isinstance(item, (TagAlias, TagImplication)):
+                changes.setdefault(item.tag_id, False)
+    if len(changes) == 0:
+        return
+    connection = session.connection()
+    old_version = tag_version(connection)
+    connection.execute(delete(TagChange).where(TagChange.tag_id.in_(changes.keys())))
+    rows: list[dict[str, Any]] = [{"tag_id": id, "deleted": deleted}
+                                  for id, deleted in changes.items()]
+    connection.execute(insert(TagChange), rows)
+    session.info.setdefault(TAG_VERSIONS_KEY, []).append((old_version, tag_version(connection)))
+
+
+event.listen(Session, "after_flush", _record_changes)
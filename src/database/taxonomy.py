@@ -0,0 +1,179 @@
+from __future__ import annotations
+from .base import Base
+from .tag import TAXONOMY_KEY
+from sqlalchemy import ForeignKey, UniqueConstraint, select
+from sqlalchemy.orm import Mapped, Session, mapped_column
+from threading import RLock
+from typing import TYPE_CHECKING, Any, Literal
+from util import metrics
+from util.lazy import lazy_import
+from util.repr import repr_helper
+
+if TYPE_CHECKING:
+    import numpy as np
+else:
+    np = lazy_import('numpy')
+
+_TAG_TYPE = 'uint16'
+
+ImplicationMode = Literal['expand', 'materialize']
+
+
+class TagAlias(Base):
+    """
+    Alternative name for a tag. Aliases are resolved to their tag wherever a tag name is accepted.
+    """
+    __tablename__ = "tag_aliases"
+
+    name: Mapped[str] = mapped_column(unique=True)
+    tag_id: Mapped[int] = mapped_column(ForeignKey("tags.id"), index=True)
+
+    def __repr__(self):
+        return repr_helper(self, ["id", "name", "tag_id"])
+
+
+class TagImplication(Base):
+    """
+    States that any entry tagged with `tag_id` is also implicitly tagged with `implied_id`.
+    """
+    __tablename__ = "tag_implications"
+    __table_args__ = (UniqueConstraint("tag_id", "implied_id"),)
+
+    tag_id: Mapped[int] = mapped_column(ForeignKey("tags.id"), index=True)
+    implied_id: Mapped[int] = mapped_column(ForeignKey("tags.id"), index=True)
+
+    def __repr__(self):
+        return repr_helper(self, ["id", "tag_id", "implied_id"])
+
+
+def _csr(closure: dict[int, set[int]], size: int):
+    """Pack a map of tag id to tag ids into offset and value arrays."""
+    pointers = np.zeros(size + 1, np.int64)
+    for id, values in closure.items():
+        pointers[id + 1] = len(values)
+    np.cumsum(pointers, out=pointers)
+    values = np.zeros(pointers[-1], _TAG_TYPE)
+    for id, ids in closure.items():
+        values[pointers[id]:pointers[id + 1]] = sorted(ids)
+    return pointers, values
+
+
+class Taxonomy:
+    """
+    In-memory view of tag aliases and the transitive closure of tag implications.
+
+    Aliases are held in a dictionary so resolving one is a single lookup. For implications the full
+    closure is computed when the tables are loaded and packed into two CSR style arrays: one holding
+    every tag implied by each tag, and one holding every tag which implies each tag. Finding either
+    set is then a slice of an array no matter how deep the implication chain is.
+
+    The taxonomy is loaded on first use and must be invalidated whenever the alias or implication
+    tables change. Sessions find it through `session.info[TAXONOMY_KEY]`.
+    """
+
+    __lock: RLock
+    __loaded: bool
+    __aliases: dict[str, int]
+    __edges: dict[int, set[int]]
+    __implied_ptr: np.ndarray[Any, np.dtype[np.int64]]
+    __implied: np.ndarray[Any, np.dtype[np.uint16]]
+    __implying_ptr: np.ndarray[Any, np.dtype[np.int64]]
+    __implying: np.ndarray[Any, np.dtype[np.uint16]]
+
+    def __init__(self):
+        self.__lock = RLock()
+        self.invalidate()
+
+    def invalidate(self):
+        """Discard the taxonomy. It will be loaded from the database the next time it is used."""
+        with self.__lock:
+            self.__loaded = False
+            self.__aliases = {}
+            self.__edges = {}
+            self.__implied_ptr, self.__implied = _csr({}, 0)
+            self.__implying_ptr, self.__implying = _csr({}, 0)
+
+    def resolve_alias(self, session: Session, name: str) -> int | None:
+        """Return the id of the tag an alias refers to, or None if `name` is not an alias."""
+        self.__ensure_loaded(session)
+        return self.__aliases.get(name)
+
+    def implied(self, session: Session, tag_id: int) -> list[int]:
+        """Return every tag directly or indirectly implied by a tag."""
+        self.__ensure_loaded(session)
+        return self.__slice(self.__implied_ptr, self.__implied, tag_id)
+
+    def implying(self, session: Session, tag_id: int) -> list[int]:
+        """Return every tag which directly or indirectly implies a tag."""
+        self.__ensure_loaded(session)
+        return self.__slice(self.__implying_ptr, self.__implying, tag_id)
+
+    def creates_cycle(self, session: Session, tag_id: int, implied_id: int) -> bool:
+        """Check if adding the implication `tag_id` => `implied_id` would create a cycle."""
+        return tag_id == implied_id or tag_id in self.implied(session, implied_id)
+
+    def expand(self, session: Session, required: bytes, forbidden: bytes):
+        """
+        Expand a packed tag query so that each tag is also matched by the tags which imply it.
+
+        :param required: Packed tags which must be present.
+        :param forbidden: Packed tags which must not be present.
+        :returns: Packed groups for the `check_tag_groups` database function (or None if no tags in
+            the query are implied by other tags), and the expanded packed forbidden tags.
+        """
+        groups = [[id, *self.implying(session, id)] for id in
+                  np.frombuffer(required, _TAG_TYPE).tolist()]
+        excluded = {x for id in np.frombuffer(forbidden, _TAG_TYPE).tolist()
+                    for x in (id, *self.implying(session, id))}
+        forbidden = np.array(sorted(excluded), _TAG_TYPE).tobytes()
+        if all(len(x) == 1 for x in groups):
+            return None, forbidden
+        # Each group is written as its length followed by its tags
+        packed: list[int] = []
+        for group in groups:
+            packed.append(len(group))
+            packed.extend(group)
+        return np.array(packed, _TAG_TYPE).tobytes(), forbidden
+
+    # ================ #
+    # Internal Helpers #
+    # ================ #
+
+    def __slice(self, pointers: np.ndarray[Any, Any], values: np.ndarray[Any, Any], id: int):
+        if id + 1 >= len(pointers):
+            return []
+        return values[pointers[id]:pointers[id + 1]].tolist()
+
+    def __ensure_loaded(self, session: Session):
+        with self.__lock:
+            metrics.cache_lookup('taxonomy', self.__loaded)
+            if self.__loaded:
+                return
+            self.__aliases = {name: id for name, id in
+                              (x.tuple() for x in session.execute(
+                                  select(TagAlias.name, TagAlias.tag_id)).all())}
+            self.__edges = {}
+            for tag_id, implied_id in (x.tuple() for x in session.execute(
+                    select(TagImplication.tag_id, TagImplication.implied_id)).all()):
+                self.__edges.setdefault(tag_id, set()).add(implied_id)
+            implied: dict[int, set[int]] = {id: self.__reachable(id) for id in self.__edges}
+            implying: dict[int, set[int]] = {}
+            for id, targets in implied.items():
+                for target in targets:
+                    implying.setdefault(target, set()).add(id)
+            size = max([*implied.keys(), *implying.keys(), -1]) + 1
+            self.__implied_ptr, self.__implied = _csr(implied, size)
+            self.__implying_ptr, self.__implying = _csr(implying, size)
+            self.__loaded = True
+
+    def __reachable(self, id: int) -> set[int]:
+        found: set[int] = set()
+        stack = list(self.__edges.get(id, ()))
+        while stack:
+            current = stack.pop()
+            if current in found or current == id:
+                continue
+            found.add(current)
+            stack.extend(self.__edges.get(current, ()))
+        return found
+
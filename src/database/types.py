@@ -1,6 +1,15 @@
 from datetime import datetime
+from typing import Literal
 from typing_extensions import TypedDict, NotRequired
 
+# Entry dates which can be grouped into a histogram
+HistogramField = Literal['created', 'digitized']
+HistogramInterval = Literal['year', 'month', 'day']
+
+# Fields which search results can be sorted by
+SortField = Literal['date_created', 'date_digitized', 'date_modified', 'date_indexed', 'size',
+                    'name', 'id']
+
 
 class SearchParameters(TypedDict):
     """
@@ -16,6 +25,9 @@ class SearchParameters(TypedDict):
     :param until_digitized: `date_digitized` must be less than or equal to.
     :param since_indexed: `date_indexed` must be greater than or equal to.
     :param until_indexed: `date_indexed` must be less than or equal to.
+    :param under: Entry must be a descendant of the entry with this id.
+    :param sort: Field to sort results by. Results are in no particular order if not set.
+    :param sort_descending: Sort results largest (or newest) first.
     :param count: Number of posts to return.
     :param page: Page number to return.
     """
@@ -29,6 +41,9 @@ class SearchParameters(TypedDict):
     until_digitized: NotRequired[int]
     since_indexed: NotRequired[int]
     until_indexed: NotRequired[int]
+    under: NotRequired[int]
+    sort: NotRequired[SortField]
+    sort_descending: NotRequired[bool]
     count: NotRequired[int]
     page: NotRequired[int]
 
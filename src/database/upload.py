@@ -0,0 +1,200 @@
+from .base import Base
+from database.exceptions import UploadException, UploadOffsetException
+from hashlib import sha256
+from pathlib import Path
+from sqlalchemy import ForeignKey
+from sqlalchemy.orm import Mapped, mapped_column
+from threading import Lock
+from typing import TYPE_CHECKING, Any, BinaryIO
+from util import metrics
+from util.lazy import lazy_import
+from util.repr import repr_helper
+import config
+import time
+
+if TYPE_CHECKING:
+    import magic
+else:
+    magic = lazy_import('magic')
+
+# Name of the directory inside `dataRoot` where partial uploads are staged. Keeping the staging
+# area on the same filesystem as the final destination allows the finished file to be moved into
+# place with an atomic rename.
+STAGING_DIRECTORY = ".uploads"
+
+# Number of bytes read from the request stream at a time. This is the only buffer that scales with
+# the upload, so memory use is constant regardless of the file size.
+CHUNK_SIZE = 64 * 1024
+
+# Number of bytes from the start of the file handed to libmagic for mime type identification.
+SNIFF_SIZE = 64 * 1024
+
+
+class Upload(Base):
+    """
+    Represents a chunked upload which is in progress. Data is streamed into a staging file inside
+    `dataRoot` and moved to its final location once the upload is finalized.
+    """
+    __tablename__ = "uploads"
+
+    storage_id: Mapped[str] = mapped_column()
+    entry_id: Mapped[int | None] = mapped_column(ForeignKey("entries.id"), nullable=True)
+    size: Mapped[int | None] = mapped_column(nullable=True)
+    offset: Mapped[int] = mapped_column(default=0)
+    mime_type: Mapped[str | None] = mapped_column(nullable=True)
+    date_started: Mapped[int] = mapped_column()
+    date_updated: Mapped[int] = mapped_column()
+
+    def __init__(self, **kw: Any):
+        now = int(time.time())
+        kw.setdefault('offset', 0)
+        kw.setdefault('date_started', now)
+        kw.setdefault('date_updated', now)
+        super().__init__(**kw)
+
+    def staging_path(self):
+        """Return the path of the file the upload is being written to."""
+        return Path(config.configuration['dataRoot'], STAGING_DIRECTORY, f"{self.id}.part")
+
+    def storage_path(self):
+        """Return the path the file will be moved to once the upload is finalized."""
+        return resolve_storage_path(self.storage_id)
+
+    def write(self, stream: BinaryIO, offset: int):
+        """
+        Append data from a stream to the staging file. The stream is consumed in fixed size chunks
+        and hashed as it is written. If the stream ends early (for example because the client
+        disconnected) the upload offset is updated to reflect the data which was actually received
+        so the client can resume from that point.
+
+        :param stream: Stream to read data from.
+        :param offset: Offset the client believes the data starts at. Must match `self.offset`.
+        :raises UploadOffsetException: If the offset does not match the current upload offset.
+        :raises UploadException: If the upload is already being written to, or the data would
+            exceed the declared upload size.
+        """
+        if offset != self.offset:
+            raise UploadOffsetException(self.offset, offset)
+        _acquire(self.id)
+        try:
+            path = self.staging_path()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            hasher = _get_hasher(self.id, path, offset)
+            head = bytearray() if offset == 0 else None
+            with open(path, 'r+b' if path.exists() else 'wb') as file:
+                file.seek(offset)
+                # Discard anything past the offset left over from an interrupted write
+                file.truncate()
+                try:
+                    while True:
+                        chunk = stream.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        if self.size is not None and self.offset + len(chunk) > self.size:
+                            raise UploadException(f"Upload {self.id} exceeds declared size "
+                                                  f"{self.size}")
+                        with metrics.file_io.time(operation='upload_write'):
+                            file.write(chunk)
+                        metrics.file_io_bytes.inc(len(chunk), operation='upload_write')
+                        hasher.update(chunk)
+                        if head is not None and len(head) < SNIFF_SIZE:
+                            head += chunk[:SNIFF_SIZE - len(head)]
+                        self.offset += len(chunk)
+                finally:
+                    _store_hasher(self.id, hasher, self.offset)
+                    self.date_updated = int(time.time())
+            # Identify the data as soon as enough of it is available
+            if not self.mime_type and (self.offset >= SNIFF_SIZE or self.offset == self.size):
+                self.mime_type = self.__sniff(head)
+        finally:
+            _release(self.id)
+
+    def digest(self):
+        """Return the hex encoded SHA-256 digest of the data received so far."""
+        return _get_hasher(self.id, self.staging_path(), self.offset).hexdigest()
+
+    def identify(self):
+        """Return the mime type of the uploaded data, identifying it if required."""
+        if not self.mime_type:
+            self.mime_type = self.__sniff(None)
+        return self.mime_type
+
+    def discard(self):
+        """Delete the staging file and any cached state belonging to this upload."""
+        with _hasher_lock:
+            _hashers.pop(self.id, None)
+        self.staging_path().unlink(missing_ok=True)
+
+    def __sniff(self, head: bytes | bytearray | None) -> str:
+        """Identify the mime type from a head buffer, or from the staging file if not available."""
+        detector = magic.Magic(mime=True)
+        if head is not None:
+            return detector.from_buffer(bytes(head))
+        return detector.from_file(str(self.staging_path()))
+
+    def __repr__(self):
+        return repr_helper(self, ['id', 'storage_id', 'entry_id', 'size', 'offset', 'mime_type',
+                                  'date_started', 'date_updated'])
+
+
+def resolve_storage_path(storage_id: str) -> Path:
+    """
+    Resolve a storage id to a path inside `dataRoot`, making sure that it can not escape the data
+    directory or collide with the upload staging area.
+
+    :param storage_id: Storage id to resolve.
+    :raises UploadException: If the storage id is not a valid destination.
+    :returns: The absolute path of the storage id.
+    """
+    root = Path(config.configuration['dataRoot']).resolve()
+    path = Path(root, storage_id).resolve()
+    if not path.is_relative_to(root) or path == root:
+        raise UploadException(f"Invalid storage id {storage_id}")
+    if path.is_relative_to(Path(root, STAGING_DIRECTORY)):
+        raise UploadException(f"Invalid storage id {storage_id}: Reserved for staging")
+    return path
+
+
+# Hash state can not be serialized to the database, so the running digest of each upload is kept in
+# memory along with the offset it is valid for. If the state is lost (for example because the
+# server restarted between chunks) it is rebuilt by re-reading the staging file.
+_hashers: dict[int, tuple[Any, int]] = {}
+_hasher_lock = Lock()
+_active_uploads: set[int] = set()
+
+
+def _get_hasher(upload_id: int, path: Path, offset: int):
+    with _hasher_lock:
+        hasher, hashed = _hashers.get(upload_id, (None, -1))
+    metrics.cache_lookup('upload_hasher', hasher is not None and hashed == offset)
+    if hasher is not None and hashed == offset:
+        return hasher
+    hasher = sha256()
+    if offset > 0:
+        with open(path, 'rb') as file, metrics.file_io.time(operation='upload_rehash'):
+            remaining = offset
+            while remaining > 0:
+                chunk = file.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise UploadException(f"Staging file for upload {upload_id} is truncated")
+                hasher.update(chunk)
+                remaining -= len(chunk)
+    return hasher
+
+
+def _store_hasher(upload_id: int, hasher: Any, offset: int):
+    with _hasher_lock:
+        _hashers[upload_id] = (hasher, offset)
+
+
+def _acquire(upload_id: int):
+    """Prevent multiple requests from writing to the same upload simultaneously."""
+    with _hasher_lock:
+        if upload_id in _active_uploads:
+            raise UploadException(f"Upload {upload_id} is already being written to")
+        _active_uploads.add(upload_id)
+
+
+def _release(upload_id: int):
+    with _hasher_lock:
+        _active_uploads.discard(upload_id)
@@ -1,25 +1,82 @@
 from .api import api
+from .commands import register_commands
+from .handle import DatabaseHandle
 from .site import site
+from .trace import TraceRecorder
 from database import Database
-from flask import Flask
+from flask import Flask, Response, current_app, g, request
 from pathlib import Path
+from typing import Any
+from util import metrics
+import config
+import os
+import time
 
 root = Path(__file__).parent.parent.parent
 # TODO: Remove `str()` once https://github.com/pallets/flask/pull/4921 is available in pip
 template_dir = str(Path(root, "res/templates").resolve())
 static_dir = Path(root, "res/static").resolve()
 
-app = Flask(__name__, template_folder=template_dir, static_folder=static_dir)
-__db = Database("/local.db")
+# Key of the application's `DatabaseHandle` in `app.extensions`
+DATABASE_KEY = "library.database"
 
-app.register_blueprint(api)
-app.register_blueprint(site)
+request_time = metrics.Histogram('library_request_seconds', "Time taken to handle requests",
+                                 ('route',))
 
 
-def get_db_internal():
+def create_app(settings: dict[str, Any] | None = None) -> Flask:
+    """
+    Create the application. Used by `flask --app server`, and by `wsgi` for other servers.
+
+    The database is not opened here, each process opens it when it handles its first request (see
+    `DatabaseHandle`), so the application can safely be created before a pre-fork server forks its
+    workers. Every worker has its own connection pool and caches, so requests are spread across as
+    many cores as there are workers.
+
+    :param settings: Configuration values to change before creating the application, in the same
+        layout as `config.json`. The configuration is shared by the whole process.
+    """
+    if settings:
+        config.override(settings)
+    app = Flask(__name__, template_folder=template_dir, static_folder=static_dir)
+    # Resolved now so that every process opens the same file, whatever its working directory
+    path = os.path.abspath(config.configuration['databaseFile'])
+    app.extensions[DATABASE_KEY] = DatabaseHandle(path)
+    app.before_request(__start_request)
+    app.after_request(__finish_request)
+    app.teardown_request(__end_request)
+    app.register_blueprint(api)
+    app.register_blueprint(site)
+    register_commands(app)
+
+    if config.configuration['trace']['file']:
+        app.wsgi_app = TraceRecorder(app.wsgi_app, config.configuration['trace']['file'])
+    return app
+
+
+def __start_request():
+    metrics.route.set(request.endpoint or 'unknown')
+    g.request_start = time.perf_counter()
+
+
+def __finish_request(response: Response):
+    request_time.observe(time.perf_counter() - g.request_start, route=metrics.route.get())
+    return response
+
+
+def __end_request(_: BaseException | None):
+    metrics.route.set('none')
+
+
+def get_db_internal(app: Flask | None = None) -> Database:
     """
     Retrieve a handle to the database object. Normally you should obtain a handle to this object
     by decorating your function with the `withDatabase` decorator defined in helpers.py, as it will
     ensure that your session is committed and cleaned up at the end of the transaction.
+
+    The database is opened the first time this is called in each process.
+
+    :param app: Application to get the database of, defaults to the current application.
     """
-    return __db
+    handle: DatabaseHandle = (app or current_app).extensions[DATABASE_KEY]
+    return handle.get()
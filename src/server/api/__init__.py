@@ -1,9 +1,13 @@
 from .admin import admin_api
 from .entries import entry_api
+from .search import search_api
 from .tags import tag_api
+from .uploads import upload_api
 from flask import Blueprint
 
 api = Blueprint('api', __name__, url_prefix='/api')
 api.register_blueprint(tag_api)
 api.register_blueprint(entry_api)
 api.register_blueprint(admin_api)
+api.register_blueprint(upload_api)
+api.register_blueprint(search_api)
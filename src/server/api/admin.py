@@ -1,6 +1,9 @@
 from database import Database
-from flask import Blueprint
-from server.helpers import exceptionWrapper, success, withDatabase
+from flask import Blueprint, Response
+from server.helpers import RequestError, exceptionWrapper, success, args, withDatabase
+from typing_extensions import TypedDict, NotRequired
+from util import metrics
+import config
 
 admin_api = Blueprint("admin_api", __name__, url_prefix="/admin")
 
@@ -14,3 +17,136 @@ def recalculateTagCounts(db: Database):
         "tags_updated": count,
         "time": time
     })
+
+
+class StartScrubArgs(TypedDict):
+    continuous: NotRequired[str]
+
+
+@admin_api.route("/scrub/start")
+@exceptionWrapper
+@args(StartScrubArgs)
+@withDatabase
+def startScrub(db: Database, args: StartScrubArgs):
+    continuous = args.get('continuous', 'false').lower() in ('1', 'true', 'yes')
+    if not db.start_scrub(continuous):
+        raise RequestError("Scrub already running", 409)
+    return success(db.scrub_status())
+
+
+@admin_api.route("/scrub/stop")
+@exceptionWrapper
+@withDatabase
+def stopScrub(db: Database):
+    db.stop_scrub()
+    return success(db.scrub_status())
+
+
+@admin_api.route("/scrub/status")
+@exceptionWrapper
+@withDatabase
+def scrubStatus(db: Database):
+    return success(db.scrub_status())
+
+
+class ScrubResultArgs(TypedDict):
+    status: NotRequired[str]
+    count: NotRequired[str]
+    page: NotRequired[str]
+
+
+@admin_api.route("/scrub/results")
+@exceptionWrapper
+@args(ScrubResultArgs)
+@withDatabase
+def scrubResults(db: Database, args: ScrubResultArgs):
+    try:
+        count = int(args.get('count', 50))
+        page = int(args.get('page', 0))
+    except ValueError:
+        raise RequestError("Invalid count or page: Not a number")
+    results = db.scrub_results(args.get('status'), count, page)
+    return success([x.as_object() for x in results])
+
+
+@admin_api.route("/reconcile")
+@exceptionWrapper
+@withDatabase
+def reconcile(db: Database):
+    return success(db.reconcile())
+
+
+@admin_api.route("/backfillSizes")
+@exceptionWrapper
+@withDatabase
+def backfillSizes(db: Database):
+    count, time = db.backfill_sizes()
+    return success({
+        "entries_updated": count,
+        "time": time
+    })
+
+
+@admin_api.route("/related/rebuild")
+@exceptionWrapper
+@withDatabase
+def rebuildRelatedTags(db: Database):
+    pairs, time = db.rebuild_related_tags()
+    return success({"pairs": pairs, "time": time})
+
+
+@admin_api.route("/backup/start")
+@exceptionWrapper
+@withDatabase
+def startBackup(db: Database):
+    if not db.start_backup():
+        raise RequestError("Backup already running", 409)
+    return success(db.backup_status())
+
+
+@admin_api.route("/backup/status")
+@exceptionWrapper
+@withDatabase
+def backupStatus(db: Database):
+    return success(db.backup_status())
+
+
+@admin_api.route("/backup/list")
+@exceptionWrapper
+@withDatabase
+def listBackups(db: Database):
+    return success(db.list_backups())
+
+
+@admin_api.route("/metrics")
+@exceptionWrapper
+def getMetrics():
+    """Expose request timings and counters in the Prometheus text format."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+class SlowQueryArgs(TypedDict):
+    count: NotRequired[str]
+
+
+@admin_api.route("/slowQueries")
+@exceptionWrapper
+@args(SlowQueryArgs)
+@withDatabase
+def slowQueries(db: Database, args: SlowQueryArgs):
+    capacity = config.configuration['slowQueries']['capacity']
+    try:
+        count = int(args.get('count', min(50, capacity)))
+    except ValueError:
+        raise RequestError("Invalid count: Not a number")
+    if count < 1 or count > capacity:
+        raise RequestError(f"Count must be between 1 and {capacity}")
+    return success(db.slow_queries(count))
+
+
+@admin_api.route("/slowQueries/clear")
+@exceptionWrapper
+@withDatabase
+def clearSlowQueries(db: Database):
+    db.clear_slow_queries()
+    return success(None)
@@ -1,15 +1,23 @@
 from database import Database
-from database.entry import EntryUpdateParams
-from database.exceptions import DatabaseException
+from database.entry import Entry, EntryUpdateParams
+from database.exceptions import DatabaseException, InvalidFieldException
+from database.serializer import parse_fields
 from flask import Blueprint, send_file  # type: ignore
 from pathlib import Path
-from server.helpers import RequestError, exceptionWrapper, success, args, withDatabase
-from typing_extensions import TypedDict
-from util import mime as mime_util
+from server.helpers import RequestError, exceptionWrapper, success, fast_success, args
+from server.helpers import withDatabase
+from typing import TYPE_CHECKING
+from typing_extensions import TypedDict, NotRequired
+from util import metrics, mime as mime_util
+from util.lazy import lazy_import
 import config
 import hashlib
 import os
-import xdg.BaseDirectory  # type: ignore
+
+if TYPE_CHECKING:
+    from xdg import BaseDirectory  # type: ignore
+else:
+    BaseDirectory = lazy_import('xdg.BaseDirectory')
 
 entry_api = Blueprint('entry_api', __name__, url_prefix='/entries')
 
@@ -18,22 +26,111 @@ GetEntryArgs = TypedDict('GetEntryArgs', {
 })
 
 
+class GetEntryFieldsArgs(TypedDict):
+    id: str
+    fields: NotRequired[str]
+
+
 @entry_api.route('/get')
 @exceptionWrapper
-@args(GetEntryArgs)
+@args(GetEntryFieldsArgs)
 @withDatabase
-def getEntry(db: Database, args: GetEntryArgs):
+def getEntry(db: Database, args: GetEntryFieldsArgs):
+    """
+    Return a single entry. The optional `fields` argument is a comma separated list of the fields
+    to include, which defaults to the same fields as `Entry.object`.
+    """
     try:
         id = int(args['id'])
     except ValueError:
         raise RequestError(f"Invalid ID {args['id']}: Not a number")
-    entry = db.get_entry_by_id(id)
-    if entry:
-        return success(entry.object())
+    try:
+        fields = parse_fields(args.get('fields'))
+    except InvalidFieldException as e:
+        raise RequestError(e.message)
+    entries = db.get_entries_serialized(fields, Entry.id == id)
+    if len(entries) > 0:
+        return fast_success(entries[0])
     else:
         raise RequestError(f"No such entry {id}", 404)
 
 
+class BatchEntryArgs(TypedDict):
+    ids: str
+    fields: NotRequired[str]
+
+
+@entry_api.route('/batch')
+@exceptionWrapper
+@args(BatchEntryArgs)
+@withDatabase
+def getEntryBatch(db: Database, args: BatchEntryArgs):
+    """
+    Return several entries at once. `ids` is a comma separated list of entry ids and inclusive
+    ranges (e.g. `1,4,10-20`). Results are returned in request order, with `{"id": <id>,
+    "missing": true}` in place of entries which do not exist.
+    """
+    try:
+        fields = parse_fields(args.get('fields'))
+    except InvalidFieldException as e:
+        raise RequestError(e.message)
+    max_size = config.configuration['entries']['maxBatchSize']
+    ids: list[int] = []
+    ranges: list[tuple[int, int]] = []
+    requested: list[int] = []
+    for token in (x.strip() for x in args['ids'].split(',') if x.strip() != ''):
+        try:
+            if '-' in token[1:]:
+                first, last = (int(x) for x in token.split('-', 1))
+                if last < first:
+                    raise ValueError()
+            else:
+                first = last = int(token)
+        except ValueError:
+            raise RequestError(f"Invalid ID or range {token}")
+        if len(requested) + last - first + 1 > max_size:
+            raise RequestError(f"Too many entries requested: Limit is {max_size}")
+        if first == last:
+            ids.append(first)
+        else:
+            ranges.append((first, last))
+        requested.extend(range(first, last + 1))
+
+    found = db.get_entries_batch(fields, ids, ranges)
+    result = [found.get(id, {"id": id, "missing": True}) for id in dict.fromkeys(requested)]
+    return fast_success(result)
+
+
+class SubtreeArgs(TypedDict):
+    id: str
+    depth: NotRequired[str]
+
+
+@entry_api.route('/subtree')
+@exceptionWrapper
+@args(SubtreeArgs)
+@withDatabase
+def getSubtree(db: Database, args: SubtreeArgs):
+    """
+    Return all descendants of an entry, such as every page of a scanned book, in a single query.
+    """
+    try:
+        id = int(args['id'])
+        depth = int(args['depth']) if 'depth' in args else None
+    except ValueError:
+        raise RequestError("Invalid ID or depth: Not a number")
+    if depth is not None and depth < 1:
+        raise RequestError("Depth must be at least 1")
+    if not db.get_entry_by_id(id):
+        raise RequestError(f"No such entry {id}", 404)
+    return success([{
+        "id": entry.id,
+        "item_name": entry.item_name,
+        "parent_id": entry.parent_id,
+        "depth": entry_depth
+    } for entry, entry_depth in db.get_subtree(id, depth)])
+
+
 @entry_api.route("/create", methods=["POST"])
 @exceptionWrapper
 @args(EntryUpdateParams, 'POST')
@@ -85,26 +182,38 @@ def getPreview(db: Database, args: GetEntryArgs):
     if not entry.storage_id:
         raise RequestError("Entry has no associated media", 404)
 
+    preview = find_preview(entry.storage_id, entry.mime_icon)
+    if preview:
+        return send_file(preview)
+
+    raise RequestError(f"No preview available for entity {id}", 404)
+
+
+def find_preview(storage_id: str, mime_icon: str | None) -> str | None:
+    """
+    Find an existing thumbnail of a file in the XDG thumbnail cache, or failing that the icon for
+    its mime type.
+
+    :param storage_id: Storage id of the file.
+    :param mime_icon: Icon name of the file's mime type.
+    :returns: Path of the preview image, or None if there isn't one.
+    """
     # Get the thumbnail ID
-    file_path = Path(config.configuration['dataRoot'], entry.storage_id)
+    file_path = Path(config.configuration['dataRoot'], storage_id)
     thumb_id = hashlib.md5(file_path.as_uri().encode()).hexdigest() + ".png"
 
     # Attempt to find an existing preview image
-    thumb_cache = Path(xdg.BaseDirectory.xdg_cache_home, "thumbnails")
+    thumb_cache = Path(BaseDirectory.xdg_cache_home, "thumbnails")
     thumbnail_sizes = ['xx-large', 'x-large', 'large', 'normal']
     for thumb_size in thumbnail_sizes:
         thumb_path = Path(thumb_cache, thumb_size, thumb_id)
         if os.path.exists(thumb_path):
-            return send_file(thumb_path)
+            return str(thumb_path)
 
     # TODO: Request thumbnails from Tumbler (via D-Bus)
 
     # Attempt to find a mime type icon
-    icon = mime_util.find_icon_path(entry.mime_icon or '')
-    if icon:
-        return send_file(icon)
-
-    raise RequestError(f"No preview available for entity {id}", 404)
+    return mime_util.find_icon_path(mime_icon or '')
 
 
 class MimeIconArgs(TypedDict):
@@ -143,6 +252,10 @@ def download(db: Database, args: GetEntryArgs):
         raise RequestError(f"No such entry {id}", 404)
     if not entry.storage_id:
         raise RequestError("Entry has no associated media", 404)
-    # Return the data
+    # Return the data. The file is streamed after the handler returns, so only opening it is timed
     path = Path(config.configuration['dataRoot'], entry.storage_id)
-    return send_file(path)
+    with metrics.file_io.time(operation='download_open'):
+        response = send_file(path)
+    if response.content_length:
+        metrics.file_io_bytes.inc(response.content_length, operation='download')
+    return response
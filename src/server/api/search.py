@@ -1,17 +1,107 @@
-from flask import Blueprint
-from server.helpers import exceptionWrapper, args
-from typing_extensions import TypedDict
+from database import HISTOGRAM_FORMATS, Database, searchStringParser
+from database.exceptions import InvalidFieldException, InvalidTagException
+from database.serializer import parse_fields
+from database.types import HistogramField, HistogramInterval
+from flask import Blueprint, Response
+from server.helpers import RequestError, exceptionWrapper, fast_success, args, withDatabase
+from typing import Any, Iterator, cast
+from typing_extensions import TypedDict, NotRequired
+from util import encoding
+import json
 
 search_api = Blueprint('search_api', __name__, url_prefix='/search')
 
 
 class SearchArgs(TypedDict):
     query: str
+    page: NotRequired[str]
+    count: NotRequired[str]
+    fields: NotRequired[str]
+    format: NotRequired[str]
+
+
+class HistogramArgs(TypedDict):
+    query: NotRequired[str]
+    field: NotRequired[str]
+    interval: NotRequired[str]
 
 
 @search_api.route("")
 @exceptionWrapper
 @args(SearchArgs)
-def search(args: SearchArgs):
+@withDatabase
+def search(db: Database, args: SearchArgs):
+    """
+    Search for entries using the same query syntax as the search page.
+
+    With `format=json` (the default) one page of results is returned along with any warnings about
+    the query. With `format=ndjson` every matching entry (or one page, if `count` is given) is
+    streamed as a newline delimited JSON object as it is read from the database, so large exports
+    run in constant memory. Query warnings are sent in the `X-Search-Warnings` header.
+    """
     # Parse the query string
-    pass
+    params, warnings = searchStringParser.parse_search(args['query'])
+    try:
+        if 'page' in args:
+            params['page'] = int(args['page'])
+        if 'count' in args:
+            params['count'] = int(args['count'])
+    except ValueError:
+        raise RequestError("Invalid page or count: Not a number")
+    try:
+        fields = parse_fields(args.get('fields'))
+    except InvalidFieldException as e:
+        raise RequestError(e.message)
+
+    output = args.get('format', 'json')
+    try:
+        if output == 'json':
+            return fast_success({
+                "entries": db.search_serialized(params, fields),
+                "warnings": warnings
+            })
+        elif output == 'ndjson':
+            rows = db.search_stream(params, fields)
+        else:
+            raise RequestError(f"Invalid format {output}")
+    except InvalidTagException as e:
+        raise RequestError(e.message)
+
+    def generate(rows: Iterator[dict[str, Any]]):
+        for row in rows:
+            yield encoding.dumps(row) + b'\n'
+    response = Response(generate(rows), mimetype='application/x-ndjson')
+    # Header values must be Latin-1, `json` escapes everything else (unlike `encoding`)
+    response.headers['X-Search-Warnings'] = json.dumps(warnings)
+    return response
+
+
+@search_api.route("/histogram")
+@exceptionWrapper
+@args(HistogramArgs)
+@withDatabase
+def histogram(db: Database, args: HistogramArgs):
+    """
+    Count the entries matching a query in each year, month or day, for browsing by date.
+
+    `field` is the date to group by, `created` (the default) or `digitized`, and `interval` is the
+    bucket size, `year`, `month` (the default) or `day`. Buckets are returned in date order as
+    `[bucket, count]` pairs, such as `["2021-06", 14]`, and buckets without any entries are left
+    out.
+    """
+    params, warnings = searchStringParser.parse_search(args.get('query', ''))
+    field = args.get('field', 'created')
+    if field not in ('created', 'digitized'):
+        raise RequestError(f"Invalid field {field}")
+    interval = args.get('interval', 'month')
+    if interval not in HISTOGRAM_FORMATS:
+        raise RequestError(f"Invalid interval {interval}")
+    try:
+        buckets = db.date_histogram(params, cast(HistogramField, field),
+                                    cast(HistogramInterval, interval))
+    except InvalidTagException as e:
+        raise RequestError(e.message)
+    return fast_success({
+        "buckets": buckets,
+        "warnings": warnings
+    })
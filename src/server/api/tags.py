@@ -1,6 +1,7 @@
 from database import Database
-from database.exceptions import TagExistsException, TagDoesNotExistException
-from flask import Blueprint
+from database.exceptions import InvalidTagException, TagExistsException, TagDoesNotExistException
+from database.exceptions import TagImplicationCycleException
+from flask import Blueprint, Response, request
 from server.helpers import exceptionWrapper, success, args, RequestError, withDatabase
 from typing import TypeVar
 from typing_extensions import TypedDict, NotRequired
@@ -8,11 +9,92 @@ from typing_extensions import TypedDict, NotRequired
 tag_api = Blueprint('tag_api', __name__, url_prefix='/tags')
 
 
+class ListTagsArgs(TypedDict):
+    since: NotRequired[str]
+
+
 @tag_api.route("/list")
 @exceptionWrapper
+@args(ListTagsArgs)
 @withDatabase
-def listTags(db: Database):
-    return success([x.as_object() for x in db.get_all_tags()])
+def listTags(db: Database, args: ListTagsArgs):
+    """
+    List every tag. The tag table version is sent as the ETag, and `304 Not Modified` is returned if
+    the client already has the current version.
+
+    With `since=<version>` only the tags which have changed since that version are returned, along
+    with the ids of deleted tags and the current version.
+    """
+    version = db.tag_version()
+    etag = f"tags-{version}"
+    if 'since' in args:
+        try:
+            since = int(args['since'])
+        except ValueError:
+            raise RequestError("Invalid since: Not a number")
+        changed, deleted = db.get_tag_changes(since)
+        response, code = success({
+            "version": version,
+            "changed": [x.as_object() for x in changed],
+            "deleted": deleted
+        })
+    elif request.if_none_match.contains(etag):
+        response, code = Response(status=304), 304
+    else:
+        response, code = success([x.as_object() for x in db.get_all_tags()])
+    response.set_etag(etag)
+    response.headers['X-Tag-Version'] = str(version)
+    return response, code
+
+
+AUTOCOMPLETE_LIMIT = 100
+
+
+class AutocompleteArgs(TypedDict):
+    prefix: str
+    count: NotRequired[str]
+
+
+@tag_api.route("/autocomplete")
+@exceptionWrapper
+@args(AutocompleteArgs)
+@withDatabase
+def autocompleteTags(db: Database, args: AutocompleteArgs):
+    """Return the most used tags starting with `prefix`."""
+    try:
+        count = int(args.get('count', 10))
+    except ValueError:
+        raise RequestError("Invalid count: Not a number")
+    if count < 1 or count > AUTOCOMPLETE_LIMIT:
+        raise RequestError(f"Count must be between 1 and {AUTOCOMPLETE_LIMIT}")
+    return success(db.autocomplete_tags(args['prefix'], count))
+
+
+RELATED_LIMIT = 100
+
+
+class RelatedTagsArgs(TypedDict):
+    tags: str
+    count: NotRequired[str]
+
+
+@tag_api.route("/related")
+@exceptionWrapper
+@args(RelatedTagsArgs)
+@withDatabase
+def relatedTags(db: Database, args: RelatedTagsArgs):
+    """Suggest tags which are commonly used alongside the space separated list of `tags`."""
+    try:
+        count = int(args.get('count', 10))
+    except ValueError:
+        raise RequestError("Invalid count: Not a number")
+    if count < 1 or count > RELATED_LIMIT:
+        raise RequestError(f"Count must be between 1 and {RELATED_LIMIT}")
+    try:
+        related = db.related_tags(args['tags'].split(), count)
+    except InvalidTagException as e:
+        raise RequestError(e.message, 404)
+    return success([{**tag.as_object(), "score": score} for tag, score in related])
 
 
 GenericDict = TypeVar('GenericDict', bound=TypedDict)
@@ -82,3 +164,85 @@ def deleteTag(db: Database, args: DeleteTagArgs):
         })
     except TagDoesNotExistException as e:
         raise RequestError(f"No such tag {e.tag}", 404)
+    except ValueError as e:
+        raise RequestError(str(e))
+
+
+@tag_api.route("/aliases")
+@exceptionWrapper
+@withDatabase
+def listAliases(db: Database):
+    return success([{"alias": alias, "tag": tag} for alias, tag in db.get_aliases()])
+
+
+class AliasArgs(TypedDict):
+    alias: str
+    tag: str
+
+
+@tag_api.route("/aliases/create")
+@exceptionWrapper
+@args(AliasArgs)
+@withDatabase
+def createAlias(db: Database, args: AliasArgs):
+    try:
+        db.create_alias(args['alias'], args['tag'])
+        return success({"alias": args['alias'], "tag": args['tag']})
+    except TagExistsException:
+        raise RequestError(f"A tag or alias named {args['alias']} already exists")
+    except TagDoesNotExistException as e:
+        raise RequestError(f"No such tag {e.tag}", 404)
+
+
+class DeleteAliasArgs(TypedDict):
+    alias: str
+
+
+@tag_api.route("/aliases/delete")
+@exceptionWrapper
+@args(DeleteAliasArgs)
+@withDatabase
+def deleteAlias(db: Database, args: DeleteAliasArgs):
+    try:
+        db.delete_alias(args['alias'])
+        return success({"alias": args['alias']})
+    except TagDoesNotExistException as e:
+        raise RequestError(f"No such alias {e.tag}", 404)
+
+
+@tag_api.route("/implications")
+@exceptionWrapper
+@withDatabase
+def listImplications(db: Database):
+    return success([{"tag": tag, "implies": implied} for tag, implied in db.get_implications()])
+
+
+class ImplicationArgs(TypedDict):
+    tag: str
+    implies: str
+
+
+@tag_api.route("/implications/create")
+@exceptionWrapper
+@args(ImplicationArgs)
+@withDatabase
+def createImplication(db: Database, args: ImplicationArgs):
+    try:
+        db.create_implication(args['tag'], args['implies'])
+        return success({"tag": args['tag'], "implies": args['implies']})
+    except TagDoesNotExistException as e:
+        raise RequestError(f"No such tag {e.tag}", 404)
+    except TagImplicationCycleException as e:
+        raise RequestError(e.message)
+
+
+@tag_api.route("/implications/delete")
+@exceptionWrapper
+@args(ImplicationArgs)
+@withDatabase
+def deleteImplication(db: Database, args: ImplicationArgs):
+    try:
+        db.delete_implication(args['tag'], args['implies'])
+        return success({"tag": args['tag'], "implies": args['implies']})
+    except TagDoesNotExistException as e:
+        raise RequestError(f"No such tag {e.tag}", 404)
@@ -0,0 +1,127 @@
+from database import Database
+from database.exceptions import DatabaseException, UploadException, UploadOffsetException
+from database.types import EntryUpdateParams
+from database.upload import Upload
+from flask import Blueprint, request
+from server.helpers import RequestError, exceptionWrapper, success, args, withDatabase
+from typing import Any
+from typing_extensions import TypedDict, NotRequired
+
+upload_api = Blueprint('upload_api', __name__, url_prefix='/uploads')
+
+
+def upload_status(upload: Upload) -> dict[str, Any]:
+    """Return a transmissible description of the state of an upload."""
+    return {
+        "upload_id": upload.id,
+        "storage_id": upload.storage_id,
+        "offset": upload.offset,
+        "size": upload.size,
+    }
+
+
+def get_upload(db: Database, id: int | str):
+    """Resolve an upload id, raising an appropriate request error if it is invalid."""
+    try:
+        id = int(id)
+    except ValueError:
+        raise RequestError(f"Invalid ID {id}: Not a number")
+    upload = db.get_upload(id)
+    if not upload:
+        raise RequestError(f"No such upload {id}", 404)
+    return upload
+
+
+class CreateUploadArgs(TypedDict):
+    storage_id: str
+    size: NotRequired[int]
+    entry_id: NotRequired[int]
+
+
+@upload_api.route("/create", methods=["POST"])
+@exceptionWrapper
+@args(CreateUploadArgs, 'POST')
+@withDatabase
+def createUpload(db: Database, args: CreateUploadArgs):
+    try:
+        upload = db.create_upload(args['storage_id'], args.get('size'), args.get('entry_id'))
+    except UploadException as e:
+        raise RequestError({'message': e.message})
+    return success(upload_status(upload))
+
+
+UploadStatusArgs = TypedDict('UploadStatusArgs', {
+    'id': str  # GET arguments can only be strings
+})
+
+
+@upload_api.route("/status")
+@exceptionWrapper
+@args(UploadStatusArgs)
+@withDatabase
+def uploadStatus(db: Database, args: UploadStatusArgs):
+    return success(upload_status(get_upload(db, args['id'])))
+
+
+UploadChunkArgs = TypedDict('UploadChunkArgs', {
+    'id': str,
+    'offset': str
+})
+
+
+@upload_api.route("/chunk", methods=["PUT"])
+@exceptionWrapper
+@args(UploadChunkArgs)
+@withDatabase
+def uploadChunk(db: Database, args: UploadChunkArgs):
+    """
+    Append the request body to an upload. The body is streamed straight to disk and never held in
+    memory. If the offset does not match the data received so far, a 409 is returned along with
+    the offset the client should resume from.
+    """
+    upload = get_upload(db, args['id'])
+    try:
+        offset = int(args['offset'])
+    except ValueError:
+        raise RequestError(f"Invalid offset {args['offset']}: Not a number")
+    try:
+        db.write_upload(upload, request.stream, offset)
+    except UploadOffsetException as e:
+        raise RequestError({'message': e.message, 'offset': e.expected}, 409)
+    except UploadException as e:
+        raise RequestError({'message': e.message, 'offset': upload.offset}, 409)
+    return success(upload_status(upload))
+
+
+class FinalizeUploadArgs(EntryUpdateParams):
+    id: int
+    sha256: NotRequired[str]
+
+
+@upload_api.route("/finalize", methods=["POST"])
+@exceptionWrapper
+@args(FinalizeUploadArgs, 'POST')
+@withDatabase
+def finalizeUpload(db: Database, args: FinalizeUploadArgs):
+    upload = get_upload(db, args['id'])
+    params: dict[str, Any] = {key: value for key, value in args.items()
+                              if key not in ('id', 'sha256')}
+    try:
+        entry = db.finalize_upload(upload, params, args.get('sha256'))  # type: ignore
+    except DatabaseException as e:
+        raise RequestError({'message': e.message})
+    return success({"entry_id": entry.id})
+
+
+class AbortUploadArgs(TypedDict):
+    id: int
+
+
+@upload_api.route("/abort", methods=["POST"])
+@exceptionWrapper
+@args(AbortUploadArgs, 'POST')
+@withDatabase
+def abortUpload(db: Database, args: AbortUploadArgs):
+    upload = get_upload(db, args['id'])
+    db.abort_upload(upload)
+    return success({"upload_id": args['id']})
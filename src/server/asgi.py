@@ -0,0 +1,397 @@
+from . import get_db_internal, request_time
+from .api.entries import GetEntryArgs, MimeIconArgs, find_preview
+from .helpers import RequestError, errors, validator
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from flask import Flask
+from functools import partial
+from pathlib import Path
+from typing import Any, Awaitable, BinaryIO, Callable, Coroutine, TypeVar
+from urllib.parse import parse_qsl, quote
+from util import encoding, metrics, mime as mime_util
+from util.validator import ValidationException
+from werkzeug.http import dump_options_header, http_date, parse_etags, quote_etag
+from werkzeug.sansio.http import is_resource_modified
+from zlib import adler32
+import asyncio
+import config
+import io
+import mimetypes
+import os
+import sys
+import time
+import traceback
+import unicodedata
+
+Scope = dict[str, Any]
+Message = dict[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+
+T = TypeVar('T')
+
+
+class AsgiApp:
+    """
+    ASGI application which serves media downloads, previews and mime icons without tying up a
+    thread for the whole response, and passes every other request through to the Flask
+    application.
+
+    Media files are read `asgi.chunkSize` bytes at a time on a pool of `asgi.fileThreads` threads,
+    and each chunk is sent before the next is read. A thread is only busy while a chunk is being
+    read, never while waiting for a slow client, so one process can stream to thousands of clients
+    at once. Database lookups for media requests, and all other requests, run on a separate pool of
+    `asgi.threads` threads, which bounds the number of database sessions in use at a time.
+    """
+
+    __app: Flask
+    __threads: ThreadPoolExecutor
+    __files: ThreadPoolExecutor
+    __routes: dict[str, tuple[str, Callable[[dict[str, str]], Coroutine[Any, Any, str]]]]
+
+    def __init__(self, app: Flask):
+        """
+        :param app: Flask application created by `create_app`.
+        """
+        options = config.configuration['asgi']
+        self.__app = app
+        self.__threads = ThreadPoolExecutor(options['threads'], thread_name_prefix="asgi")
+        self.__files = ThreadPoolExecutor(options['fileThreads'], thread_name_prefix="asgi-file")
+        # Path to (endpoint name, handler returning the path of the file to send). Endpoint names
+        # match the Flask routes so that metrics are recorded under the same names.
+        self.__routes = {
+            '/api/entries/download': ('api.entry_api.download', self.__download),
+            '/api/entries/preview': ('api.entry_api.getPreview', self.__preview),
+            '/api/entries/mimeIcon': ('api.entry_api.getMimeIcon', self.__mime_icon)
+        }
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] == 'lifespan':
+            await self.__lifespan(receive, send)
+        elif scope['type'] == 'websocket':
+            # Nothing accepts websockets, closing before accepting rejects the handshake with a 403
+            await receive()
+            await send({'type': 'websocket.close'})
+        elif scope['type'] != 'http':
+            # Unknown connection types may be ignored, as the ASGI specification allows
+            return
+        elif scope['path'] in self.__routes and scope['method'] in ('GET', 'HEAD'):
+            await self.__media(scope, send)
+        else:
+            await asyncio.get_running_loop().run_in_executor(
+                self.__threads, self.__wsgi, scope, receive, send, asyncio.get_running_loop())
+
+    async def __lifespan(self, receive: Receive, send: Send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.__threads.shutdown(wait=False, cancel_futures=True)
+                self.__files.shutdown(wait=False, cancel_futures=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    # ============ #
+    #  Media Files #
+    # ============ #
+
+    async def __media(self, scope: Scope, send: Send):
+        endpoint, handler = self.__routes[scope['path']]
+        metrics.route.set(endpoint)
+        start = time.perf_counter()
+        started = False
+
+        async def send_tracked(message: Message):
+            nonlocal started
+            started = True
+            await send(message)
+        try:
+            path = await handler(dict(parse_qsl(scope['query_string'].decode('latin-1'))))
+            await self.__send_file(scope, send_tracked, path,
+                                   endpoint == 'api.entry_api.download')
+        except RequestError as e:
+            errors.inc(route=endpoint, code=str(e.code))
+            await self.__respond(send, e.code, {"result": "error", "detail": e.detail})
+        except Exception as e:
+            traceback.print_exception(e)
+            errors.inc(route=endpoint, code='500')
+            if started:
+                # Too late to send an error, the server closes the incomplete response
+                raise
+            await self.__respond(send, 500, {
+                "result": "error",
+                "detail": f"Uncaught exception of type {type(e).__name__}"
+            })
+        finally:
+            request_time.observe(time.perf_counter() - start, route=endpoint)
+
+    async def __download(self, args: dict[str, str]) -> str:
+        storage_id, _ = await self.__entry(args)
+        return str(Path(config.configuration['dataRoot'], storage_id))
+
+    async def __preview(self, args: dict[str, str]) -> str:
+        storage_id, mime_icon = await self.__entry(args)
+        preview = await self.__offload(self.__files, find_preview, storage_id, mime_icon)
+        if not preview:
+            raise RequestError(f"No preview available for entity {args['id']}", 404)
+        return preview
+
+    async def __mime_icon(self, args: dict[str, str]) -> str:
+        self.__validate(args, MimeIconArgs)
+        icon = await self.__offload(self.__files, mime_util.find_icon_path, args['mime'])
+        if not icon:
+            raise RequestError(f"Icon {args['mime']} unknown", 404)
+        return icon
+
+    async def __entry(self, args: dict[str, str]) -> tuple[str, str | None]:
+        """Look up the storage id and mime icon of the entry requested by `args`."""
+        self.__validate(args, GetEntryArgs)
+        try:
+            id = int(args['id'])
+        except ValueError:
+            raise RequestError("Invalid ID")
+
+        def lookup():
+            db = get_db_internal(self.__app)
+            try:
+                entry = db.get_entry_by_id(id)
+                if not entry:
+                    raise RequestError(f"No such entry {id}", 404)
+                if not entry.storage_id:
+                    raise RequestError("Entry has no associated media", 404)
+                return entry.storage_id, entry.mime_icon
+            finally:
+                db.release()
+        return await self.__offload(self.__threads, lookup)
+
+    async def __send_file(self, scope: Scope, send: Send, path: str, download: bool):
+        """
+        Send a file, or the part of it requested by a `Range` header, with the same headers and
+        conditional request handling as Flask's `send_file`.
+        """
+        def open_file():
+            with metrics.file_io.time(operation='download_open'):
+                file = open(path, 'rb')
+            return file, os.fstat(file.fileno())
+        try:
+            file, stat = await self.__offload(self.__files, open_file)
+        except FileNotFoundError:
+            raise RequestError("File not found", 404)
+        try:
+            size = stat.st_size
+            # Same validators as `send_file`, so responses cached from either server stay valid
+            etag = f"{stat.st_mtime}-{size}-{adler32(path.encode()) & 0xFFFFFFFF}"
+            last_modified = http_date(stat.st_mtime)
+            headers = [(b'content-type', (mimetypes.guess_type(path)[0] or
+                                          'application/octet-stream').encode()),
+                       (b'content-disposition', _content_disposition(os.path.basename(path))),
+                       (b'etag', quote_etag(etag).encode()),
+                       (b'last-modified', last_modified.encode()),
+                       (b'cache-control', b'no-cache'),
+                       (b'accept-ranges', b'bytes')]
+            range_header = _header(scope, b'range')
+            if_range = _header(scope, b'if-range')
+            if if_range and is_resource_modified(range_header, if_range, etag=etag,
+                                                 last_modified=last_modified,
+                                                 ignore_if_range=False):
+                # The client's partial copy is out of date, so it needs the whole file
+                range_header = None
+            requested = _parse_range(range_header, size)
+            if not requested and not is_resource_modified(
+                    http_if_modified_since=_header(scope, b'if-modified-since'),
+                    http_if_none_match=_header(scope, b'if-none-match'),
+                    http_if_match=_header(scope, b'if-match'),
+                    etag=etag, last_modified=last_modified):
+                status = 412 if parse_etags(_header(scope, b'if-match')) else 304
+                await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+                await send({'type': 'http.response.body', 'body': b''})
+                return
+            if requested == 'invalid':
+                headers.append((b'content-range', f"bytes */{size}".encode()))
+                await send({'type': 'http.response.start', 'status': 416, 'headers': headers})
+                await send({'type': 'http.response.body', 'body': b''})
+                return
+            start, end = requested or (0, size)
+            if requested:
+                headers.append((b'content-range', f"bytes {start}-{end - 1}/{size}".encode()))
+            headers.append((b'content-length', str(end - start).encode()))
+            await send({'type': 'http.response.start', 'status': 206 if requested else 200,
+                        'headers': headers})
+            if scope['method'] == 'HEAD':
+                await send({'type': 'http.response.body', 'body': b''})
+                return
+            if start > 0:
+                await self.__offload(self.__files, file.seek, start)
+            remaining = end - start
+            chunk_size = config.configuration['asgi']['chunkSize']
+            while remaining > 0:
+                chunk = await self.__offload(self.__files, file.read, min(chunk_size, remaining))
+                if not chunk:
+                    # The file was truncated while it was being sent
+                    break
+                remaining -= len(chunk)
+                if download:
+                    metrics.file_io_bytes.inc(len(chunk), operation='download')
+                await send({'type': 'http.response.body', 'body': chunk,
+                            'more_body': remaining > 0})
+            if remaining > 0:
+                await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            await self.__offload(self.__files, file.close)
+
+    # ================ #
+    # Internal Helpers #
+    # ================ #
+
+    async def __offload(self, pool: ThreadPoolExecutor, function: Callable[..., T],
+                        *args: Any) -> T:
+        """Run a function on a thread pool, in the current context so metrics use this route."""
+        return await asyncio.get_running_loop().run_in_executor(
+            pool, partial(copy_context().run, function, *args))
+
+    def __validate(self, args: dict[str, str], argType: type):
+        try:
+            validator.validate(args, argType)
+        except ValidationException as e:
+            raise RequestError({
+                "message": "Invalid Request",
+                "detail": e.message
+            })
+
+    async def __respond(self, send: Send, status: int, body: object):
+        data = encoding.dumps(body)
+        await send({'type': 'http.response.start', 'status': status, 'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(data)).encode())
+        ]})
+        await send({'type': 'http.response.body', 'body': data})
+
+    def __wsgi(self, scope: Scope, receive: Receive, send: Send, loop: asyncio.AbstractEventLoop):
+        """
+        Handle a request with the Flask application. Runs on a pool thread, waiting on the event
+        loop whenever the request body is read or the response is sent.
+        """
+        def call(coroutine: Coroutine[Any, Any, T]) -> T:
+            return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+        response_start: list[Message] = []
+
+        def start_response(status: str, headers: list[tuple[str, str]], exc_info: Any = None):
+            response_start[:] = [{
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+            }]
+
+        def send_body(body: bytes, more: bool):
+            if response_start:
+                call(send(response_start.pop()))
+            call(send({'type': 'http.response.body', 'body': body, 'more_body': more}))
+
+        response = self.__app(_environ(scope, RequestBody(receive, call)), start_response)
+        try:
+            for chunk in response:
+                if chunk:
+                    send_body(chunk, True)
+            send_body(b'', False)
+        finally:
+            if hasattr(response, 'close'):
+                response.close()  # type: ignore
+
+
+class RequestBody(io.RawIOBase):
+    """Request body of an ASGI request, readable as a file from a thread outside the event loop."""
+
+    def __init__(self, receive: Receive, call: Callable[[Coroutine[Any, Any, Message]], Message]):
+        self.__receive = receive
+        self.__call = call
+        self.__buffer = b''
+        self.__more = True
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        while not self.__buffer and self.__more:
+            message = self.__call(self.__receive())  # type: ignore
+            if message['type'] == 'http.disconnect':
+                raise ConnectionResetError("Client disconnected")
+            self.__buffer = message.get('body', b'')
+            self.__more = message.get('more_body', False)
+        count = min(len(buffer), len(self.__buffer))
+        buffer[:count] = self.__buffer[:count]
+        self.__buffer = self.__buffer[count:]
+        return count
+
+
+def _environ(scope: Scope, body: BinaryIO | RequestBody) -> dict[str, Any]:
+    """Build a WSGI environment from an ASGI connection scope."""
+    server = scope.get('server') or ('localhost', 80)
+    environ: dict[str, Any] = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin-1'),
+        'PATH_INFO': scope['path'].encode().decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BufferedReader(body),  # type: ignore
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False
+    }
+    for name, value in scope['headers']:
+        key = name.decode('latin-1').upper().replace('-', '_')
+        if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = f"HTTP_{key}"
+        text = value.decode('latin-1')
+        environ[key] = f"{environ[key]},{text}" if key in environ else text
+    return environ
+
+
+def _header(scope: Scope, name: bytes) -> str | None:
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+def _content_disposition(name: str) -> bytes:
+    """Build an inline `Content-Disposition` header, encoding non-ASCII names like `send_file`."""
+    try:
+        name.encode('ascii')
+        options = {'filename': name}
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii')
+        options = {'filename': simple, 'filename*': f"UTF-8''{quote(name, safe='!#$&+^`|~')}"}
+    return dump_options_header('inline', options).encode('latin-1')
+
+
+def _parse_range(header: str | None, size: int) -> tuple[int, int] | None | str:
+    """
+    Parse a `Range` header into the start and end (exclusive) of the requested bytes. Returns None
+    to send the whole file, including for multiple ranges which aren't supported, or `invalid` if
+    the range can't be satisfied.
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    first, _, last = header[6:].strip().partition('-')
+    try:
+        if first:
+            start = int(first)
+            end = min(int(last) + 1, size) if last else size
+        else:
+            # The last `last` bytes
+            start = max(size - int(last), 0)
+            end = size
+    except ValueError:
+        return None
+    if start >= end:
+        return 'invalid'
+    return start, end
@@ -0,0 +1,36 @@
+from database.exceptions import ArchiveException
+from flask import Flask
+import click
+import server
+
+
+def register_commands(app: Flask):
+    """
+    Register command line utilities. These are invoked through the flask command line interface,
+    for example `flask --app server export-catalog catalog.zip`.
+    """
+
+    @app.cli.command("export-catalog")
+    @click.argument("path")
+    @click.option("--chunk-size", default=10000, help="Number of rows written per chunk.")
+    def export_catalog(path: str, chunk_size: int):  # type: ignore
+        """Export all tags and entries to a columnar archive."""
+        db = server.get_db_internal()
+        counts, time = db.export_catalog(path, chunk_size)
+        db.release()
+        click.echo(f"Exported {counts['entries']:,} entries and {counts['tags']:,} tags in "
+                   f"{time:0.3f}s")
+
+    @app.cli.command("import-catalog")
+    @click.argument("path")
+    def import_catalog(path: str):  # type: ignore
+        """Import tags and entries from a columnar archive into an empty database."""
+        db = server.get_db_internal()
+        try:
+            counts, time = db.import_catalog(path)
+        except ArchiveException as e:
+            raise click.ClickException(e.message)
+        finally:
+            db.release()
+        click.echo(f"Imported {counts['entries']:,} entries and {counts['tags']:,} tags in "
+                   f"{time:0.3f}s")
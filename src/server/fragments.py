@@ -0,0 +1,67 @@
+from collections import OrderedDict
+from flask import render_template
+from markupsafe import Markup
+from threading import Lock
+from typing import Any, Callable, Hashable
+from util import metrics
+import config
+import time
+
+# Cached fragment: content version, time rendered and rendered HTML
+_Fragment = tuple[int, float, Markup]
+
+
+class FragmentCache:
+    """
+    Cache of rendered template fragments, such as the page header and footer.
+
+    Fragments are rendered once and reused until the content version changes, see
+    `Database.content_version`, so they are only rendered again after entries or tags have been
+    written. The content version only tracks writes made by this process, so fragments are also
+    rendered again once they are older than `fragments.maxAge` seconds to pick up changes made by
+    other processes. At most `fragments.maxEntries` fragments are kept, the least recently used
+    being discarded first.
+    """
+
+    __lock: Lock
+    __fragments: OrderedDict[Hashable, _Fragment]
+
+    def __init__(self):
+        self.__lock = Lock()
+        self.__fragments = OrderedDict()
+
+    def render(self, template: str, version: int,
+               context: Callable[[], dict[str, Any]] | None = None, **key: Hashable) -> Markup:
+        """
+        Return a rendered fragment, rendering it if it isn't cached or is out of date.
+
+        :param template: Name of the fragment's template.
+        :param version: Current content version.
+        :param context: Returns additional template parameters. Only called when the fragment is
+            rendered, so expensive values are only computed when they are needed.
+        :param key: Template parameters, which also identify the fragment. Each distinct set of
+            parameters is cached separately.
+        """
+        cache_key = (template, *sorted(key.items()))
+        options = config.configuration['fragments']
+        with self.__lock:
+            fragment = self.__fragments.get(cache_key)
+            if fragment is not None:
+                self.__fragments.move_to_end(cache_key)
+        hit = fragment is not None and fragment[0] == version and \
+            time.monotonic() - fragment[1] < options['maxAge']
+        metrics.cache_lookup('fragments', hit)
+        if hit:
+            return fragment[2]  # type: ignore
+        rendered = Markup(render_template(template, **(context() if context else {}), **key))
+        with self.__lock:
+            self.__fragments[cache_key] = (version, time.monotonic(), rendered)
+            self.__fragments.move_to_end(cache_key)
+            while len(self.__fragments) > max(options['maxEntries'], 1):
+                self.__fragments.popitem(last=False)
+        return rendered
+
+    def clear(self):
+        """Discard every cached fragment."""
+        with self.__lock:
+            self.__fragments.clear()
@@ -0,0 +1,68 @@
+from database import Database
+from threading import Lock
+import os
+
+
+class DatabaseHandle:
+    """
+    Opens the database the first time it is used in each process.
+
+    Pre-fork servers such as gunicorn create the application in one process and then fork worker
+    processes to serve requests. SQLite connections must never be used on both sides of a `fork()`,
+    so a worker always opens the database itself, even if it was forked from a process which had
+    already opened it. Each worker then has its own engine, connection pool and in-memory indexes
+    over the same database file. The indexes are invalidated when tags are changed by another
+    worker, see `database.cachesync.CacheSync`.
+
+    Backups are scheduled by every process which serves requests, but only one of them at a time
+    makes them (see `database.backup.BackupManager`), so the number of backups doesn't depend on
+    how many workers there are or how the server was started. A parent process which only prepares
+    the database for its workers never schedules backups.
+    """
+
+    __path: str
+    __lock: Lock
+    __database: Database | None
+    __pid: int | None
+    __scheduled_pid: int | None
+
+    def __init__(self, path: str):
+        """
+        :param path: Absolute path to the database file.
+        """
+        self.__path = path
+        self.__lock = Lock()
+        self.__database = None
+        self.__pid = None
+        self.__scheduled_pid = None
+        os.register_at_fork(after_in_child=self.__after_fork)
+
+    def get(self) -> Database:
+        """Return this process's database, opening it and scheduling backups if required."""
+        if self.__scheduled_pid != os.getpid():
+            with self.__lock:
+                if self.__scheduled_pid != os.getpid():
+                    self.__open().schedule_backups()
+                    self.__scheduled_pid = os.getpid()
+        return self.__database  # type: ignore
+
+    def prepare(self):
+        """
+        Open the database and then close its connections again, for use in a parent process before
+        it forks workers. This creates any missing tables and indexes once, rather than having every
+        worker race to do so.
+        """
+        with self.__lock:
+            self.__open().dispose()
+
+    def __open(self) -> Database:
+        """Return this process's database, opening it if required. Call with the lock held."""
+        if self.__pid != os.getpid():
+            self.__database = Database(f"/{self.__path}")
+            self.__pid = os.getpid()
+        return self.__database  # type: ignore
+
+    def __after_fork(self):
+        # The lock may have been held by another thread at the time of the fork, in which case it
+        # would never be released in this process
+        self.__lock = Lock()
@@ -1,20 +1,35 @@
 from database import Database
 from flask import jsonify, request, Response, render_template
 from functools import wraps
-from markdown2 import Markdown  # type: ignore
 from typing import Type, Literal, Callable, TypeVar, cast, ParamSpec, Concatenate, Any
+from typing import TYPE_CHECKING
 from typing_extensions import TypedDict, NotRequired
-from util import formatting
+from .fragments import FragmentCache
+from .markdown import MarkdownRenderer
+from util import encoding, formatting, metrics
+from util.lazy import lazy_import
 from util.timer import Timer
 from util.validator import ValidationException, Validator
 from werkzeug.wrappers import Response as WerkzeugResponse
-import dateutil.parser
 import json
 import server
 import traceback
 
+if TYPE_CHECKING:
+    from dateutil import parser
+else:
+    parser = lazy_import('dateutil.parser')
+
 validator = Validator(raise_exception=True)
-markdowner = Markdown()
+markdowner = MarkdownRenderer()
+fragments = FragmentCache()
+
+validation_time = metrics.Histogram('library_validation_seconds',
+                                    "Time spent validating request arguments", ('route',))
+template_time = metrics.Histogram('library_template_render_seconds',
+                                  "Time spent rendering templates", ('template',))
+errors = metrics.Counter('library_errors_total', "Requests which failed with an error",
+                         ('route', 'code'))
 
 
 # ========== #
@@ -46,7 +61,8 @@ def args(argType: Type[GenericDict], method: Literal['GET', 'POST'] = 'GET'):
             elif method == 'POST':
                 data = json.loads(request.get_data(as_text=True))
             try:
-                validator.validate(data, argType)
+                with validation_time.time(route=metrics.route.get()):
+                    validator.validate(data, argType)
                 arguments = cast(argType, data)
             except ValidationException as e:
                 raise RequestError({
@@ -74,12 +90,14 @@ def exceptionWrapper(function: Callable[P, R]) -> Callable[P, R | tuple[Response
         try:
             return function(*args, **kwargs)
         except RequestError as e:
+            errors.inc(route=metrics.route.get(), code=str(e.code))
             return jsonify({
                 "result": "error",
                 "detail": e.detail,
             }), e.code
         except Exception as e:
             traceback.print_exception(e)
+            errors.inc(route=metrics.route.get(), code='500')
             return jsonify({
                 "result": "error",
                 "detail": f"Uncaught exception of type {type(e).__name__}"
@@ -112,9 +130,7 @@ TemplateFunc = Callable[P, TemplateFuncReturnType]
 
 class AdditionalTemplateFields(TypedDict):
     query_time: str
-    total_data: str
-    entry_count: str
-    db_size: str
+    fragment: Callable[..., Any]
     formatting: Any  # Module type?
     markdown: Callable[[Any], Any]
 
@@ -123,6 +139,9 @@ def templateWrapper(function: TemplateFunc[P]) -> Callable[P, GeneralResponse]:
     """
     Wrapper for `render_template` that includes some useful additional values shared between many
     pages. If the wrapped function returns a response object, it will be passed through unmodified.
+
+    Templates render the widgets shared between pages with `fragment(name, **params)`, which reuses
+    the rendered widget from `fragments` until entries or tags are next written.
     """
     def expand(input: PartialTuple | FullTuple) -> FullTuple:
         """
@@ -141,17 +160,33 @@ def templateWrapper(function: TemplateFunc[P]) -> Callable[P, GeneralResponse]:
         db = server.get_db_internal()
         params = cast(AdditionalTemplateFields, params)  # Strip away any special typing information
         params['query_time'] = timer.time_formatted()
-        params['total_data'] = formatting.file_size(db.total_size())
-        params['entry_count'] = f"{db.entry_count():,}"
-        params['db_size'] = formatting.file_size(db.database_size())
+        params['fragment'] = lambda template, **key: fragments.render(
+            template, db.content_version(), fragment_context.get(template), **key)
         params['formatting'] = formatting
         params['markdown'] = markdowner.convert
-        resp = Response(render_template(template_name, **params))
+        with template_time.time(template=template_name):
+            resp = Response(render_template(template_name, **params))
         resp.status_code = status
         return resp
     return wrapper
 
 
+def statistics() -> dict[str, Any]:
+    """Template parameters for the library statistics shown in the page footer."""
+    db = server.get_db_internal()
+    return {
+        'total_data': formatting.file_size(db.total_size()),
+        'entry_count': f"{db.entry_count():,}",
+        'db_size': formatting.file_size(db.database_size())
+    }
+
+
+# Functions providing the parameters of fragments which need more than their key
+fragment_context: dict[str, Callable[[], dict[str, Any]]] = {
+    'widgets/statistics.html': statistics
+}
+
+
 # ===== #
 # Types #
 # ===== #
@@ -207,6 +242,20 @@ def success(data: object) -> tuple[Response, int]:
     }), 200
 
 
+def fast_success(data: object) -> tuple[Response, int]:
+    """
+    Variant of `success` which encodes the response with the fast encoder in `util.encoding`. The
+    data must only contain JSON native types (no datetime objects).
+
+    :param data: Any JSON native object.
+    :returns: A tuple containing a JSON response object and a 200 status code.
+    """
+    return Response(encoding.dumps({
+        "result": "success",
+        "detail": data
+    }), mimetype='application/json'), 200
+
+
 def parse_date(date: str | None, key: str):
     """
     Attempt to parse a date. If the given input is `None` or an empty screen, this function will
@@ -219,8 +268,8 @@ def parse_date(date: str | None, key: str):
     if date == "" or date is None:
         return None
     try:
-        return dateutil.parser.parse(date)
-    except dateutil.parser.ParserError as e:
+        return parser.parse(date)
+    except parser.ParserError as e:
         raise RequestError({
             "message": f"Invalid date for key '{key}': {str(e)}"
         })
@@ -0,0 +1,59 @@
+from collections import OrderedDict
+from hashlib import blake2b
+from threading import Lock, local
+from typing import TYPE_CHECKING
+from util import metrics
+from util.lazy import lazy_import
+import config
+
+if TYPE_CHECKING:
+    import markdown2  # type: ignore
+else:
+    markdown2 = lazy_import('markdown2')
+
+
+class MarkdownRenderer:
+    """
+    Converts markdown to HTML, keeping recently rendered documents in a least recently used cache.
+
+    Documents are identified by a hash of their text, so the same text is only converted once no
+    matter which entry it belongs to, and edited text is simply a different document. The cache is
+    limited to `markdown.cacheSize` characters of rendered HTML, and documents larger than the limit
+    are never cached. `Markdown` objects keep state while converting, so each thread has its own.
+    """
+
+    __lock: Lock
+    __cache: OrderedDict[bytes, str]
+    __size: int
+
+    def __init__(self):
+        self.__lock = Lock()
+        self.__cache = OrderedDict()
+        self.__size = 0
+        self.__local = local()
+
+    def convert(self, text: str | None) -> str:
+        """Convert markdown text to HTML."""
+        if not text:
+            return ""
+        key = blake2b(text.encode(), digest_size=16).digest()
+        with self.__lock:
+            html = self.__cache.get(key)
+            if html is not None:
+                self.__cache.move_to_end(key)
+        metrics.cache_lookup('markdown', html is not None)
+        if html is not None:
+            return html
+        if not hasattr(self.__local, 'markdown'):
+            self.__local.markdown = markdown2.Markdown()
+        html = str(self.__local.markdown.convert(text))
+        limit = config.configuration['markdown']['cacheSize']
+        if len(html) <= limit:
+            with self.__lock:
+                if key not in self.__cache:
+                    self.__cache[key] = html
+                    self.__size += len(html)
+                while self.__size > limit:
+                    _, evicted = self.__cache.popitem(last=False)
+                    self.__size -= len(evicted)
+        return html
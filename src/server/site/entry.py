@@ -8,10 +8,15 @@ from typing_extensions import TypedDict, NotRequired
 from util import mime
 from flask import request, redirect
 from util.validator import ValidationException, Validator
-from dateutil.parser import parser
-from typing import Callable, Any
+from typing import TYPE_CHECKING, Callable, Any
+from util.lazy import lazy_import
 import re
 
+if TYPE_CHECKING:
+    from dateutil import parser
+else:
+    parser = lazy_import('dateutil.parser')
+
 
 class EntryArgs(TypedDict):
     id: str
@@ -161,7 +166,7 @@ def parse_date_str(raw: str):
     Attempt to parse a complete date/time string into a unix timestamp
     """
     try:
-        p = parser()
+        p = parser.parser()
         return p.parse(raw)
     except Exception as e:
         raise DateParseException(e)
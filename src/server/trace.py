@@ -0,0 +1,85 @@
+from io import BytesIO
+from threading import Lock
+from typing import Any, Callable, Iterable
+from urllib.parse import parse_qsl
+from werkzeug.wsgi import ClosingIterator
+import config
+import json
+import time
+import traceback
+
+WSGIApplication = Callable[[dict[str, Any], Callable[..., Any]], Iterable[bytes]]
+
+
+class TraceRecorder:
+    """
+    WSGI middleware which appends every request to a trace file, one JSON object per line, so that
+    real traffic can be replayed later with `python -m bench replay`.
+
+    Each line holds the time the request started (unix time), the method, path, query arguments and
+    JSON body, the response status and how long the application took to respond. Bodies are only
+    kept for JSON requests no larger than `trace.maxBody` bytes, so uploads are recorded without
+    their contents. Paths starting with one of the `trace.exclude` prefixes are not recorded.
+    """
+
+    __app: WSGIApplication
+    __lock: Lock
+
+    def __init__(self, app: WSGIApplication, path: str):
+        """
+        :param app: WSGI application to record.
+        :param path: File to append the trace to.
+        """
+        self.__app = app
+        self.__lock = Lock()
+        self.__file = open(path, 'a', buffering=1)
+
+    def __call__(self, environ: dict[str, Any], start_response: Callable[..., Any]):
+        path: str = environ.get('PATH_INFO', '')
+        if any(path.startswith(x) for x in config.configuration['trace']['exclude']):
+            return self.__app(environ, start_response)
+        record: dict[str, Any] = {
+            "time": time.time(),
+            "method": environ.get('REQUEST_METHOD', 'GET'),
+            "path": path,
+            "args": dict(parse_qsl(environ.get('QUERY_STRING', ''), keep_blank_values=True))
+        }
+        body = self.__read_body(environ)
+        if body is not None:
+            record["body"] = body
+        start = time.perf_counter()
+
+        def capture(status: str, headers: list[tuple[str, str]], exc_info: Any = None):
+            record["status"] = int(status.split(' ', 1)[0])
+            return start_response(status, headers, exc_info)
+
+        def finish():
+            record["duration"] = time.perf_counter() - start
+            self.__write(record)
+        return ClosingIterator(self.__app(environ, capture), finish)
+
+    # ================ #
+    # Internal Helpers #
+    # ================ #
+
+    def __read_body(self, environ: dict[str, Any]) -> str | None:
+        """Read a JSON request body, replacing the input stream so the application can read it."""
+        if not environ.get('CONTENT_TYPE', '').startswith('application/json'):
+            return None
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return None
+        if length <= 0 or length > config.configuration['trace']['maxBody']:
+            return None
+        body = environ['wsgi.input'].read(length)
+        environ['wsgi.input'] = BytesIO(body)
+        return body.decode(errors='replace')
+
+    def __write(self, record: dict[str, Any]):
+        try:
+            line = json.dumps(record)
+            with self.__lock:
+                self.__file.write(line + '\n')
+        except Exception as e:
+            traceback.print_exception(e)
@@ -0,0 +1,18 @@
+from typing import Any
+import json
+
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None
+
+
+def dumps(data: Any) -> bytes:
+    """
+    Encode an object as UTF-8 JSON. `orjson` is used when it is installed, otherwise this falls back
+    to the standard library encoder. Only JSON native types (dict, list, str, int, float, bool and
+    None) should be passed to this function as the two encoders disagree on everything else.
+    """
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':')).encode()
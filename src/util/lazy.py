@@ -0,0 +1,52 @@
+from importlib import import_module
+from importlib.util import find_spec
+from threading import Lock
+from types import ModuleType
+from typing import Any
+import sys
+
+
+class LazyModule(ModuleType):
+    """
+    Stand-in for a module which is imported the first time one of its attributes is used.
+
+    Once the module has been imported its attributes are copied onto the stand-in, so later lookups
+    are as fast as they would be on the module itself.
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__lock = Lock()
+
+    def __getattr__(self, attribute: str) -> Any:
+        # Only called for attributes which haven't been copied from the module yet
+        with self.__lock:
+            module = import_module(self.__name__)
+            self.__dict__.update((k, v) for k, v in module.__dict__.items() if k != '__name__')
+        return getattr(module, attribute)
+
+
+def lazy_import(name: str) -> Any:
+    """
+    Return a module which is only imported once it is first used.
+
+    For modules which are slow to import and aren't needed by everything that imports the module
+    using them, so they don't slow down startup. Modules only used in type annotations should be
+    imported under `TYPE_CHECKING` instead.
+
+    :param name: Absolute name of the module, such as `xdg.IconTheme`.
+    """
+    return sys.modules.get(name) or LazyModule(name)
+
+
+def lazy_import_optional(name: str) -> Any:
+    """
+    Like `lazy_import`, but returns None if the module is not installed.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    try:
+        return LazyModule(name) if find_spec(name) is not None else None
+    except ModuleNotFoundError:
+        # The parent package is not installed
+        return None
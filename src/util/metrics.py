@@ -0,0 +1,152 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from typing import Iterator
+import time
+
+# Endpoint of the request being handled by the current thread, used to label metrics recorded deep
+# inside the database layer. Set by the server for each request.
+route: ContextVar[str] = ContextVar('route', default='none')
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+
+
+def _escape(value: str):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = ''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value: float):
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+class _Metric:
+    """
+    Base class for metrics exposed in the Prometheus text format.
+
+    Metrics are created once at import time by the modules which use them and are registered in a
+    global registry, which `render` converts to text for the admin `/metrics` endpoint. Recording a
+    value takes a lock and a few dictionary operations, so instrumentation is cheap enough to leave
+    on.
+    """
+
+    type_name: str
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self._lock = Lock()
+        _registry.append(self)
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels.get(x, '')) for x in self.label_names)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type_name}"]
+
+
+class Counter(_Metric):
+    """A value which only increases, such as a number of requests."""
+
+    type_name = 'counter'
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self.__values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self.__values[key] = self.__values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = list(self.__values.items())
+        return super().render() + [f"{self.name}{_labels(self.label_names, key)} {_number(value)}"
+                                   for key, value in values]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values, such as request durations in seconds."""
+
+    type_name = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.__buckets = tuple(sorted(buckets))
+        # Per label set: bucket counts (the last being +Inf), sum and count
+        self.__values: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        index = bisect_left(self.__buckets, value)
+        with self._lock:
+            entry = self.__values.get(key)
+            if entry is None:
+                entry = self.__values[key] = ([0] * (len(self.__buckets) + 1), [0.0, 0])
+            entry[0][index] += 1
+            entry[1][0] += value
+            entry[1][1] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe the time taken by a block of code."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        with self._lock:
+            values = [(key, list(counts), list(totals)) for key, (counts, totals) in
+                      self.__values.items()]
+        lines = super().render()
+        for key, counts, (total, count) in values:
+            cumulative = 0
+            for bound, bucket in zip((*self.__buckets, float('inf')), counts):
+                cumulative += bucket
+                le = '+Inf' if bound == float('inf') else _number(bound)
+                labels = _labels(self.label_names, key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {_number(count)}")
+        return lines
+
+
+_registry: list[_Metric] = []
+
+
+def render() -> str:
+    """Render every registered metric in the Prometheus text format."""
+    lines: list[str] = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# ============== #
+# Shared Metrics #
+# ============== #
+
+cache_requests = Counter('library_cache_requests_total', "Lookups in in-memory caches",
+                         ('cache', 'result'))
+file_io = Histogram('library_file_io_seconds', "Time spent reading and writing media files",
+                    ('operation',))
+file_io_bytes = Counter('library_file_io_bytes_total', "Bytes of media read or written",
+                        ('operation',))
+
+
+def cache_lookup(cache: str, hit: bool):
+    """Record a lookup in a named cache."""
+    cache_requests.inc(cache=cache, result='hit' if hit else 'miss')
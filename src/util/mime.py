@@ -1,9 +1,15 @@
+from functools import cache
 from threading import Lock
-from typing import cast
-from xdg import IconTheme  # type: ignore
+from typing import TYPE_CHECKING, cast
+from util.lazy import lazy_import
 import config
 import re
 
+if TYPE_CHECKING:
+    from xdg import IconTheme  # type: ignore
+else:
+    IconTheme = lazy_import('xdg.IconTheme')
+
 
 def __read_icon_file(path: str) -> dict[str, str]:
     """
@@ -13,15 +19,21 @@ def __read_icon_file(path: str) -> dict[str, str]:
         return {entry[0]: entry[1].strip() for entry in [line.split(":", 1) for line in file]}
 
 
-__icons = __read_icon_file('/usr/share/mime/icons')
-__icons_generic = __read_icon_file('/usr/share/mime/generic-icons')
+@cache
+def __icon_files() -> tuple[dict[str, str], dict[str, str]]:
+    """
+    Specific and generic icon mappings, read the first time an icon is looked up
+    """
+    return __read_icon_file('/usr/share/mime/icons'), \
+        __read_icon_file('/usr/share/mime/generic-icons')
 
 
 def find_icon_name(mime_type: str) -> str:
     """
     Attempt to find the icon name in the icon mapping file.
     """
-    icon_name = __icons.get(mime_type) or __icons_generic.get(mime_type)
+    icons, icons_generic = __icon_files()
+    icon_name = icons.get(mime_type) or icons_generic.get(mime_type)
     if not icon_name:
         # Attempt to use a generic identifier
         icon_name = mime_type.split("/")[0] + "-x-generic"
@@ -46,15 +58,16 @@ def find_icon_path(icon_name: str):
         __icon_lookup_lock.release()
 
 
-__browser_patterns: list[re.Pattern[str]] = \
-    [re.compile(x) for x in config.configuration["site"]["nativeMimeTypes"]]
+@cache
+def __browser_patterns() -> list[re.Pattern[str]]:
+    return [re.compile(x) for x in config.configuration["site"]["nativeMimeTypes"]]
 
 
 def is_browser_compatible(mime_type: str) -> bool:
     """
     Determine if the given mime type is able to be displayed directly in the browser.
     """
-    for pattern in __browser_patterns:
+    for pattern in __browser_patterns():
         if pattern.match(mime_type):
             return True
     return False
@@ -0,0 +1,35 @@
+from threading import Lock
+import time
+
+
+class RateLimiter:
+    """
+    Thread safe rate limiter. Callers request an amount of some resource (such as bytes read from
+    disk) and are delayed long enough that the combined throughput of all callers does not exceed
+    the configured rate.
+    """
+
+    __rate: float
+    __available: float
+    __lock: Lock
+
+    def __init__(self, rate: float):
+        """
+        :param rate: Maximum number of units per second. A rate of zero or less disables limiting.
+        """
+        self.__rate = rate
+        self.__available = time.monotonic()
+        self.__lock = Lock()
+
+    def acquire(self, amount: float):
+        """
+        Block until `amount` units may be consumed without exceeding the rate limit.
+        """
+        if self.__rate <= 0:
+            return
+        with self.__lock:
+            now = time.monotonic()
+            start = max(now, self.__available)
+            self.__available = start + amount / self.__rate
+        if start > now:
+            time.sleep(start - now)
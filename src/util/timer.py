@@ -2,14 +2,14 @@ import time
 
 
 class Timer:
-    """Simple timer utility."""
+    """Simple timer utility. Uses a monotonic clock so it is unaffected by system clock changes."""
 
     __start: float
     __lap: float
 
     def __init__(self):
-        self.__start = time.time()
-        self.__lap = time.time()
+        self.__start = time.perf_counter()
+        self.__lap = time.perf_counter()
 
     def time_formatted(self, lap: bool = False):
         """
@@ -31,8 +31,8 @@ class Timer:
 
     def lap(self):
         """Reset the lap timer."""
-        self.__lap = time.time()
+        self.__lap = time.perf_counter()
 
     def get_time(self, lap: bool = False):
         """Return the value of the timer."""
-        return time.time() - (self.__lap if lap else self.__start)
+        return time.perf_counter() - (self.__lap if lap else self.__start)
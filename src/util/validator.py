@@ -1,6 +1,7 @@
 from .plural import plural
+from functools import cache
 from types import UnionType
-from typing import Any, cast, get_args
+from typing import Any, Callable, Union, cast, get_args, get_origin
 from typing_extensions import TypedDict
 
 
@@ -16,24 +17,49 @@ class ValidationException(Exception):
         self.args = (self.message, path, detail, misc)
 
 
+class _Failure:
+    """
+    Description of a validation failure. Checkers return one of these instead of raising so that
+    failing union branches are cheap, and so that the path to the failure only has to be built once
+    something has actually failed: each enclosing checker appends its own path component on the way
+    back up, so `path` is stored in reverse.
+    """
+    __slots__ = ('path', 'detail', 'misc', 'fatal')
+
+    def __init__(self, detail: str, misc: 'list[_Failure] | None' = None, fatal: bool = False):
+        self.path: list[str] = []
+        self.detail = detail
+        self.misc = misc
+        self.fatal = fatal
+
+    def at(self, component: str):
+        self.path.append(component)
+        return self
+
+    def exception(self, prefix: list[str] = []) -> ValidationException:
+        path = prefix + self.path[::-1]
+        misc = [x.exception(path) for x in self.misc] if self.misc is not None else None
+        return ValidationException(path, self.detail, misc)
+
+
+# A compiled checker returns `None` if the object is valid
+Checker = Callable[[Any], _Failure | None]
+
+
 class Validator:
 
     def __init__(self, raise_exception: bool = False):
         self.__raise_exception = raise_exception
 
-    def __error(self, path: list[str], detail: str, misc: Any = None):
-        """
-        Validation failure wrapper.
-        """
-        if self.__raise_exception:
-            raise ValidationException(path, detail, misc)
-        return False
-
-    def validate(self, obj: object, t: type, __path: list[str] = []) -> bool:
+    def validate(self, obj: object, t: type) -> bool:
         """
         Validate the object. This function operates similar to python's default `isinstance`
         function but with recursive validation suitable for runtime schema checking.
 
+        Each type is compiled into a tree of checking functions the first time it is seen, and the
+        compiled checker is reused for every later call, so validating against a type costs little
+        more than the `isinstance` checks it performs.
+
         If this validator was constructed with `raise_exception = True`, a failure in validation
         will raise an exception containing details about where and why validation failed. Otherwise,
         the function will simply return `False`.
@@ -42,122 +68,167 @@ class Validator:
 
         :param object: The object to validate.
         :param t: The type to check against.
-        :param __path: Validation path used for internal error reporting.
         :returns: True/False, unless `raise_exception` is set.
         """
-        # Unions require special handling because they can fail on one branch but still succeed
-        if isinstance(t, UnionType):
-            return self.__validate_Union(obj, t, __path)
-
-        # Gather initial information about type and object
-        type_is_typed_dict = hasattr(t, '__required_keys__')
-        type_is_generic_type = hasattr(t, '__args__')
-        type_name = t.__name__
-        object_is_tuple_like = isinstance(obj, tuple) or isinstance(obj, list)
-        object_name = type(cast(object, obj)).__name__  # Not sure why cast is required here
-
-        # Basic (non subscripted) types can be compared directly
-        if not (type_is_typed_dict or type_is_generic_type):
-            if not isinstance(obj, t):
-                return self.__error(__path,
-                                    f"Incorrect type: Expected {type_name} got {object_name}")
+        failure = _compile(t)(obj)
+        if failure is None:
             return True
+        if self.__raise_exception or failure.fatal:
+            raise failure.exception()
+        return False
 
-        # Special type handlers
-        if type_is_typed_dict:
-            return self.__validate_TypedDict(obj, cast(type[TypedDict], t), __path)
-        type_origin: type = getattr(t, '__origin__')
-        if type_origin == tuple and object_is_tuple_like:
-            return self.__validate_Tuple(obj, t, __path)
 
-        # Base type validation
-        if not isinstance(obj, type_origin):
-            return self.__error(__path,
-                                f"Incorrect base type: Expected {type_name} got {object_name}")
+# ========== #
+#  Compiler  #
+# ========== #
 
-        # Standard type handlers
-        if type_origin == list:
-            return self.__validate_List(obj, t, __path)
-        if type_origin == dict:
-            return self.__validate_Dict(obj, t, __path)
+@cache
+def _compile(t: Any) -> Checker:
+    """Build a checker for a type."""
+    # Unions require special handling because they can fail on one branch but still succeed
+    if isinstance(t, UnionType) or get_origin(t) is Union:
+        return _compile_Union(t)
 
-        # Unrecognized generic class
-        raise ValidationException(__path, f"Unsupported type {type_name}")
+    type_name = t.__name__
 
-    # ======================= #
-    #  Special type handlers  #
-    # ======================= #
+    # Special type handlers
+    if hasattr(t, '__required_keys__'):
+        return _compile_TypedDict(cast(type[TypedDict], t))
 
-    def __validate_TypedDict(self, obj: Any, t: type[TypedDict], __path: list[str]):
-        """
-        Special validation handler for `TypedDict` objects.
-        """
+    # Basic (non subscripted) types can be compared directly
+    if not hasattr(t, '__args__'):
+        def check_basic(obj: Any):
+            if not isinstance(obj, t):
+                return _Failure(f"Incorrect type: Expected {type_name} got {type(obj).__name__}")
+            return None
+        return check_basic
+
+    type_origin: type = getattr(t, '__origin__')
+    if type_origin == list:
+        inner = _compile_List(t)
+    elif type_origin == dict:
+        inner = _compile_Dict(t)
+    elif type_origin == tuple:
+        inner = _compile_Tuple(t)
+    else:
+        def inner(obj: Any):
+            # Unrecognized generic class
+            return _Failure(f"Unsupported type {type_name}", fatal=True)
+
+    def check_generic(obj: Any):
+        # Lists are accepted as tuples, see `_compile_Tuple`
+        if type_origin == tuple and isinstance(obj, list):
+            return inner(obj)
+        if not isinstance(obj, type_origin):
+            return _Failure(f"Incorrect base type: Expected {type_name} got "
+                            f"{type(obj).__name__}")
+        return inner(obj)
+    return check_generic
+
+
+# ======================= #
+#  Special type handlers  #
+# ======================= #
+
+def _compile_TypedDict(t: type[TypedDict]) -> Checker:
+    """
+    Special validation handler for `TypedDict` objects.
+    """
+    raw_types = t.__annotations__
+    required = tuple((key, _compile(raw_types[key])) for key in getattr(t, '__required_keys__'))
+    optional = tuple((key, _compile(get_args(raw_types[key])[0]))
+                     for key in getattr(t, '__optional_keys__'))
+
+    def check(obj: Any):
         # Make sure that required keys are present
-        required_keys: list[str] = getattr(t, '__required_keys__')
-        optional_keys: list[str] = getattr(t, '__optional_keys__')
-        missing_required = [key for key in required_keys if key not in obj]
-        if len(missing_required) > 0:
-            return self.__error(__path, f"Missing required key{plural(missing_required)}: "
-                                        f"{missing_required}")
+        for key, _ in required:
+            if key not in obj:
+                missing_required = [key for key, _ in required if key not in obj]
+                return _Failure(f"Missing required key{plural(missing_required)}: "
+                                f"{missing_required}")
         # Validate required and optional key types
-        raw_types = t.__annotations__
-        types: dict[str, type] = {key: raw_types[key] for key in required_keys} | \
-            {key: get_args(raw_types[key])[0] for key in optional_keys if key in obj}
-        return all([self.validate(obj[key], types[key], __path + [key]) for key in types])
-
-    def __validate_Tuple(self, obj: Any, t: type, __path: list[str]):
-        """
-        Special validation handler for tuples. This function exists because many input formats (such
-        as JSON) do not differentiate between tuples and lists, so it treats the two types as
-        identical.
-        """
-        type_generic_args = cast(list[type], get_args(t))
-        obj_cast = cast(list[Any], obj)
-        arg_diff = len(type_generic_args) - len(obj_cast)
+        for key, checker in required:
+            failure = checker(obj[key])
+            if failure is not None:
+                return failure.at(key)
+        for key, checker in optional:
+            if key in obj:
+                failure = checker(obj[key])
+                if failure is not None:
+                    return failure.at(key)
+        return None
+    return check
+
+
+def _compile_Tuple(t: type) -> Checker:
+    """
+    Special validation handler for tuples. Many input formats (such as JSON) do not differentiate
+    between tuples and lists, so the two types are treated as identical.
+    """
+    checkers = tuple(_compile(x) for x in get_args(t))
+
+    def check(obj: Any):
+        arg_diff = len(checkers) - len(obj)
         if arg_diff != 0:
             err = 'many' if arg_diff < 0 else 'few'
-            return self.__error(__path, f"Too {err} items: Expected {len(type_generic_args)} "
-                                        f"got {len(obj_cast)}")
-        enumerator = enumerate(type_generic_args)
-        return all([self.validate(obj_cast[i], t, __path + [str(i)]) for i, t in enumerator])
-
-    def __validate_Union(self, obj: Any, t: type, __path: list[str]):
-        """
-        Special validation handler for unions. This function exists because a union can have one or
-        more acceptable branches fail, but overall the check must pass as long as at least one of
-        them is valid.
-        """
-        print("union", get_args(t))
-        exceptions: list[ValidationException] = []
-        for u_type in get_args(t):
-            try:
-                name = f"[U:{u_type.__name__}]"
-                if self.validate(obj, u_type, __path + [name]):
-                    return True
-            except ValidationException as e:
-                exceptions.append(e)
-        type_strings = [str(type.__name__) for type in get_args(t)]
-        got_type = str(type(object).__name__)
-        detail = f"Type {got_type} not valid for any of {type_strings}"
-        return self.__error(__path, f"Union validation failure: {detail}", exceptions)
-
-    # ======================== #
-    #  Standard type handlers  #
-    # ======================== #
-
-    def __validate_List(self, obj: Any, t: type, __path: list[str]):
-        """Validation handler for lists"""
-        obj_cast = cast(list[Any], obj)
-        required_type: type = cast(list[type], get_args(t))[0]
-        enumerator = enumerate(obj_cast)
-        return all([self.validate(x, required_type, __path + [str(i)]) for i, x in enumerator])
-
-    def __validate_Dict(self, obj: Any, t: type, __path: list[str]):
-        """Validation handler for dictionaries"""
-        obj_cast = cast(dict[Any, Any], obj)
-        key_type, value_type = cast(tuple[type, type], get_args(t))
-
-        def test(key: Any, value: Any):
-            return self.validate(key, key_type, __path + [key]) and \
-                self.validate(value, value_type, __path + [key])
-        return all([test(key, obj_cast[key]) for key in obj_cast])
+            return _Failure(f"Too {err} items: Expected {len(checkers)} got {len(obj)}")
+        for i, checker in enumerate(checkers):
+            failure = checker(obj[i])
+            if failure is not None:
+                return failure.at(str(i))
+        return None
+    return check
+
+
+def _compile_Union(t: type) -> Checker:
+    """
+    Special validation handler for unions. A union can have one or more acceptable branches fail,
+    but overall the check must pass as long as at least one of them is valid.
+    """
+    branches = tuple((f"[U:{x.__name__}]", _compile(x)) for x in get_args(t))
+    type_strings = [str(x.__name__) for x in get_args(t)]
+
+    def check(obj: Any):
+        failures: list[_Failure] = []
+        for name, checker in branches:
+            failure = checker(obj)
+            if failure is None:
+                return None
+            failures.append(failure.at(name))
+        detail = f"Type {type(obj).__name__} not valid for any of {type_strings}"
+        return _Failure(f"Union validation failure: {detail}", failures)
+    return check
+
+
+# ======================== #
+#  Standard type handlers  #
+# ======================== #
+
+def _compile_List(t: type) -> Checker:
+    """Validation handler for lists"""
+    item_checker = _compile(get_args(t)[0])
+
+    def check(obj: Any):
+        for i, x in enumerate(obj):
+            failure = item_checker(x)
+            if failure is not None:
+                return failure.at(str(i))
+        return None
+    return check
+
+
+def _compile_Dict(t: type) -> Checker:
+    """Validation handler for dictionaries"""
+    key_type, value_type = get_args(t)
+    key_checker = _compile(key_type)
+    value_checker = _compile(value_type)
+
+    def check(obj: Any):
+        for key in obj:
+            failure = key_checker(key)
+            if failure is None:
+                failure = value_checker(obj[key])
+            if failure is not None:
+                return failure.at(str(key))
+        return None
+    return check
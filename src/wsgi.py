@@ -0,0 +1,14 @@
+"""
+WSGI entry point for running the library with a production server. Run from the `src` directory,
+for example with four gunicorn workers:
+
+    gunicorn --preload --workers 4 wsgi:app
+
+With `--preload` the application is created once in the parent process, which also creates any
+missing tables before the workers are forked. Without it every worker runs this module itself.
+Either way only one worker at a time makes scheduled backups, see `server.handle.DatabaseHandle`.
+"""
+from server import DATABASE_KEY, create_app
+
+app = create_app()
+app.extensions[DATABASE_KEY].prepare()